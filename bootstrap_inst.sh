@@ -6,6 +6,15 @@ if ! command -v apt-get &>/dev/null; then
     exit 1
 fi
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# Offline installs cannot fetch curl or uv; the bundle carries uv if needed.
+for arg in "$@"; do
+    if [ "$arg" = --bundle-in ]; then
+        exec python3 "$SCRIPT_DIR/install.py" "$@"
+    fi
+done
+
 if ! command -v curl &>/dev/null; then
     echo "Installing curl..."
     if [ "$(id -u)" -eq 0 ]; then
@@ -21,5 +30,17 @@ if ! command -v uv &>/dev/null; then
     export PATH="$HOME/.local/bin:$PATH"
 fi
 
-SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-exec uv run "$SCRIPT_DIR/install.py"
+# Non-interactive runs (cloud-init, CI) need no third-party packages: skip
+# uv's environment sync and run the script on a stdlib Python 3.12.
+for arg in "$@"; do
+    case "$arg" in
+        --all|--only|--skip|--resume|--plan|--plan=*|-l|--list)
+            if python3 -c 'import sys; sys.exit(sys.version_info[:2] != (3, 12))' 2>/dev/null; then
+                exec python3 "$SCRIPT_DIR/install.py" "$@"
+            fi
+            exec uv run --no-project --python 3.12 python "$SCRIPT_DIR/install.py" "$@"
+            ;;
+    esac
+done
+
+exec uv run "$SCRIPT_DIR/install.py" "$@"
@@ -9,14 +9,31 @@
 
 import argparse
 import platform
+import queue
 import atexit
 import subprocess
 import sys
 import os
 import re
 import shutil
+import stat
 import getpass
+import http.client
+import itertools
 import difflib
+import filecmp
+import hashlib
+import heapq
+import json
+import shlex
+import tarfile
+import tempfile
+import threading
+import time
+import tomllib
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from pathlib import Path
 from contextlib import contextmanager
@@ -38,6 +55,15 @@ class InstallItem:
     installer: Callable
     parent: str | None = None  # group name or item id; None = top-level
     requires: list[str] = field(default_factory=list)
+    bin: str | None = None  # command whose presence means the item is installed
+    apt: list[str] = field(default_factory=list)  # apt packages, installed in one batch
+    github: str | None = None  # "owner/repo" whose latest release provides the item
+    crate: str | None = None  # crates.io crate installed via the shared cargo binstall
+    uv: str | None = None  # Python package installed with `uv tool install`
+    backend: str = ""  # install method shown by --plan; derived from the fields above if empty
+    asset: str | None = None  # regex selecting the release asset to download
+    inputs: list[str] = field(default_factory=list)  # files fingerprinted by the manifest ("~/..." or repo-relative)
+    privileged: bool = False  # installer runs sudo commands beyond its apt packages
 
 
 def _groups() -> list[Group]:
@@ -53,27 +79,33 @@ def _groups() -> list[Group]:
 def _items() -> list[InstallItem]:
     return [
         # System
-        InstallItem("htop",                install_htop,                parent="Resource"),
-        InstallItem("btop",                install_btop,                parent="Resource"),
-        InstallItem("unattended-upgrades", install_unattended_upgrades, parent="System"),
-        InstallItem("all-upgrades",        install_all_upgrades,        parent="unattended-upgrades", requires=["unattended-upgrades"]),
-        InstallItem("incus",               install_incus_and_init,      parent="System"),
-        InstallItem("tok",                 install_tok,                 parent="System"),
-        InstallItem("zellij",              install_zellij,              parent="System",  requires=["cargo-binstall"]),
+        InstallItem("htop",                install_htop,                parent="Resource", bin="htop",   apt=["htop"]),
+        InstallItem("btop",                install_btop,                parent="Resource", bin="btop",   apt=["btop"]),
+        InstallItem("unattended-upgrades", install_unattended_upgrades, parent="System",   bin="unattended-upgrades", apt=["unattended-upgrades"]),
+        InstallItem("all-upgrades",        install_all_upgrades,        parent="unattended-upgrades", requires=["unattended-upgrades"],
+                    inputs=[ALL_UPGRADES_OVERRIDE], privileged=True),
+        InstallItem("incus",               install_incus_and_init,      parent="System",   bin="incus",  apt=["incus"], privileged=True),
+        InstallItem("tok",                 install_tok,                 parent="System",   inputs=link_inputs("tok")),
+        InstallItem("zellij",              install_zellij,              parent="System",   bin="zellij", requires=["cargo-binstall"], crate="zellij"),
         # Rust
-        InstallItem("rust",                install_rust,                parent="Rust"),
-        InstallItem("rust-analyzer",       install_rust_analyzer,       parent="rust",    requires=["rust"]),
-        InstallItem("cargo-binstall",      install_cargo_binstall,      parent="rust",    requires=["rust"]),
+        InstallItem("rust",                install_rust,                parent="Rust",     bin="rustc",  apt=["build-essential"], backend="rustup"),
+        InstallItem("rust-analyzer",       install_rust_analyzer,       parent="rust",     bin="rust-analyzer",  requires=["rust"], backend="rustup"),
+        InstallItem("cargo-binstall",      install_cargo_binstall,      parent="rust",     bin="cargo-binstall", requires=["rust"], backend="script"),
         # Git
-        InstallItem("delta",               install_delta,               parent="Git",     requires=["cargo-binstall"]),
-        InstallItem("difft",               install_difft,               parent="Git",     requires=["cargo-binstall"]),
+        InstallItem("delta",               install_delta,               parent="Git",      bin="delta",  requires=["cargo-binstall"], crate="git-delta",
+                    inputs=["~/.gitconfig"]),
+        InstallItem("difft",               install_difft,               parent="Git",      bin="difft",  requires=["cargo-binstall"], crate="difftastic",
+                    inputs=["~/.gitconfig"]),
         # Helix
-        InstallItem("helix",               install_helix,               parent="Helix"),
-        InstallItem("biome",               install_biome,               parent="helix"),
-        InstallItem("harper-ls",           install_harper_ls,           parent="helix",   requires=["cargo-binstall"]),
-        InstallItem("markdown-oxide",      install_markdown_oxide,      parent="helix",   requires=["cargo-binstall"]),
-        InstallItem("pyright",             install_pyright,             parent="helix"),
-        InstallItem("ruff",                install_ruff,                parent="helix"),
+        InstallItem("helix",               install_helix,               parent="Helix",    bin="hx",     github="helix-editor/helix", asset=HELIX_ASSET,
+                    inputs=link_inputs("helix"), privileged=True),
+        InstallItem("biome",               install_biome,               parent="helix",    bin="biome",  github="biomejs/biome", asset=BIOME_ASSET),
+        InstallItem("harper-ls",           install_harper_ls,           parent="helix",    bin="harper-ls",      requires=["cargo-binstall"], crate="harper-ls"),
+        InstallItem("markdown-oxide",      install_markdown_oxide,      parent="helix",    bin="markdown-oxide", requires=["cargo-binstall"], backend="binstall"),
+        InstallItem("pyright",             install_pyright,             parent="helix",    bin="pyright", apt=["libatomic1"], uv="pyright",
+                    inputs=["resources/uv-tools.toml"]),
+        InstallItem("ruff",                install_ruff,                parent="helix",    bin="ruff",   uv="ruff",
+                    inputs=["resources/uv-tools.toml"]),
     ]
 
 
@@ -81,77 +113,591 @@ def _items() -> list[InstallItem]:
 # Selection logic
 # ---------------------------------------------------------------------------
 
-def resolve_selection(items: list[InstallItem], user_selected: set[str]) -> set[str]:
-    """Return the full selection set given what the user explicitly selected.
+class DepGraph:
+    """The registry's `requires` graph and menu tree, indexed once.
 
-    Starts from user_selected and adds any prerequisites transitively.
-    Prerequisites not required by any user-selected item are excluded, so
-    deselecting an item automatically drops its auto-activated prerequisites
-    (unless they were also user-selected independently).
+    `order` lists every item id with its requirements first, registry order
+    breaking ties, so installs do not depend on how `_items()` is written.
+    Raises ValueError for duplicate ids, for a `requires` naming an unknown
+    item, for a `requires` cycle and, when groups are given, for a `parent`
+    naming an unknown group or item, or for a `parent` cycle.
     """
-    requires_map = {
-        item.id: item.requires
-        for item in items
-    }
-    selected = set(user_selected)
 
-    changed = True
-    while changed:
-        changed = False
-        for sid in list(selected):
-            for req in requires_map.get(sid, []):
-                if req not in selected:
-                    selected.add(req)
-                    changed = True
+    def __init__(self, items: list[InstallItem], groups: list[Group] | None = None) -> None:
+        self.items = {item.id: item for item in items}
+        if len(self.items) < len(items):
+            dupes = sorted({item.id for item in items if sum(i.id == item.id for i in items) > 1})
+            raise ValueError(f"duplicate item ids: {', '.join(dupes)}")
+        self.groups = {g.name: g for g in groups or []}
+        unknown = [f"{item.id} -> {r}" for item in items for r in item.requires if r not in self.items]
+        if unknown:
+            raise ValueError(f"unknown requires: {', '.join(unknown)}")
+        self.requires = {item.id: tuple(dict.fromkeys(item.requires)) for item in items}
+        self.required_by: dict[str, list[str]] = {item.id: [] for item in items}
+        for item_id, reqs in self.requires.items():
+            for r in reqs:
+                self.required_by[r].append(item_id)
+        self.order = self._toposort(items)
+
+        # children: parent (or None) -> [(node_id, is_group), ...]; parent: node_id -> parent
+        self.children: dict[str | None, list[tuple[str, bool]]] = {}
+        self.parent: dict[str, str | None] = {}
+        if groups is None:
+            return
+        nodes = [(g.name, g.parent, True) for g in groups] + [(i.id, i.parent, False) for i in items]
+        unknown = [f"{node} -> {p}" for node, p, _ in nodes if p is not None and p not in self.groups and p not in self.items]
+        if unknown:
+            raise ValueError(f"unknown parent: {', '.join(unknown)}")
+        for node, p, is_group in nodes:
+            self.children.setdefault(p, []).append((node, is_group))
+            self.parent[node] = p
+        reached = {None}
+        stack: list[str | None] = [None]
+        while stack:
+            for child, _ in self.children.get(stack.pop(), []):
+                reached.add(child)
+                stack.append(child)
+        if len(reached) <= len(nodes):
+            raise ValueError(f"parent cycle: {', '.join(node for node, _, _ in nodes if node not in reached)}")
+
+    def _toposort(self, items: list[InstallItem]) -> list[str]:
+        index = {item.id: i for i, item in enumerate(items)}
+        missing = {item_id: len(reqs) for item_id, reqs in self.requires.items()}
+        ready = [index[item_id] for item_id, n in missing.items() if n == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            item_id = items[heapq.heappop(ready)].id
+            order.append(item_id)
+            for dependent in self.required_by[item_id]:
+                missing[dependent] -= 1
+                if not missing[dependent]:
+                    heapq.heappush(ready, index[dependent])
+        if len(order) < len(items):
+            stuck = {item_id for item_id, n in missing.items() if n}
+            raise ValueError(f"requires cycle: {' -> '.join(self._cycle(items, stuck))}")
+        return order
+
+    def _cycle(self, items: list[InstallItem], stuck: set[str]) -> list[str]:
+        """One cycle among `stuck`, each of which waits on another stuck item."""
+        node = next(item.id for item in items if item.id in stuck)
+        path: list[str] = []
+        seen: dict[str, int] = {}
+        while node not in seen:
+            seen[node] = len(path)
+            path.append(node)
+            node = next(r for r in self.requires[node] if r in stuck)
+        return path[seen[node]:] + [node]
+
+    def closure(self, ids: set[str]) -> set[str]:
+        """Return the full selection set given what the user explicitly selected.
+
+        Adds the prerequisites of `ids` transitively. Prerequisites no
+        selected item requires are left out, so deselecting an item drops
+        its auto-activated prerequisites (unless the user selected them too).
+        """
+        selected = set(ids)
+        stack = list(selected)
+        while stack:
+            for r in self.requires.get(stack.pop(), ()):
+                if r not in selected:
+                    selected.add(r)
+                    stack.append(r)
+        return selected
 
-    return selected
+    def ordered(self, ids: set[str]) -> list[InstallItem]:
+        """The items in `ids`, requirements first."""
+        return [self.items[item_id] for item_id in self.order if item_id in ids]
 
 
 # ---------------------------------------------------------------------------
 # Install orchestration
 # ---------------------------------------------------------------------------
 
-def install(items: list[InstallItem], selected: set[str]) -> None:
-    for item in items:
-        if item.id in selected:
-            item.installer()
+def install(
+    items: list[InstallItem],
+    selected: set[str],
+    jobs: int = 1,
+    authenticate: Callable[[], None] | None = None,
+) -> None:
+    """Run the installers for the selected items.
+
+    Items the resumed journal lists as done and items whose manifest entry
+    still matches are skipped (see Journal, unchanged_items); ~/.cargo/bin
+    is put on PATH either way. With jobs == 1
+    the rest run one at a time in dependency order (DepGraph.order).
+    Otherwise they run concurrently on a pool of `jobs` workers, each
+    starting as soon as every selected item it `requires` has finished.
+    `authenticate` (the sudo prompt) is called first, and only if an item
+    left to install needs sudo.
+    """
+    chosen = DepGraph(items).ordered(selected)
+    resumed = [item.id for item in chosen if item.id in _journal.resumed["items"]]
+    if resumed:
+        log(f"done before the interruption, skipping: {', '.join(resumed)}")
+        chosen = [item for item in chosen if item.id not in resumed]
+    unchanged = unchanged_items(chosen)
+    if unchanged:
+        log(f"unchanged since last run, skipping: {', '.join(item.id for item in chosen if item.id in unchanged)}")
+        chosen = [item for item in chosen if item.id not in unchanged]
+    cargo_bin = Path.home() / ".cargo" / "bin"
+    if cargo_bin.is_dir():  # install_rust adds it to PATH, but a skipped rust does not run
+        _add_to_path(cargo_bin)
+    if authenticate and any(_needs_sudo(item) for item in chosen):
+        authenticate()
+    _apt_state.present.clear()
+    _apt_state.batched.clear()
+    install_apt_batch(chosen)
+    _binstall_batch.crates = [item.crate for item in chosen if item.crate and not is_installed(item.bin)]
+    _binstall_batch.returncode = None
+    repos = [item.github for item in chosen if item.github and not is_installed(item.bin)]
+    if repos:
+        with task("release metadata"):
+            for repo, release in resolve_releases(repos).items():
+                log(f"{repo}: {release['tag']}")
+    try:
+        if jobs <= 1:
+            for item in chosen:
+                _run_installer(item)
+        else:
+            _install_parallel(chosen, jobs)
+    finally:
+        _save_timings()
+        _save_manifest(items)
     setup_local_bin_path()
 
 
+def _run_installer(item: InstallItem) -> None:
+    """Run one item's installer, recording its duration if it did real work."""
+    satisfied = _is_satisfied(item)
+    start = time.monotonic()
+    try:
+        item.installer()
+    finally:
+        _probe.invalidate(item)
+    with _timings_lock:
+        _completed.append(item.id)
+    _journal.item_done(item.id)
+    if not satisfied:
+        with _timings_lock:
+            _timings[item.id] = time.monotonic() - start
+
+
+def _install_parallel(chosen: list[InstallItem], jobs: int) -> None:
+    """Schedule chosen items over a dependency graph built from `requires`.
+
+    Ready items are submitted in the order of `chosen` (dependency order,
+    registry order breaking ties). On the first failure no further items are
+    started; running ones are allowed to finish and the failure is re-raised.
+    """
+    ids = {item.id for item in chosen}
+    waiting_on = {item.id: {r for r in item.requires if r in ids} for item in chosen}
+    pending = list(chosen)
+    running = {}
+    failure = None
+    depth = _depth()
+
+    def _run_item(item: InstallItem) -> None:
+        _local.indent = depth
+        _local.item = item.id
+        _run_installer(item)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            if failure is None:
+                for item in [i for i in pending if not waiting_on[i.id]]:
+                    pending.remove(item)
+                    running[pool.submit(_run_item, item)] = item
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    failure = failure or exc
+                    continue
+                for deps in waiting_on.values():
+                    deps.discard(item.id)
+
+    if failure is not None:
+        raise failure
+    if pending:
+        raise RuntimeError(f"unresolvable requires: {', '.join(i.id for i in pending)}")
+
+
+# ---------------------------------------------------------------------------
+# Plan
+# ---------------------------------------------------------------------------
+
+_timings: dict[str, float] = {}  # item id -> seconds, for items installed this run
+_timings_lock = threading.Lock()
+_TIMING_HISTORY = 5  # durations kept per item for estimates
+
+
+def _state_root() -> Path:
+    return Path.home() / ".local" / "state" / "devenv"
+
+
+def _is_satisfied(item: InstallItem) -> bool | None:
+    """Whether the item is already installed; None for items that always run (configuration)."""
+    return is_installed(item.bin) if item.bin else None
+
+
+def _backend(item: InstallItem) -> str:
+    if item.backend:
+        return item.backend
+    if item.github:
+        return "github"
+    if item.crate:
+        return "binstall"
+    if item.uv:
+        return "uv"
+    if item.apt:
+        return "apt"
+    return "config"
+
+
+def _save_timings() -> None:
+    """Merge this run's durations into the history used by --plan estimates."""
+    if not _timings:
+        return
+    path = _state_root() / "timings.json"
+    history = _read_json(path)
+    with _timings_lock:
+        for item_id, seconds in _timings.items():
+            history[item_id] = (history.get(item_id, []) + [round(seconds, 3)])[-_TIMING_HISTORY:]
+        _timings.clear()
+    _write_json(path, history)
+
+
+# ---------------------------------------------------------------------------
+# Install manifest
+# ---------------------------------------------------------------------------
+
+_MANIFEST_VERSION = 1
+_completed: list[str] = []  # item ids whose installer finished this run (guarded by _timings_lock)
+_script_digest: str | None = None
+
+
+def _manifest_path() -> Path:
+    return _state_root() / "manifest.json"
+
+
+def _input_state(spec: str) -> str:
+    """Content digest of an input file, with the target if it is a symlink."""
+    path = Path(spec).expanduser() if spec.startswith("~") else SCRIPT_DIR / spec
+    state = f"-> {os.readlink(path)} " if path.is_symlink() else ""
+    try:
+        return state + hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return state + "missing"
+
+
+def _fingerprint(item: InstallItem, required: dict[str, str]) -> str:
+    """Digest of everything that decides what the item's installer would do.
+
+    Covers this script, the item's declaration, its input files and the
+    fingerprints of the items it requires.
+    """
+    global _script_digest
+    if _script_digest is None:
+        _script_digest = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+    data = {
+        "script": _script_digest,
+        "item": [item.id, item.bin, item.apt, item.github, item.crate, item.uv, item.backend],
+        "inputs": {spec: _input_state(spec) for spec in item.inputs},
+        "requires": {r: required.get(r) for r in item.requires},
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _fingerprints(items: list[InstallItem]) -> dict[str, str]:
+    by_id = {item.id: item for item in items}
+    result: dict[str, str] = {}
+
+    def visit(item: InstallItem) -> str:
+        if item.id not in result:
+            required = {r: visit(by_id[r]) for r in item.requires if r in by_id}
+            result[item.id] = _fingerprint(item, required)
+        return result[item.id]
+
+    for item in items:
+        visit(item)
+    return result
+
+
+def _bin_state(item: InstallItem) -> list | None:
+    """[path, size, mtime_ns] of the item's executable, None if it is not on PATH."""
+    path = _probe.which(item.bin) if item.bin else None
+    if path is None:
+        return None
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+def unchanged_items(chosen: list[InstallItem]) -> set[str]:
+    """Ids of chosen items that can be skipped because nothing changed since they were installed.
+
+    An item is unchanged when its manifest fingerprint still matches, its
+    executable is the same file at the same path, its apt packages are
+    installed, and every chosen item it requires is unchanged too, so a
+    change anywhere re-runs the whole subtree below it.
+    """
+    if _options.force or _options.replay:
+        return set()
+    entries = _read_json(_manifest_path())
+    if entries.get("version") != _MANIFEST_VERSION:
+        return set()
+    entries = entries.get("items", {})
+    fingerprints = _fingerprints(chosen)
+    ids = {item.id for item in chosen}
+    unchanged: set[str] = set()
+    for item in chosen:  # install() passes requirements first
+        entry = entries.get(item.id)
+        if (
+            entry is not None
+            and entry.get("fingerprint") == fingerprints[item.id]
+            and (item.bin is None or entry.get("bin") == _bin_state(item))
+            and _dpkg_installed(item.apt) >= set(item.apt)
+            and all(r in unchanged for r in item.requires if r in ids)
+        ):
+            unchanged.add(item.id)
+    return unchanged
+
+
+def _needs_sudo(item: InstallItem) -> bool:
+    return item.privileged or _dpkg_installed(item.apt) < set(item.apt)
+
+
+def _save_manifest(items: list[InstallItem]) -> None:
+    """Record the items installed this run, fingerprinted against their final state."""
+    with _timings_lock:
+        done = set(_completed)
+        _completed.clear()
+    if not done or _options.replay:
+        return
+    path = _manifest_path()
+    manifest = _read_json(path)
+    if manifest.get("version") != _MANIFEST_VERSION:
+        manifest = {"version": _MANIFEST_VERSION, "items": {}}
+    _probe.invalidate()
+    fingerprints = _fingerprints(items)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    for item in items:
+        if item.id in done:
+            manifest["items"][item.id] = {
+                "fingerprint": fingerprints[item.id],
+                "bin": _bin_state(item),
+                "version": _probe.version(item),
+                "installed_at": now,
+            }
+    _write_json(path, manifest)
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint journal
+# ---------------------------------------------------------------------------
+
+class Journal:
+    """Progress of the current run, rewritten atomically as items and tasks complete.
+
+    A run that stops half way leaves status "failed" (or "running" if it was
+    killed) with the items and task paths it got through. `--resume` reuses
+    that selection and skips what was done; partial downloads are picked up
+    by _download() on their own. Nothing is written until begin() is called.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict | None = None
+        self.resumed: dict = {"items": [], "steps": []}
+
+    @staticmethod
+    def path() -> Path:
+        return _state_root() / "journal.json"
+
+    @classmethod
+    def unfinished(cls) -> dict | None:
+        """The journal of an interrupted run, or None if the last run completed."""
+        data = _read_json(cls.path())
+        return data if data.get("status") in ("running", "failed") else None
+
+    def begin(self, selected: set[str], resume: bool) -> None:
+        previous = self.unfinished() if resume else None
+        if previous:
+            self.resumed = {"items": previous.get("items", []), "steps": previous.get("steps", [])}
+        self._data = {
+            "status": "running",
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "selection": sorted(selected),
+            "items": list(self.resumed["items"]),
+            "steps": list(self.resumed["steps"]),
+            "failed": None,
+        }
+        self._save()
+
+    def item_done(self, item_id: str) -> None:
+        self._update(lambda data: data["items"].append(item_id))
+
+    def step_done(self, path: str) -> None:
+        self._update(lambda data: data["steps"].append(path))
+
+    def step_failed(self, item_id: str | None, path: str) -> None:
+        """Remember the innermost failing task; outer tasks unwinding after it are ignored."""
+        def record(data):
+            if data["failed"] is None:
+                data["failed"] = {"item": item_id, "step": path}
+        self._update(record)
+
+    def end(self, ok: bool) -> None:
+        self._update(lambda data: data.update(status="complete" if ok else "failed"))
+
+    def done_before(self, name: str) -> bool:
+        """Whether a task called name completed in the run being resumed."""
+        return any(step.rsplit(" / ", 1)[-1] == name for step in self.resumed["steps"])
+
+    def _update(self, change: Callable[[dict], None]) -> None:
+        with self._lock:
+            if self._data is None:
+                return
+            change(self._data)
+            self._save()
+
+    def _save(self) -> None:
+        if not _options.replay:
+            _write_json(self.path(), self._data)
+
+
+_journal = Journal()
+
+
+def build_plan(items: list[InstallItem], user_selected: set[str]) -> dict:
+    """Describe what install() would do, without sudo or network access.
+
+    Download sizes come from cached release metadata and the local apt
+    package cache; duration estimates are the median of previous runs.
+    """
+    graph = DepGraph(items)
+    selected = graph.closure(user_selected)
+    chosen = graph.ordered(selected)
+    history = _read_json(_state_root() / "timings.json")
+    releases = _read_json(_cache_root() / "releases.json")
+    artifacts = _read_json(_cache_root() / "artifacts" / "index.json")
+    apt_packages = [pkg for item in chosen for pkg in item.apt]
+    apt_installed = _dpkg_installed(apt_packages) if apt_packages else set()
+    apt_sizes = _apt_download_sizes([p for p in apt_packages if p not in apt_installed])
+
+    entries = []
+    for item in chosen:
+        satisfied = _is_satisfied(item)
+        missing_apt = [p for p in item.apt if p not in apt_installed]
+        download = None
+        if not satisfied:
+            download = sum(apt_sizes.get(p, 0) for p in missing_apt) or None
+            if item.github and item.asset:
+                asset_bytes = _release_asset_size(item, releases.get(item.github), artifacts)
+                if asset_bytes is not None:
+                    download = (download or 0) + asset_bytes
+        past = sorted(history.get(item.id, []))
+        estimate = None if satisfied or not past else past[len(past) // 2]
+        entries.append({
+            "id": item.id,
+            "selected": "user" if item.id in user_selected else "dependency",
+            "satisfied": satisfied,
+            "requires": [r for r in item.requires if r in selected],
+            "backend": _backend(item),
+            "apt_missing": missing_apt,
+            "download_bytes": download,
+            "estimate_seconds": estimate,
+        })
+    return {
+        "items": entries,
+        "download_bytes": sum(e["download_bytes"] or 0 for e in entries),
+        "estimate_seconds": round(sum(e["estimate_seconds"] or 0 for e in entries), 3),
+    }
+
+
+def _release_asset_size(item: InstallItem, cached: dict | None, artifacts: dict) -> int | None:
+    """Bytes to download for a GitHub item per cached metadata; 0 if already in the artifact cache."""
+    if not cached:
+        return None
+    release = cached["release"]
+    for name, asset in release["assets"].items():
+        if re.search(item.asset, name):
+            if f"{item.github}@{release['tag']}/{name}" in artifacts:
+                return 0
+            return asset["size"]
+    return None
+
+
+def _apt_download_sizes(packages: list[str]) -> dict[str, int]:
+    """Candidate .deb sizes from the local apt cache (no network, no sudo)."""
+    if not packages:
+        return {}
+    result = subprocess.run(
+        ["apt-cache", "show", "--no-all-versions", *packages],
+        capture_output=True, text=True,
+    )
+    sizes, name = {}, None
+    for line in result.stdout.splitlines():
+        if line.startswith("Package: "):
+            name = line.removeprefix("Package: ")
+        elif line.startswith("Size: ") and name:
+            sizes[name] = int(line.removeprefix("Size: "))
+    return sizes
+
+
+def print_plan(plan: dict, fmt: str) -> None:
+    if fmt == "json":
+        print(json.dumps(plan, indent=2))
+        return
+
+    def status(e):
+        return {True: "installed", False: "install", None: "apply"}[e["satisfied"]]
+
+    def size(n):
+        return "-" if not n else f"{n / 1e6:.1f} MB"
+
+    def secs(n):
+        return "-" if not n else f"{n:.0f}s"
+
+    rows = [("ITEM", "STATUS", "BACKEND", "REQUIRES", "DOWNLOAD", "ESTIMATE")]
+    for e in plan["items"]:
+        item_id = e["id"] + (" (+dep)" if e["selected"] == "dependency" else "")
+        rows.append((item_id, status(e), e["backend"], ", ".join(e["requires"]) or "-",
+                     size(e["download_bytes"]), secs(e["estimate_seconds"])))
+    rows.append(("total", "", "", "", size(plan["download_bytes"]), secs(plan["estimate_seconds"])))
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for r in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)).rstrip())
+
+
 # ---------------------------------------------------------------------------
 # Installers
 # ---------------------------------------------------------------------------
 
 def install_htop():
     with task("htop"):
-        if is_installed("htop"):
-            log("already installed, skipping")
-            return
-        sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq htop")
-        log("done")
+        apt_install("htop")
 
 
 def install_btop():
     with task("btop"):
-        if is_installed("btop"):
-            log("already installed, skipping")
-            return
-        sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq btop")
-        log("done")
+        apt_install("btop")
 
 
 def install_unattended_upgrades():
     with task("unattended-upgrades"):
-        if not is_installed("unattended-upgrades"):
-            sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq unattended-upgrades")
-            log("installed")
-        else:
-            log("already installed, skipping")
+        apt_install("unattended-upgrades")
+
+
+ALL_UPGRADES_OVERRIDE = "/etc/apt/apt.conf.d/99unattended-upgrades-override"
 
 
 def install_all_upgrades():
     with task("all-upgrades"):
-        override = Path("/etc/apt/apt.conf.d/99unattended-upgrades-override")
+        override = Path(ALL_UPGRADES_OVERRIDE)
         if override.exists():
             log("origins already configured, skipping")
             return
@@ -168,11 +714,7 @@ def install_all_upgrades():
 
 def install_incus():
     with task("incus"):
-        if is_installed("incus"):
-            log("already installed, skipping")
-            return
-        sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq incus")
-        log("done")
+        apt_install("incus")
 
 
 def install_incus_and_init():
@@ -181,7 +723,7 @@ def install_incus_and_init():
 
 
 def init_incus():
-    has_zfs = subprocess.run("command -v zfs", shell=True, capture_output=True).returncode == 0
+    has_zfs = is_installed("zfs")
     backend = "zfs" if has_zfs else "dir"
 
     with task(f"incus init ({backend})"):
@@ -196,16 +738,17 @@ def init_incus():
 def install_rust():
     with task("build-essential"):
         # Required by rustup (C linker + headers); install unconditionally
-        sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq build-essential")
-        log("done")
+        apt_install("build-essential")
 
     with task("Rust"):
         if is_installed("rustc"):
             log("already installed, skipping")
             return
-        run("curl --proto '=https' --tlsv1.2 -sSf https://sh.rustup.rs | sh -s -- -y")
-        cargo_bin = Path.home() / ".cargo" / "bin"
-        os.environ["PATH"] = str(cargo_bin) + ":" + os.environ["PATH"]
+        if _bundle is not None:
+            _install_bundled_rust()
+            return
+        run(f"{_RUSTUP_INIT} | sh -s -- -y")
+        _add_to_path(Path.home() / ".cargo" / "bin")
         log("done")
 
 
@@ -223,12 +766,43 @@ def install_cargo_binstall():
         if is_installed("cargo-binstall"):
             log("already installed, skipping")
             return
+        if _bundle is not None:
+            _install_bundled_crate(_SCRIPT_CRATES["cargo-binstall"])
+            return
         run("curl -L --proto '=https' --tlsv1.2 -sSf https://raw.githubusercontent.com/cargo-bins/cargo-binstall/main/install-from-binstall-release.sh | bash")
         log("done")
 
 
+def binstall(crate: str) -> None:
+    """Install a crate with cargo binstall.
+
+    Crates planned by install() are installed together in one shared
+    invocation, run by whichever item gets here first; later items only
+    report it. If the shared run fails, each item retries on its own so the
+    failure is attributed to the crate that caused it. With --bundle-in the
+    bundled binaries are copied instead.
+    """
+    if _bundle is not None:
+        _install_bundled_crate(crate)
+        return
+    if crate not in _binstall_batch.crates:
+        git = f"--git '{_GIT_CRATES[crate]}' " if crate in _GIT_CRATES else ""
+        run(f"cargo binstall --no-confirm {git}{crate}")
+        return
+    with _binstall_batch.lock:
+        if _binstall_batch.returncode is None:
+            crates = " ".join(_binstall_batch.crates)
+            with task(f"cargo binstall ({crates})"):
+                _binstall_batch.returncode = _run_stream(f"cargo binstall --no-confirm {crates}")
+    if _binstall_batch.returncode == 0:
+        log(f"{crate} installed in batched cargo binstall")
+        return
+    log(f"batched cargo binstall failed (exit {_binstall_batch.returncode}), retrying {crate} on its own")
+    run(f"cargo binstall --no-confirm {crate}")
+
+
 def ensure_cargo_binstall():
-    if is_installed("cargo-binstall"):
+    if is_installed("cargo-binstall") or _bundle is not None:
         return
     install_cargo_binstall()
 
@@ -239,7 +813,7 @@ def install_zellij():
             log("already installed, skipping")
             return
         ensure_cargo_binstall()
-        run("cargo binstall --no-confirm zellij")
+        binstall("zellij")
         log("done")
 
 
@@ -249,11 +823,12 @@ def install_delta():
             log("already installed, skipping")
         else:
             ensure_cargo_binstall()
-            run("cargo binstall --no-confirm git-delta")
+            binstall("git-delta")
             log("done")
         # Applied unconditionally so config is correct even on re-runs.
-        run(r"""git config --global alias.dd '!f() { git diff "$@" | delta; }; f'""")
-        run(r"""git config --global alias.dl '!f() { git log -p "$@" | delta; }; f'""")
+        with _git_config_lock:
+            run(r"""git config --global alias.dd '!f() { git diff "$@" | delta; }; f'""")
+            run(r"""git config --global alias.dl '!f() { git log -p "$@" | delta; }; f'""")
 
 
 def install_difft():
@@ -262,14 +837,19 @@ def install_difft():
             log("already installed, skipping")
         else:
             ensure_cargo_binstall()
-            run("cargo binstall --no-confirm difftastic")
+            binstall("difftastic")
             log("done")
         # Applied unconditionally so config is correct even on re-runs.
-        run("""git config --global difftool.difftastic.cmd '$HOME/.cargo/bin/difft "$LOCAL" "$REMOTE"'""")
-        run("git config --global difftool.prompt false")
-        run("git config --global alias.dft 'difftool --tool=difftastic --no-prompt'")
-        run("git config --global difftastic.color always")
-        run("git config --global pager.difftool true")
+        with _git_config_lock:
+            run("""git config --global difftool.difftastic.cmd '$HOME/.cargo/bin/difft "$LOCAL" "$REMOTE"'""")
+            run("git config --global difftool.prompt false")
+            run("git config --global alias.dft 'difftool --tool=difftastic --no-prompt'")
+            run("git config --global difftastic.color always")
+            run("git config --global pager.difftool true")
+
+
+HELIX_ASSET = r"amd64\.deb$"
+BIOME_ASSET = rf"^biome-linux-{'arm64' if platform.machine() == 'aarch64' else 'x64'}$"
 
 
 def install_helix():
@@ -279,44 +859,19 @@ def install_helix():
             _link_helix_config()
             return
 
-        with task("downloading latest .deb"):
-            run(r"""curl -s https://api.github.com/repos/helix-editor/helix/releases/latest | grep -oP '"browser_download_url": "\K[^"]*amd64\.deb' | xargs curl -Lo /tmp/helix.deb""")
+        with task("latest .deb"):
+            deb = fetch_release_asset("helix-editor/helix", HELIX_ASSET)
 
         with task("installing"):
-            sudo("dpkg -i /tmp/helix.deb")
-            run("rm /tmp/helix.deb")
+            with _apt_lock:
+                sudo(f"dpkg -i {deb}")
             log("done")
 
         _link_helix_config()
 
 
 def _link_helix_config():
-    configs = [
-        ("config.toml", "helix config"),
-        ("languages.toml", "helix languages"),
-    ]
-    for filename, label in configs:
-        with task(label):
-            src = SCRIPT_DIR / "resources" / "helix" / filename
-            dst = Path.home() / ".config" / "helix" / filename
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            if dst.is_symlink() or dst.exists():
-                if dst.is_symlink() and dst.resolve() == src.resolve():
-                    log("symlink already correct")
-                    continue
-                if dst.is_symlink() and not dst.exists():
-                    log(f"replacing dangling symlink {dst}")
-                    dst.unlink()
-                else:
-                    diff = _config_diff(src, dst)
-                    if diff is None:
-                        log(f"{dst} exists with equivalent content, skipping")
-                        continue
-                    warn(f"{dst} differs from installable config, not overwriting (delete and rerun to update)", diff=diff)
-                    continue
-            rel = os.path.relpath(src, dst.parent)
-            os.symlink(rel, dst)
-            log(f"symlinked {dst} -> {rel}")
+    reconcile_links("helix")
 
 
 def install_biome():
@@ -324,11 +879,8 @@ def install_biome():
         if is_installed("biome"):
             log("already installed, skipping")
             return
-        arch = "arm64" if platform.machine() == "aarch64" else "x64"
-        dst = Path.home() / ".local" / "bin" / "biome"
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        run(f"""curl -s https://api.github.com/repos/biomejs/biome/releases/latest | grep -oP '"browser_download_url": "\\K[^"]*biome-linux-{arch}(?=")' | xargs curl -Lo {dst}""")
-        run(f"chmod +x {dst}")
+        src = fetch_release_asset("biomejs/biome", BIOME_ASSET)
+        _install_file(src, Path.home() / ".local" / "bin" / "biome")
         log("done")
 
 
@@ -338,7 +890,7 @@ def install_harper_ls():
             log("already installed, skipping")
             return
         ensure_cargo_binstall()
-        run("cargo binstall --no-confirm harper-ls")
+        binstall("harper-ls")
         log("done")
 
 
@@ -348,7 +900,7 @@ def install_markdown_oxide():
             log("already installed, skipping")
             return
         ensure_cargo_binstall()
-        run("cargo binstall --no-confirm --git 'https://github.com/feel-ix-343/markdown-oxide' markdown-oxide")
+        binstall("markdown-oxide")
         log("done")
 
 
@@ -360,8 +912,8 @@ def install_pyright():
         # pyright-python downloads a prebuilt Node.js binary (via nodeenv). Node 25+
         # requires libatomic1, which is absent from minimal Debian/Ubuntu images.
         # https://github.com/nodejs/node/issues/60790
-        sudo("DEBIAN_FRONTEND=noninteractive apt-get install -y -qq libatomic1")
-        run("uv tool install pyright")
+        apt_install("libatomic1")
+        uv_tool_install("pyright")
         log("done")
 
 
@@ -370,269 +922,1611 @@ def install_ruff():
         if is_installed("ruff"):
             log("already installed, skipping")
             return
-        run("uv tool install ruff")
+        uv_tool_install("ruff")
         log("done")
 
 
-def setup_local_bin_path():
-    with task("~/.local/bin on PATH"):
-        profile = Path.home() / ".profile"
-        marker = 'PATH="$HOME/.local/bin:$PATH"'
-        if profile.exists() and marker in profile.read_text():
-            log("already configured")
+def uv_tool_install(package: str) -> None:
+    """Install a Python tool with uv using the shared cache under the cache root.
+
+    A version pinned in resources/uv-tools.toml is tried offline first, so a
+    host that has installed it before neither resolves nor downloads again.
+    With --bundle-in the bundled version is installed from the bundle's cache.
+    """
+    if _bundle is not None:
+        cache = shlex.quote(str(_bundle.root / "uv"))
+        run(f"UV_CACHE_DIR={cache} uv tool install --offline {package}=={_bundle.manifest['uv'][package]}")
+        return
+    cache = _cache_root() / "uv"
+    env = f"UV_CACHE_DIR={shlex.quote(str(cache))}"
+    pin = _uv_pins().get(package)
+    spec = f"{package}=={pin}" if pin else package
+    if pin and cache.exists():
+        if _run_stream(f"{env} uv tool install --offline {spec}") == 0:
+            log(f"installed {spec} from local uv cache")
             return
-        with profile.open("a") as f:
-            f.write(f'\n# Added by install.py\nexport {marker}\n')
-        log(f"appended to {profile}")
+        log(f"{spec} not in local uv cache, resolving online")
+    run(f"{env} uv tool install {spec}")
 
 
-def install_tok():
-    with task("tok"):
-        src = SCRIPT_DIR / "resources" / "tok" / "tok.py"
-        dst = Path.home() / ".local" / "bin" / "tok"
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        if dst.is_symlink() or dst.exists():
-            if dst.is_symlink() and dst.resolve() == src.resolve():
-                log("symlink already correct")
-                return
-            if dst.is_symlink() and not dst.exists():
-                log(f"replacing dangling symlink {dst}")
-                dst.unlink()
-            else:
-                warn(f"{dst} already exists, not overwriting")
-                return
-        rel = os.path.relpath(src, dst.parent)
-        os.symlink(rel, dst)
-        log(f"symlinked {dst} -> {rel}")
+def _uv_pins() -> dict[str, str]:
+    try:
+        with UV_PINS.open("rb") as f:
+            return tomllib.load(f).get("pins", {})
+    except (OSError, tomllib.TOMLDecodeError):
+        return {}
 
 
-# ---------------------------------------------------------------------------
-# TUI helpers (module-level for testability)
-# ---------------------------------------------------------------------------
+def setup_local_bin_path():
+    with task("~/.local/bin on PATH"):
+        _profile_path("$HOME/.local/bin")
 
-def _collect_descendants(node_id: str, children_of: dict) -> list[str]:
-    """Return selection ids for all descendants of node_id, depth-first."""
-    result = []
-    for child_id, child_is_group in children_of.get(node_id, []):
-        result.append(f"__group_{child_id}__" if child_is_group else child_id)
-        result.extend(_collect_descendants(child_id, children_of))
-    return result
+
+def _profile_path(directory: str) -> None:
+    """Put directory on PATH for login shells via ~/.profile, once."""
+    profile = Path.home() / ".profile"
+    marker = f'PATH="{directory}:$PATH"'
+    if profile.exists() and marker in profile.read_text():
+        log("already configured")
+        return
+    with profile.open("a") as f:
+        f.write(f'\n# Added by install.py\nexport {marker}\n')
+    log(f"appended to {profile}")
 
 
-def _collect_ancestors(node_id: str, parent_of: dict, group_names: set) -> list[str]:
-    """Return selection ids for all ancestors of node_id, immediate parent first."""
-    result = []
-    current = node_id
-    while parent_of.get(current) is not None:
-        p = parent_of[current]
-        result.append(f"__group_{p}__" if p in group_names else p)
-        current = p
-    return result
+def install_tok():
+    reconcile_links("tok")
 
 
 # ---------------------------------------------------------------------------
-# TUI
+# Config links
 # ---------------------------------------------------------------------------
 
-def run_selection_menu(items: list[InstallItem], groups: list[Group]) -> set[str] | None:
-    """Display the interactive selection menu.
+@dataclass(frozen=True)
+class Link:
+    """A resource file symlinked into HOME by its item's installer.
 
-    Returns the user_selected set on confirmation, or None if the user aborted.
+    An existing destination that is not the right symlink is never replaced
+    (dangling symlinks excepted). With policy "diff" it is accepted if its
+    content is whitespace-equivalent and warned about with a diff otherwise;
+    with "keep" it is warned about regardless.
     """
-    from collections import defaultdict
-    from textual.app import App, ComposeResult
-    from textual.binding import Binding
-    from textual.widgets import Footer, Header, SelectionList, Static
-    from textual.widgets.selection_list import Selection
+    item: str
+    src: str  # relative to resources/
+    dst: str  # relative to HOME
+    label: str  # task name
+    policy: str = "diff"
 
-    all_ids = [item.id for item in items]
-    group_names = {g.name for g in groups}
 
-    # children_of: parent_id (or None) -> [(node_id, is_group), ...]
-    children_of: dict[str | None, list[tuple[str, bool]]] = defaultdict(list)
-    for g in groups:
-        children_of[g.parent].append((g.name, True))
-    for item in items:
-        children_of[item.parent].append((item.id, False))
-
-    # parent_of: node_id -> parent_id (or None)
-    parent_of: dict[str, str | None] = {}
-    for g in groups:
-        parent_of[g.name] = g.parent
-    for item in items:
-        parent_of[item.id] = item.parent
+LINKS = [
+    Link("helix", "helix/config.toml", ".config/helix/config.toml", "helix config"),
+    Link("helix", "helix/languages.toml", ".config/helix/languages.toml", "helix languages"),
+    Link("tok", "tok/tok.py", ".local/bin/tok", "tok", policy="keep"),
+]
 
-    def _make_selections() -> list[Selection]:
-        entries = []
-        def visit(node_id: str, is_group: bool, depth: int) -> None:
-            indent = "  " * depth
-            if is_group:
-                entries.append(Selection(
-                    f"{indent}[bold]\\[{node_id}][/bold]",
-                    f"__group_{node_id}__",
-                    initial_state=True,
-                ))
-            else:
-                entries.append(Selection(f"{indent}{node_id}", node_id, initial_state=True))
-            for child_id, child_is_group in children_of.get(node_id, []):
-                visit(child_id, child_is_group, depth + 1)
-        for node_id, is_group in children_of[None]:
-            visit(node_id, is_group, 0)
-        return entries
+_link_hashes_lock = threading.Lock()
 
-    class InstallerApp(App):
-        BINDINGS = [
-            Binding("enter",  "confirm",      "Install",  show=True,  priority=True),
-            Binding("q",      "quit_abort",   "Quit",     show=True),
-            Binding("escape", "quit_abort",   "Quit",     show=False),
-            Binding("j",      "cursor_down",  "Down",     show=False),
-            Binding("k",      "cursor_up",    "Up",       show=False),
-            Binding("h",      "cursor_up",    "Up",       show=False),
-            Binding("l",      "cursor_down",  "Down",     show=False),
-        ]
-        CSS = """
-        SelectionList { height: 1fr; border: solid $accent; }
-        Header { height: 1; }
-        #hints { padding: 0 1; color: $text-muted; }
-        """
 
-        def __init__(self):
-            super().__init__()
-            self._result: set[str] | None = None
-            self._user_selected: set[str] = set(all_ids)
+def link_inputs(item_id: str) -> list[str]:
+    """Manifest inputs for an item's links: each resource file and its destination."""
+    return [spec for link in LINKS if link.item == item_id for spec in (f"resources/{link.src}", f"~/{link.dst}")]
 
-        def compose(self) -> ComposeResult:
-            yield Header(show_clock=False)
-            yield SelectionList(*_make_selections(), id="menu")
-            yield Static("space/click toggle  ↑↓/jk navigate  enter install  q quit", id="hints")
-            yield Footer()
 
-        def on_mount(self) -> None:
-            self.title = "Dev Environment Setup"
+def reconcile_links(item_id: str) -> None:
+    """Bring every link of an item in line with LINKS, in one pass.
 
-        def on_selection_list_selection_toggled(
-            self, event: SelectionList.SelectionToggled
-        ) -> None:
-            sid = str(event.selection.value)
-            sl: SelectionList = self.query_one("#menu")
-            new_state = sid in sl.selected
-            is_group_header = sid.startswith("__group_")
-            node_id = sid.removeprefix("__group_").removesuffix("__") if is_group_header else sid
+    A destination costs one lstat, plus a readlink if it is a symlink.
+    Existing files are compared through content hashes cached in
+    <state>/link-hashes.json by size and mtime, so unchanged configs are not
+    read again on later runs; only a real difference reads both files for
+    the diff.
+    """
+    path = _state_root() / "link-hashes.json"
+    with _link_hashes_lock:
+        hashes = _read_json(path)
+        before = dict(hashes)
+        for link in LINKS:
+            if link.item == item_id:
+                with task(link.label):
+                    _reconcile_link(link, hashes)
+        if hashes != before:
+            _write_json(path, hashes)
+
+
+def _reconcile_link(link: Link, hashes: dict) -> None:
+    src = SCRIPT_DIR / "resources" / link.src
+    dst = Path.home() / link.dst
+    rel = os.path.relpath(src, dst.parent)
+    try:
+        mode = os.lstat(dst).st_mode
+    except FileNotFoundError:
+        mode = None
+    if mode is not None and stat.S_ISLNK(mode):
+        if os.readlink(dst) == rel or dst.resolve() == src.resolve():
+            log("symlink already correct")
+            return
+        if not dst.exists():
+            log(f"replacing dangling symlink {dst}")
+            dst.unlink()
+            mode = None
+    if mode is not None:
+        if link.policy == "keep":
+            warn(f"{dst} already exists, not overwriting")
+            return
+        diff = None
+        if _content_hash(src, hashes) != _content_hash(dst, hashes):
+            diff = _config_diff(src, dst)
+        if diff is None:
+            log(f"{dst} exists with equivalent content, skipping")
+            return
+        warn(f"{dst} differs from installable config, not overwriting (delete and rerun to update)", diff=diff)
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.symlink(rel, dst)
+    log(f"symlinked {dst} -> {rel}")
 
-            for desc_sid in _collect_descendants(node_id, children_of):
-                if new_state and desc_sid not in sl.selected:
-                    sl.select(desc_sid)
-                elif not new_state and desc_sid in sl.selected:
-                    sl.deselect(desc_sid)
 
-            if new_state:
-                for anc_sid in _collect_ancestors(node_id, parent_of, group_names):
-                    if anc_sid not in sl.selected:
-                        sl.select(anc_sid)
+def _content_hash(path: Path, hashes: dict) -> str:
+    """Hash of path's lines with surrounding whitespace stripped, cached by size and mtime.
 
-            self._user_selected = {v for v in sl.selected if not str(v).startswith("__group_")}
+    Files modified within the last second are not cached: a second write in
+    the same mtime tick could keep the size and go unnoticed.
+    """
+    st = path.stat()
+    key = str(path.resolve())
+    cached = hashes.get(key)
+    if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+        return cached[2]
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for line in f:
+            digest.update(line.strip() + b"\n")
+    if time.time_ns() - st.st_mtime_ns > 1_000_000_000:
+        hashes[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
 
-        def action_confirm(self) -> None:
-            sl: SelectionList = self.query_one("#menu")
-            self._result = {v for v in sl.selected if not str(v).startswith("__group_")}
-            self.exit()
 
-        def action_quit_abort(self) -> None:
-            self._result = None
-            self.exit()
+# ---------------------------------------------------------------------------
+# Release artifacts
+# ---------------------------------------------------------------------------
 
-        def action_cursor_down(self) -> None:
-            self.query_one("#menu", SelectionList).action_cursor_down()
+GITHUB_API = "https://api.github.com"
+_cache_lock = threading.Lock()
+_releases: dict[str, dict] = {}  # repo -> parsed latest release, resolved this run
 
-        def action_cursor_up(self) -> None:
-            self.query_one("#menu", SelectionList).action_cursor_up()
 
-    app = InstallerApp()
-    app.run()
-    return app._result
+def _cache_root() -> Path:
+    return _options.cache_dir or Path.home() / ".cache" / "devenv"
 
 
-# ---------------------------------------------------------------------------
-# Utilities
-# ---------------------------------------------------------------------------
+def _github_release(repo: str) -> dict:
+    """Return {"tag": ..., "assets": {name: {"url", "size", "sha256"}}} for the latest release.
 
-_indent = 0
-_password = None
-_warnings = []
-_logfile = None
-_ansi_re = re.compile(r"\033\[[0-9;]*m")  # strip ANSI escapes for log file
-SCRIPT_DIR = Path(__file__).resolve().parent
+    Served from metadata already resolved this run when available.
+    """
+    if repo not in _releases:
+        resolve_releases([repo])
+    return _releases[repo]
 
 
-def log(msg):
-    prefix = "  " * _indent
-    for line in msg.splitlines():
-        print(f"{prefix}{line}", flush=True)
-        if _logfile:
-            _logfile.write(_ansi_re.sub("", f"{prefix}{line}") + "\n")
+def resolve_releases(repos: list[str]) -> dict[str, dict]:
+    """Resolve latest-release metadata for all repos at once.
 
+    Entries younger than --release-ttl are used straight from
+    <cache>/releases.json. Older ones are revalidated concurrently with
+    If-None-Match, so an unchanged release costs a 304 (which GitHub does not
+    count against the rate limit) rather than a full response.
+    """
+    path = _cache_root() / "releases.json"
+    with _cache_lock:
+        cache = _read_json(path)
+    now = time.time()
+    stale = [r for r in repos if now - cache.get(r, {}).get("fetched", 0) >= _options.release_ttl]
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(8, len(stale))) as pool:
+            fetched = list(pool.map(lambda r: _fetch_release(r, cache.get(r)), stale))
+        with _cache_lock:
+            cache = _read_json(path)
+            cache.update(zip(stale, fetched))
+            _write_json(path, cache)
+
+    for repo in repos:
+        _releases[repo] = cache[repo]["release"]
+    return {repo: _releases[repo] for repo in repos}
+
+
+def _fetch_release(repo: str, cached: dict | None) -> dict:
+    """Fetch (or revalidate) one repo's latest release; return its cache entry."""
+    url = f"{GITHUB_API}/repos/{repo}/releases/latest"
+    headers = {"User-Agent": "devenv-install", "Accept": "application/vnd.github+json"}
+    if token := os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {token}"
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as resp:
+            data = json.loads(resp.read())
+            etag = resp.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            return {**cached, "fetched": time.time()}
+        if cached:
+            warn(f"{repo}: release lookup failed (HTTP {e.code}), using cached {cached['release']['tag']}")
+            return cached
+        log(f"FAILED (HTTP {e.code}): GET {url}")
+        sys.exit(1)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        if cached:
+            warn(f"{repo}: release lookup failed ({e}), using cached {cached['release']['tag']}")
+            return cached
+        log(f"FAILED ({e}): GET {url}")
+        sys.exit(1)
+    return {"etag": etag, "fetched": time.time(), "release": _parse_release(data)}
+
+
+def _parse_release(data: dict) -> dict:
+    assets = {}
+    for a in data.get("assets", []):
+        digest = a.get("digest") or ""
+        assets[a["name"]] = {
+            "url": a["browser_download_url"],
+            "size": a.get("size"),
+            "sha256": digest.removeprefix("sha256:") if digest.startswith("sha256:") else None,
+        }
+    return {"tag": data["tag_name"], "assets": assets}
+
+
+def fetch_release_asset(repo: str, pattern: str, cancel: threading.Event | None = None) -> Path | None:
+    """Return a local path to the latest release asset of repo matching pattern.
+
+    Artifacts are stored once per SHA-256 under <cache>/artifacts and indexed
+    by "repo@tag/asset", so an unchanged upstream tag is served from disk.
+    Downloads are checked against the size and digest GitHub publishes and are
+    renamed into place only once complete; a failed connection leaves the
+    partial file to be continued next time. Setting `cancel` abandons a
+    download in progress, discarding the partial file and returning None.
+    """
+    release = _github_release(repo)
+    matches = [name for name in release["assets"] if re.search(pattern, name)]
+    if not matches:
+        log(f"FAILED: no asset matching {pattern!r} in {repo} {release['tag']}")
+        sys.exit(1)
+    name = matches[0]
+    asset = release["assets"][name]
+    key = f"{repo}@{release['tag']}/{name}"
+    store = _cache_root() / "artifacts"
+
+    with _cache_lock:
+        entry = _read_json(store / "index.json").get(key)
+    if entry:
+        blob = store / entry["sha256"]
+        if blob.exists() and blob.stat().st_size == entry["size"]:
+            os.utime(blob)  # mark as recently used for LRU eviction
+            log(f"{name} ({release['tag']}) from cache")
+            return blob
+
+    log(f"\033[2m$ GET {asset['url']}\033[0m")
+    downloaded = _download(asset["url"], store, cancel, size=asset["size"])
+    if downloaded is None:
+        log(f"cancelled {name}")
+        return None
+    tmp, sha256, size = downloaded
+    problem = None
+    if asset["sha256"] and sha256 != asset["sha256"]:
+        problem = f"sha256 mismatch: expected {asset['sha256']}, got {sha256}"
+    elif asset["size"] is not None and size != asset["size"]:
+        problem = f"size mismatch: expected {asset['size']}, got {size}"
+    if problem:
+        tmp.unlink(missing_ok=True)
+        log(f"FAILED ({problem}): GET {asset['url']}")
+        sys.exit(1)
+    os.replace(tmp, store / sha256)
+
+    with _cache_lock:
+        index = _read_json(store / "index.json")
+        index[key] = {"sha256": sha256, "size": size}
+        _evict_cache(store, index, keep=sha256)
+        _write_json(store / "index.json", index)
+    log(f"cached {name} ({release['tag']})")
+    return store / sha256
+
+
+_DOWNLOAD_RETRIES = 3  # reconnects before a download fails (segments keep their progress)
+_RETRY_DELAY = 0.5  # seconds before the first reconnect, doubled for each further one
+_SEGMENT_MIN = 8 << 20  # assets at least this big are fetched in parallel Range segments
+_SEGMENTS = 4
+_CHECKPOINT_INTERVAL = 1.0  # seconds between writes of the segment state during a download
+
+
+def _download(
+    url: str, directory: Path, cancel: threading.Event | None = None, size: int | None = None,
+) -> tuple[Path, str, int] | None:
+    """Download url to a partial file in directory and hash it.
+
+    Returns (partial path, sha256, size); the caller verifies and renames it.
+    When the expected `size` is known and at least _SEGMENT_MIN, and the
+    server honours Range requests, the file is fetched in _SEGMENTS parallel
+    segments; otherwise it is streamed in one piece. A dropped connection is
+    retried from where it stopped. If it keeps failing the partial file is
+    kept, and the next download of the same url continues it. Returns None,
+    leaving nothing behind, if `cancel` is set mid-download.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f".partial-{hashlib.sha256(url.encode()).hexdigest()[:16]}"
+    state = tmp.with_name(tmp.name + ".segments")
+    segmented = size is not None and size >= _SEGMENT_MIN and (state.exists() or _accepts_ranges(url))
+    fetch = (lambda: _fetch_segments(url, tmp, state, size, cancel)) if segmented else (lambda: _fetch_stream(url, tmp, cancel))
+    for attempt in range(_DOWNLOAD_RETRIES + 1):
+        try:
+            result = fetch()
+            break
+        except urllib.error.HTTPError as e:
+            if e.code != 416:  # 416: the partial file is stale (e.g. longer than the asset)
+                log(f"FAILED ({e}): GET {url}")
+                sys.exit(1)
+            tmp.unlink(missing_ok=True)
+            state.unlink(missing_ok=True)
+            if attempt == _DOWNLOAD_RETRIES:
+                log(f"FAILED ({e}): GET {url}")
+                sys.exit(1)
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            if attempt == _DOWNLOAD_RETRIES:
+                log(f"FAILED ({e}): GET {url} (partial download kept for --resume)")
+                sys.exit(1)
+            log(f"{e}; reconnecting ({attempt + 1}/{_DOWNLOAD_RETRIES})")
+            time.sleep(_RETRY_DELAY * 2 ** attempt)
+    if cancel is not None and cancel.is_set():
+        tmp.unlink(missing_ok=True)
+        state.unlink(missing_ok=True)
+        return None
+    return result
 
-def warn(msg, diff=None):
-    log(f"WARNING: {msg}")
-    _warnings.append((msg, diff))
 
+def _fetch_stream(url: str, tmp: Path, cancel: threading.Event | None) -> tuple[Path, str, int]:
+    """Stream url into tmp, continuing an existing partial file with a Range request."""
+    digest = hashlib.sha256()
+    size = received = 0
+    headers = {"User-Agent": "devenv-install"}
+    if tmp.exists() and tmp.stat().st_size:
+        headers["Range"] = f"bytes={tmp.stat().st_size}-"
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as resp:
+        resumed = resp.status == 206  # a server ignoring Range sends 200 and the whole file
+        if resumed:
+            with tmp.open("rb") as f:
+                while chunk := f.read(1 << 20):
+                    digest.update(chunk)
+                    size += len(chunk)
+            log(f"resuming partial download at {size} bytes")
+        expected = resp.headers.get("Content-Length")
+        with tmp.open("ab" if resumed else "wb") as out:
+            while chunk := resp.read(1 << 20):
+                if cancel is not None and cancel.is_set():
+                    break
+                out.write(chunk)
+                digest.update(chunk)
+                received += len(chunk)
+    if expected is not None and received < int(expected) and not (cancel is not None and cancel.is_set()):
+        raise ConnectionError(f"connection closed after {size + received} bytes")
+    return tmp, digest.hexdigest(), size + received
+
+
+def _accepts_ranges(url: str) -> bool:
+    """Whether the server answers a one-byte Range request with 206."""
+    req = urllib.request.Request(url, headers={"User-Agent": "devenv-install", "Range": "bytes=0-0"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status == 206
+    except (urllib.error.URLError, OSError, http.client.HTTPException):
+        return False  # the single stream reports the real error
 
-def _config_diff(src, dst):
-    """Compare two config files ignoring whitespace.
-    Returns unified diff string if they differ, None if equivalent."""
-    src_lines = src.read_text().splitlines()
-    dst_lines = dst.read_text().splitlines()
-    if [l.strip() for l in src_lines] == [l.strip() for l in dst_lines]:
-        return None
-    return "\n".join(difflib.unified_diff(
-        dst_lines, src_lines,
-        fromfile=str(dst), tofile=str(src),
-        lineterm="",
-    ))
 
+def _fetch_segments(
+    url: str, tmp: Path, state: Path, size: int, cancel: threading.Event | None,
+) -> tuple[Path, str, int]:
+    """Fetch url into tmp as parallel Range segments, then hash the result.
 
-@contextmanager
-def task(name):
-    global _indent
-    log(f"▶ {name}")
-    _indent += 1
+    Progress per segment ([start, end, bytes written]) is kept in `state`,
+    written at most every _CHECKPOINT_INTERVAL and once the segments stop, so
+    a failed attempt or run continues each segment where it stopped (a killed
+    run at most re-fetches the bytes since the last checkpoint).
+    """
+    progress = _read_json(state)
+    if progress.get("size") != size or not tmp.exists() or tmp.stat().st_size != size:
+        step = -(-size // _SEGMENTS)
+        progress = {"size": size, "segments": [[lo, min(lo + step, size) - 1, 0] for lo in range(0, size, step)]}
+        with tmp.open("wb") as f:
+            f.truncate(size)
+        _write_json(state, progress)
+    else:
+        done = sum(seg[2] for seg in progress["segments"])
+        log(f"resuming partial download at {done} of {size} bytes")
+    lock = threading.Lock()
+    saved = time.monotonic()
+    context = dict(_local.__dict__)  # item prefix, indent and quietness of the calling task
+
+    def fetch(seg: list) -> None:
+        nonlocal saved
+        _local.__dict__.update(context, stack=list(context.get("stack", [])))
+        start, end, _ = seg
+        if start + seg[2] > end:
+            return
+        req = urllib.request.Request(url, headers={"User-Agent": "devenv-install", "Range": f"bytes={start + seg[2]}-{end}"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            if resp.status != 206:
+                raise ConnectionError(f"server ignored Range (HTTP {resp.status})")
+            while chunk := resp.read(min(1 << 20, end + 1 - start - seg[2])):
+                if cancel is not None and cancel.is_set():
+                    return
+                os.pwrite(fd, chunk, start + seg[2])
+                with lock:
+                    seg[2] += len(chunk)
+                    if time.monotonic() - saved >= _CHECKPOINT_INTERVAL:
+                        _write_json(state, progress)
+                        saved = time.monotonic()
+        if start + seg[2] <= end:
+            raise ConnectionError(f"connection closed at byte {start + seg[2]} of segment {start}-{end}")
+
+    fd = os.open(tmp, os.O_WRONLY)
     try:
-        yield
+        with ThreadPoolExecutor(max_workers=len(progress["segments"])) as pool:
+            futures = [pool.submit(fetch, seg) for seg in progress["segments"]]
+        for future in futures:
+            future.result()  # re-raise the first failure; the other segments kept their progress
     finally:
-        _indent -= 1
+        os.close(fd)
+        _write_json(state, progress)
+    if cancel is not None and cancel.is_set():
+        return tmp, "", 0
+    digest = hashlib.sha256()
+    with tmp.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    state.unlink(missing_ok=True)
+    return tmp, digest.hexdigest(), size
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """Write data to path atomically (temp file + rename)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _evict_cache(store: Path, index: dict, keep: str) -> None:
+    """Delete least recently used blobs until the store fits in --cache-max-mb."""
+    limit = _options.cache_max_mb * 1024 * 1024
+    blobs = [
+        (e.stat().st_mtime, e.stat().st_size, e.name)
+        for e in os.scandir(store)
+        if e.is_file() and not e.name.startswith(".") and e.name != "index.json"
+    ]
+    total = sum(size for _, size, _ in blobs)
+    for _, size, sha256 in sorted(blobs):
+        if total <= limit:
+            break
+        if sha256 == keep:
+            continue
+        (store / sha256).unlink(missing_ok=True)
+        total -= size
+    for key in [k for k, v in index.items() if not (store / v["sha256"]).exists()]:
+        del index[key]
 
 
-def _stream_output(proc):
-    prefix = "  " * _indent
-    had_output = False
-    for line in proc.stdout:
-        line = line.rstrip("\n")
-        sys.stdout.write(f"\033[2K\r{prefix}{line}")
-        sys.stdout.flush()
-        if _logfile:
-            _logfile.write(f"{prefix}{line}\n")
-        had_output = True
-    if had_output:
-        sys.stdout.write("\n")
-    proc.wait()
+# ---------------------------------------------------------------------------
+# Offline bundle (--bundle-out / --bundle-in)
+# ---------------------------------------------------------------------------
 
+_BUNDLE_VERSION = 2
+_GIT_CRATES = {"markdown-oxide": "https://github.com/feel-ix-343/markdown-oxide"}  # crates installed from git
+_SCRIPT_CRATES = {"cargo-binstall": "cargo-binstall"}  # script-installed items bundled as crate binaries
+_RUSTUP_COMPONENTS = {"rust-analyzer": "rust-analyzer"}  # rustup items other than the toolchain itself
+_RUSTUP_INIT = "curl --proto '=https' --tlsv1.2 -sSf https://sh.rustup.rs"
 
-def run(cmd):
-    log(f"\033[2m$ {cmd}\033[0m")
-    proc = subprocess.Popen(
-        cmd, shell=True, text=True,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-    )
-    _stream_output(proc)
-    if proc.returncode != 0:
-        log(f"FAILED (exit {proc.returncode}): {cmd}")
-        sys.exit(1)
 
+@dataclass
+class Bundle:
+    """An unpacked, verified offline bundle that installers read from instead of the network."""
+    root: Path
+    manifest: dict
 
-def _sudo_popen(cmd: str) -> subprocess.Popen:
-    """Open a privileged subprocess with stdin configured. Caller must close stdin."""
-    if os.geteuid() == 0:
-        full = cmd
+
+_bundle: Bundle | None = None
+
+
+def _item_crate(item: InstallItem) -> str | None:
+    return item.crate or (item.id if item.id in _GIT_CRATES else None) or _SCRIPT_CRATES.get(item.id)
+
+
+def build_bundle(items: list[InstallItem], selected: set[str], out: Path) -> None:
+    """Gather everything the selected items download into one .tar.gz with a manifest.
+
+    Runs on a connected machine of the same distribution and architecture as
+    the offline hosts. Bundled: apt packages with their dependency closure (as
+    a flat repository), GitHub release assets, prebuilt crate binaries
+    (cargo-binstall included), a rustup toolchain with the selected
+    components, uv tool wheels and the uv binary.
+    """
+    chosen = [item for item in items if item.id in selected]
+    unknown = [item.id for item in chosen if _backend(item) == "script" and item.id not in _SCRIPT_CRATES]
+    if unknown:
+        log(f"FAILED: no way to bundle script-installed {', '.join(unknown)}")
+        sys.exit(1)
+    manifest = {
+        "version": _BUNDLE_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "arch": platform.machine(),
+        "codename": _os_release().get("VERSION_CODENAME"),
+        "items": [item.id for item in chosen],
+        "apt": sorted({pkg for item in chosen for pkg in item.apt}),
+        "releases": {}, "artifacts": {}, "crates": {}, "uv": {}, "rust": None,
+    }
+    with tempfile.TemporaryDirectory(prefix="devenv-bundle-") as tmp:
+        root = Path(tmp) / "bundle"
+        root.mkdir()
+        if manifest["apt"]:
+            with task("apt packages"):
+                _bundle_apt(root / "apt", manifest["apt"])
+        if any(_backend(item) == "rustup" for item in chosen):
+            with task("Rust toolchain"):
+                components = sorted(_RUSTUP_COMPONENTS[i.id] for i in chosen if i.id in _RUSTUP_COMPONENTS)
+                _bundle_rust(root / "rust", components)
+                manifest["rust"] = {"components": components}
+        for item in chosen:
+            if item.github and item.asset:
+                with task(f"{item.id} release asset"):
+                    blob = fetch_release_asset(item.github, item.asset)
+                    release = _github_release(item.github)
+                    name = next(n for n in release["assets"] if re.search(item.asset, n))
+                    (root / "artifacts").mkdir(exist_ok=True)
+                    shutil.copyfile(blob, root / "artifacts" / blob.name)
+                    manifest["releases"][item.github] = release
+                    manifest["artifacts"][f"{item.github}@{release['tag']}/{name}"] = {"sha256": blob.name, "size": blob.stat().st_size}
+            if crate := _item_crate(item):
+                with task(f"{crate} binaries"):
+                    ensure_cargo_binstall()
+                    dest = root / "crates" / crate
+                    git = f"--git {shlex.quote(_GIT_CRATES[crate])} " if crate in _GIT_CRATES else ""
+                    run(f"cargo binstall --no-confirm --no-track --install-path {shlex.quote(str(dest))} {git}{crate}")
+                    manifest["crates"][crate] = sorted(f.name for f in dest.iterdir())
+            if item.uv:
+                with task(f"{item.uv} wheels"):
+                    manifest["uv"][item.uv] = _bundle_uv_tool(root, item.uv, Path(tmp))
+        if manifest["uv"]:
+            uv = shutil.which("uv")
+            if uv is None:
+                log("FAILED: uv is needed to bundle uv tools")
+                sys.exit(1)
+            (root / "bin").mkdir(exist_ok=True)
+            shutil.copy2(uv, root / "bin" / "uv")
+        manifest["files"] = {
+            str(path.relative_to(root)): _file_sha256(path)
+            for path in sorted(root.rglob("*")) if path.is_file() and not path.is_symlink()
+        }
+        _write_json(root / "bundle.json", manifest)
+        with task(f"writing {out}"):
+            out.parent.mkdir(parents=True, exist_ok=True)
+            partial = out.with_name(f".{out.name}.tmp")
+            with tarfile.open(partial, "w:gz", compresslevel=6) as tar:
+                tar.add(root, arcname=".")
+            os.replace(partial, out)
+            log(f"{len(manifest['files'])} files, {out.stat().st_size / 1e6:.1f} MB")
+
+
+def _bundle_apt(repo: Path, packages: list[str]) -> None:
+    """Download packages and their dependency closure into a flat apt repository."""
+    apt_update()
+    closure = _capture([
+        "apt-cache", "depends", "--recurse", "--no-recommends", "--no-suggests",
+        "--no-conflicts", "--no-breaks", "--no-replaces", "--no-enhances", *packages,
+    ])
+    names = sorted({line.strip() for line in closure.splitlines() if line[:1].isalnum()})
+    if not names:
+        log(f"FAILED: apt-cache knows none of {' '.join(packages)}")
+        sys.exit(1)
+    log(f"{len(names)} packages including dependencies")
+    repo.mkdir(parents=True)
+    run(f"cd {shlex.quote(str(repo))} && apt-get download -qq {' '.join(names)}")
+    stanzas = []
+    for deb in sorted(repo.glob("*.deb")):
+        control = _capture(["dpkg-deb", "-f", str(deb)]).rstrip("\n")
+        stanzas.append(f"{control}\nFilename: ./{deb.name}\nSize: {deb.stat().st_size}\nSHA256: {_file_sha256(deb)}\n")
+    index = "\n".join(stanzas)
+    (repo / "Packages").write_text(index)
+    (repo / "Release").write_text(
+        "Origin: devenv-bundle\nLabel: devenv-bundle\n"
+        f"Date: {time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime())}\n"
+        f"SHA256:\n {hashlib.sha256(index.encode()).hexdigest()} {len(index.encode())} Packages\n"
+    )
+
+
+def _bundle_rust(rust: Path, components: list[str]) -> None:
+    """Install a toolchain with rustup-init into rust/cargo and rust/rustup (CARGO_HOME, RUSTUP_HOME)."""
+    cargo, rustup = rust / "cargo", rust / "rustup"
+    extra = "".join(f" -c {c}" for c in components)
+    run(f"{_RUSTUP_INIT} | CARGO_HOME={shlex.quote(str(cargo))} RUSTUP_HOME={shlex.quote(str(rustup))}"
+        f" sh -s -- -y --no-modify-path{extra}")
+    for env in cargo.glob("env*"):  # shell snippets naming the staging path; ~/.profile is set up instead
+        env.unlink()
+
+
+def _bundle_uv_tool(root: Path, package: str, scratch: Path) -> str:
+    """Fill the bundle's uv cache with package (at its pin, if any) and return the version."""
+    pin = _uv_pins().get(package)
+    spec = f"{package}=={pin}" if pin else package
+    target = scratch / f"uv-{package}"
+    run(f"UV_CACHE_DIR={shlex.quote(str(root / 'uv'))} uv pip install --quiet --target {shlex.quote(str(target))} {spec}")
+    dist = re.sub(r"[-_.]+", "_", package).lower()
+    found = sorted(target.glob(f"{dist}-*.dist-info"))
+    if not found:
+        log(f"FAILED: {package} was not installed into {target}")
+        sys.exit(1)
+    return found[0].name.removesuffix(".dist-info").split("-", 1)[1]
+
+
+def read_bundle_manifest(path: Path) -> dict:
+    """Read bundle.json from a bundle archive without unpacking it."""
+    try:
+        with tarfile.open(path) as tar:
+            return json.load(tar.extractfile("./bundle.json"))
+    except (OSError, KeyError, tarfile.TarError, ValueError) as e:
+        log(f"FAILED: {path} is not a devenv bundle ({e})")
+        sys.exit(1)
+
+
+def open_bundle(path: Path) -> Bundle:
+    """Unpack and verify a bundle, then seed the download caches from it.
+
+    Release metadata and assets go into the usual caches, so the GitHub
+    installers find them there. apt gets a repository of its own (see
+    _apt_sources), crates and uv tools are read from the bundle by binstall()
+    and uv_tool_install(), and a missing uv is installed from it.
+    """
+    root = _cache_root() / "bundle"
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    with tarfile.open(path) as tar:
+        tar.extractall(root, filter="data")
+    manifest = _read_json(root / "bundle.json")
+    if manifest.get("version") != _BUNDLE_VERSION:
+        log(f"FAILED: {path} has bundle version {manifest.get('version')}, expected {_BUNDLE_VERSION}")
+        sys.exit(1)
+    if manifest["arch"] != platform.machine():
+        log(f"FAILED: {path} was built for {manifest['arch']}, this machine is {platform.machine()}")
+        sys.exit(1)
+    corrupt = [rel for rel, sha in manifest["files"].items() if _file_sha256(root / rel) != sha]
+    if corrupt:
+        log(f"FAILED: {path} is corrupt: {', '.join(corrupt)}")
+        sys.exit(1)
+    codename = _os_release().get("VERSION_CODENAME")
+    if manifest["apt"] and codename != manifest["codename"]:
+        warn(f"bundle was built on {manifest['codename']}, this machine runs {codename}; apt packages may not install")
+
+    store = _cache_root() / "artifacts"
+    store.mkdir(parents=True, exist_ok=True)
+    with _cache_lock:
+        index = _read_json(store / "index.json")
+        for key, entry in manifest["artifacts"].items():
+            if not (store / entry["sha256"]).exists():
+                shutil.copyfile(root / "artifacts" / entry["sha256"], store / entry["sha256"])
+            index[key] = entry
+        _write_json(store / "index.json", index)
+        releases = _read_json(_cache_root() / "releases.json")
+        for repo, release in manifest["releases"].items():
+            releases[repo] = {"etag": None, "fetched": time.time(), "release": release}
+        _write_json(_cache_root() / "releases.json", releases)
+    _options.release_ttl = 10 * 365 * 24 * 60 * 60  # the bundled releases are the ones to install
+
+    if manifest["apt"]:
+        (root / "apt" / "lists" / "partial").mkdir(parents=True, exist_ok=True)
+        (root / "apt" / "sources.list").write_text(f"deb [trusted=yes] file:{root / 'apt'} ./\n")
+    if manifest["uv"] and not is_installed("uv"):
+        _install_file(root / "bin" / "uv", Path.home() / ".local" / "bin" / "uv")
+        _add_to_path(Path.home() / ".local" / "bin")
+        log("installed uv from the bundle")
+    log(f"{len(manifest['items'])} items, built {manifest['created_at']}")
+    return Bundle(root, manifest)
+
+
+def bundle_selection(selected: set[str]) -> set[str]:
+    """Check that the bundle holds every item of a resolved selection."""
+    missing = selected - set(_bundle.manifest["items"])
+    if missing:
+        log(f"FAILED: not in the bundle: {', '.join(sorted(missing))}")
+        sys.exit(1)
+    return selected
+
+
+def _install_bundled_rust() -> None:
+    """Copy the bundled toolchain to ~/.cargo and ~/.rustup, where rustup-init would have put it."""
+    for name in ("cargo", "rustup"):
+        shutil.copytree(_bundle.root / "rust" / name, Path.home() / f".{name}",
+                        symlinks=True, dirs_exist_ok=True, copy_function=_link_or_copy)
+    _add_to_path(Path.home() / ".cargo" / "bin")
+    _profile_path("$HOME/.cargo/bin")
+    log(f"Rust toolchain installed from the bundle ({', '.join(_bundle.manifest['rust']['components']) or 'no extra components'})")
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hard-link from the unpacked bundle when possible; rustup's proxies are one binary linked many times."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _install_bundled_crate(crate: str) -> None:
+    cargo_bin = Path.home() / ".cargo" / "bin"
+    for name in _bundle.manifest["crates"][crate]:
+        _install_file(_bundle.root / "crates" / crate / name, cargo_bin / name)
+        _probe.record(cargo_bin / name)
+    _add_to_path(cargo_bin)
+    _profile_path("$HOME/.cargo/bin")
+    log(f"{crate} installed from the bundle")
+
+
+def _install_file(src: Path, dst: Path) -> None:
+    """Copy an executable beside dst then rename, so a half-written binary is never on PATH."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    shutil.copyfile(src, tmp)
+    tmp.chmod(0o755)
+    os.replace(tmp, dst)
+
+
+def _add_to_path(directory: Path) -> None:
+    if str(directory) not in os.environ["PATH"].split(":"):
+        os.environ["PATH"] = f"{directory}:{os.environ['PATH']}"
+
+
+def _apt_sources() -> str:
+    """apt-get options that limit apt to the bundle's repository (--bundle-in), else ""."""
+    if _bundle is None:
+        return ""
+    apt = _bundle.root / "apt"
+    return (f" -o Dir::Etc::SourceList={apt / 'sources.list'} -o Dir::Etc::SourceParts=/dev/null"
+            f" -o Dir::State::Lists={apt / 'lists'}")
+
+
+def _os_release() -> dict[str, str]:
+    try:
+        lines = Path("/etc/os-release").read_text().splitlines()
+    except OSError:
+        return {}
+    return {k: v.strip('"') for k, _, v in (line.partition("=") for line in lines) if v}
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Fleet mode (--targets)
+# ---------------------------------------------------------------------------
+
+_FLEET_DIR = ".cache/devenv/setup"  # where targets receive the installer, relative to their HOME
+_FLEET_FILES = ["install.py", "bootstrap_inst.sh", "resources"]
+
+
+@dataclass
+class Target:
+    """A machine provisioned in fleet mode, reached through a transport.
+
+    ssh: `ssh host` (passwordless sudo or root on the target);
+    incus: `incus exec name` (runs as root); local: a subprocess on this
+    machine with HOME set to a directory, a stand-in for tests and dry runs.
+    """
+    kind: str
+    address: str
+
+    @property
+    def name(self) -> str:
+        return self.address if self.kind == "ssh" else f"{self.kind}:{self.address}"
+
+    def shell(self, script: str) -> str:
+        """Command line that runs `script` with sh on the target."""
+        if self.kind == "ssh":
+            return f"ssh -o BatchMode=yes {shlex.quote(self.address)} {shlex.quote(script)}"
+        if self.kind == "incus":
+            return f"incus exec {shlex.quote(self.address)} -- sh -c {shlex.quote(script)}"
+        return f"env HOME={shlex.quote(self.address)} sh -c {shlex.quote(script)}"
+
+
+def parse_target(spec: str) -> Target:
+    """`ssh:host`, `incus:name`, `local:DIR`, or a bare host for ssh."""
+    kind, sep, address = spec.partition(":")
+    if not sep:
+        kind, address = "ssh", spec
+    if kind not in ("ssh", "incus", "local") or not address:
+        raise argparse.ArgumentTypeError(f"invalid target {spec!r} (use ssh:HOST, incus:NAME or local:DIR)")
+    return Target(kind, address)
+
+
+def fleet_command(selected: set[str], items: list[InstallItem]) -> str:
+    """Script run on each target: the pushed installer with this run's selection."""
+    ids = [item.id for item in items if item.id in selected]
+    args = ["--only", *ids, "--jobs", str(_options.jobs)]
+    if _options.refresh_apt:
+        args.append("--refresh-apt")
+    if _options.force:
+        args.append("--force")
+    return f'cd "$HOME/{_FLEET_DIR}" && ./bootstrap_inst.sh {shlex.join(args)}'
+
+
+def run_fleet(targets: list[Target], command: str, jobs: int) -> list[dict]:
+    """Push the installer to every target and run `command` there, up to `jobs` targets at once.
+
+    Each target's output is prefixed with its name, like a parallel item.
+    Returns one result per target, in target order.
+    """
+    unpack = f'mkdir -p "$HOME/{_FLEET_DIR}" && tar -xzf - -C "$HOME/{_FLEET_DIR}"'
+    pack = f"tar -C {shlex.quote(str(SCRIPT_DIR))} -czf - {' '.join(_FLEET_FILES)}"
+    depth = _depth()
+
+    def provision(target: Target) -> dict:
+        _local.indent = depth
+        _local.item = target.name
+        start = time.monotonic()
+        stage, rc = "push", _run_stream(f"{pack} | {target.shell(unpack)}")
+        if rc == 0:
+            stage, rc = "install", _run_stream(target.shell(command))
+        seconds = time.monotonic() - start
+        log("done" if rc == 0 else f"FAILED during {stage} (exit {rc})")
+        return {"target": target.name, "ok": rc == 0, "stage": stage, "rc": rc, "seconds": round(seconds, 3)}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(provision, targets))
+
+
+def print_fleet_summary(results: list[dict]) -> None:
+    log("")
+    log("Fleet summary (slowest first):")
+    width = max(len(r["target"]) for r in results)
+    for r in sorted(results, key=lambda r: r["seconds"], reverse=True):
+        status = "ok" if r["ok"] else f"FAILED ({r['stage']}, exit {r['rc']})"
+        log(f"  {r['target']:<{width}}  {r['seconds']:8.1f}s  {status}")
+    failed = sum(not r["ok"] for r in results)
+    log(f"{len(results) - failed} passed, {failed} failed, {len(results)} target(s)")
+
+
+# ---------------------------------------------------------------------------
+# Speculative prefetch
+# ---------------------------------------------------------------------------
+
+class Prefetcher:
+    """Safe background work done while the selection menu is on screen.
+
+    Refreshes stale apt lists (only when sudo needs no password), resolves
+    GitHub release metadata and downloads release assets of selected items
+    into the artifact cache. Nothing is installed; the real install reuses the
+    results through the usual caches. Deselecting an item cancels its download.
+    Background work never logs to the terminal and its failures are ignored —
+    the real install repeats and reports anything that did not complete.
+    """
+
+    _NOTICE_AFTER = 0.5  # seconds finish() waits silently before saying what it waits for
+
+    def __init__(self, items: list[InstallItem]):
+        self._items = items
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        self._futures: list[tuple[str, Future]] = []
+        self._downloads: dict[str, tuple[threading.Event, Future]] = {}
+        self._cancelled: dict[str, Future] = {}  # item id -> cancelled download, possibly still running
+        self._lock = threading.Lock()
+        self._resolved = None
+
+    def start(self, selected: set[str]) -> None:
+        chosen = [item for item in self._items if item.id in selected]
+        if any(item.apt for item in chosen):
+            self._submit("apt update", _prefetch_apt_update)
+        repos = [item.github for item in chosen if item.github and not is_installed(item.bin)]
+        if repos:
+            self._resolved = self._submit("release metadata", resolve_releases, repos)
+        self.update(selected)
+
+    def update(self, selected: set[str]) -> None:
+        """Start downloads for newly selected items and cancel deselected ones."""
+        with self._lock:
+            for item in self._items:
+                if not (item.github and item.asset):
+                    continue
+                if item.id in selected and item.id not in self._downloads:
+                    if is_installed(item.bin):
+                        continue
+                    cancel = threading.Event()
+                    # A cancelled download of the same asset cleans up its partial file when it
+                    # stops; the new one must not start writing that file before then.
+                    previous = self._cancelled.pop(item.id, None)
+                    future = self._submit(item.id, self._download, item, cancel, previous)
+                    self._downloads[item.id] = (cancel, future)
+                elif item.id not in selected and item.id in self._downloads:
+                    cancel, future = self._downloads.pop(item.id)
+                    cancel.set()
+                    self._cancelled[item.id] = future
+
+    def finish(self, selected: set[str]) -> None:
+        """Cancel work for items not in selected and wait for the rest, saying what it waits for."""
+        self.update(selected)
+        _, pending = wait([f for _, f in self._futures], timeout=self._NOTICE_AFTER)
+        if pending:
+            labels = [label for label, f in self._futures if f in pending]
+            print(f"Waiting for background work: {', '.join(labels)}", flush=True)
+            wait(pending)
+        self._pool.shutdown()
+
+    def abort(self) -> None:
+        """Cancel everything without waiting; work that cannot be interrupted finishes on its own."""
+        with self._lock:
+            for cancel, _ in self._downloads.values():
+                cancel.set()
+            self._downloads.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _download(self, item: InstallItem, cancel: threading.Event, previous: Future | None) -> None:
+        wait([f for f in (self._resolved, previous) if f is not None])
+        if not cancel.is_set():
+            fetch_release_asset(item.github, item.asset, cancel)
+
+    def _submit(self, label: str, fn, *args) -> Future:
+        def quietly():
+            _local.quiet = True
+            try:
+                return fn(*args)
+            except BaseException:  # incl. SystemExit from run()/fetch failures
+                return None
+        future = self._pool.submit(quietly)
+        self._futures.append((label, future))
+        return future
+
+
+def _prefetch_apt_update() -> None:
+    """Refresh stale apt lists without prompting; mark apt_update() as done on success."""
+    age = _apt_lists_age()
+    if _apt_state.updated or (not _options.refresh_apt and age is not None and age < _options.apt_ttl):
+        return
+    cmd = "DEBIAN_FRONTEND=noninteractive apt-get update -qq"
+    if os.geteuid() != 0:
+        cmd = f"sudo -n env {cmd}"
+    if subprocess.run(cmd, shell=True, capture_output=True).returncode == 0:
+        _apt_state.updated = True
+
+
+# ---------------------------------------------------------------------------
+# TUI helpers (module-level for testability)
+# ---------------------------------------------------------------------------
+
+def _selection_id(node_id: str, is_group: bool) -> str:
+    return f"__group_{node_id}__" if is_group else node_id
+
+
+@dataclass
+class MenuIndex:
+    """The menu tree flattened in one depth-first pass.
+
+    rows lists (selection id, label, depth) in display order. subtree maps a
+    node to the selection ids of its descendants in display order, ancestors
+    to those of its ancestors, immediate parent first.
+    """
+    rows: list[tuple[str, str, int]]
+    subtree: dict[str, tuple[str, ...]]
+    ancestors: dict[str, tuple[str, ...]]
+
+
+def _menu_index(children_of: dict) -> MenuIndex:
+    index = MenuIndex([], {}, {})
+
+    def visit(node_id: str, is_group: bool, path: tuple[str, ...]) -> None:
+        sid = _selection_id(node_id, is_group)
+        start = len(index.rows)
+        index.rows.append((sid, node_id, len(path)))
+        index.ancestors[node_id] = path
+        for child_id, child_is_group in children_of.get(node_id, []):
+            visit(child_id, child_is_group, (sid, *path))
+        index.subtree[node_id] = tuple(row[0] for row in index.rows[start + 1:])
+
+    for node_id, is_group in children_of.get(None, []):
+        visit(node_id, is_group, ())
+    return index
+
+
+# ---------------------------------------------------------------------------
+# TUI
+# ---------------------------------------------------------------------------
+
+def run_selection_menu(
+    graph: DepGraph,
+    on_change: Callable[[set[str]], None] | None = None,
+) -> set[str] | None:
+    """Display the interactive selection menu.
+
+    Returns the user_selected set on confirmation, or None if the user aborted.
+    on_change, if given, is called with the user_selected set after every toggle.
+    """
+    from textual.app import App, ComposeResult
+    from textual.binding import Binding
+    from textual.widgets import Footer, Header, SelectionList, Static
+    from textual.widgets.selection_list import Selection
+
+    menu = _menu_index(graph.children)
+
+    def _make_selections() -> list[Selection]:
+        entries = []
+        for sid, node_id, depth in menu.rows:
+            indent = "  " * depth
+            label = f"[bold]\\[{node_id}][/bold]" if sid.startswith("__group_") else node_id
+            entries.append(Selection(f"{indent}{label}", sid, initial_state=True))
+        return entries
+
+    class InstallerApp(App):
+        BINDINGS = [
+            Binding("enter",  "confirm",      "Install",  show=True,  priority=True),
+            Binding("q",      "quit_abort",   "Quit",     show=True),
+            Binding("escape", "quit_abort",   "Quit",     show=False),
+            Binding("j",      "cursor_down",  "Down",     show=False),
+            Binding("k",      "cursor_up",    "Up",       show=False),
+            Binding("h",      "cursor_up",    "Up",       show=False),
+            Binding("l",      "cursor_down",  "Down",     show=False),
+        ]
+        CSS = """
+        SelectionList { height: 1fr; border: solid $accent; }
+        Header { height: 1; }
+        #hints { padding: 0 1; color: $text-muted; }
+        """
+
+        def __init__(self):
+            super().__init__()
+            self._result: set[str] | None = None
+            self._user_selected: set[str] = set(graph.items)
+
+        def compose(self) -> ComposeResult:
+            yield Header(show_clock=False)
+            yield SelectionList(*_make_selections(), id="menu")
+            yield Static("space/click toggle  ↑↓/jk navigate  enter install  q quit", id="hints")
+            yield Footer()
+
+        def on_mount(self) -> None:
+            self.title = "Dev Environment Setup"
+
+        def on_selection_list_selection_toggled(
+            self, event: SelectionList.SelectionToggled
+        ) -> None:
+            sid = str(event.selection.value)
+            sl: SelectionList = self.query_one("#menu")
+            current = set(sl.selected)
+            new_state = sid in current
+            node_id = sid.removeprefix("__group_").removesuffix("__") if sid.startswith("__group_") else sid
+
+            # Mirror the new state down the subtree; turning a node on also turns on its ancestors.
+            targets = menu.subtree[node_id] + (menu.ancestors[node_id] if new_state else ())
+            changed = [t for t in targets if (t in current) != new_state]
+            # select/deselect each post SelectedChanged and refresh; apply them as one update
+            with self.batch_update(), sl.prevent(SelectionList.SelectedChanged):
+                for t in changed:
+                    if new_state:
+                        sl.select(t)
+                    else:
+                        sl.deselect(t)
+
+            for t in (sid, *changed):
+                if t in graph.items:
+                    if new_state:
+                        self._user_selected.add(t)
+                    else:
+                        self._user_selected.discard(t)
+            if on_change is not None:
+                on_change(set(self._user_selected))
+
+        def action_confirm(self) -> None:
+            self._result = set(self._user_selected)
+            self.exit()
+
+        def action_quit_abort(self) -> None:
+            self._result = None
+            self.exit()
+
+        def action_cursor_down(self) -> None:
+            self.query_one("#menu", SelectionList).action_cursor_down()
+
+        def action_cursor_up(self) -> None:
+            self.query_one("#menu", SelectionList).action_cursor_up()
+
+    app = InstallerApp()
+    app.run()
+    return app._result
+
+
+# ---------------------------------------------------------------------------
+# Utilities
+# ---------------------------------------------------------------------------
+
+_local = threading.local()  # per-thread indent and, in parallel runs, item id
+_out_lock = threading.Lock()
+_apt_lock = threading.Lock()
+_git_config_lock = threading.Lock()  # git takes ~/.gitconfig.lock and fails rather than waits
+_APT_INSTALL = "DEBIAN_FRONTEND=noninteractive apt-get install -y -qq"
+# apt already pipelines and fetches from each host in parallel; retry a dropped .deb instead of failing the batch
+_APT_RETRIES = "-o Acquire::Retries=3"
+
+
+@dataclass
+class _AptState:
+    present: set[str] = field(default_factory=set)  # known installed, not by the batch
+    batched: set[str] = field(default_factory=set)  # installed by install_apt_batch()
+    updated: bool = False  # apt_update() has run (or been skipped as fresh)
+
+
+_apt_state = _AptState()
+_APT_LISTS = Path("/var/lib/apt/lists")
+
+
+@dataclass
+class _BinstallBatch:
+    crates: list[str] = field(default_factory=list)
+    returncode: int | None = None  # None until the shared invocation has run
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_binstall_batch = _BinstallBatch()
+_password = None
+_warnings = []
+_spans: list[dict] = []  # timed tasks and commands, see _timed()
+_span_threads: dict[int, tuple[int, str]] = {}  # thread ident -> (trace tid, name)
+_spans_lock = threading.Lock()
+_ansi_re = re.compile(r"\033\[[0-9;]*m")  # strip ANSI escapes for log file
+SCRIPT_DIR = Path(__file__).resolve().parent
+UV_PINS = SCRIPT_DIR / "resources" / "uv-tools.toml"
+
+
+def _depth() -> int:
+    return getattr(_local, "indent", 0)
+
+
+def _prefix() -> str:
+    item = getattr(_local, "item", None)
+    return "  " * _depth() + (f"[{item}] " if item else "")
+
+
+def _emit(kind: str, **fields) -> None:
+    """Send an event from the calling thread's current task to every sink."""
+    if getattr(_local, "quiet", False):
+        return
+    _events.emit({
+        "ts": time.time(), "kind": kind,
+        "path": list(getattr(_local, "stack", [])), "item": getattr(_local, "item", None),
+        "prefix": _prefix(), "stream": threading.get_ident(), **fields,
+    })
+
+
+def log(msg):
+    _emit("log", text=msg)
+
+
+class TerminalSink:
+    """Log lines to stdout; command output through the live renderer."""
+
+    def write(self, event: dict) -> None:
+        kind, prefix = event["kind"], event["prefix"]
+        if kind == "output":
+            _renderer.update(event["stream"], prefix + event["text"])
+        elif kind == "output_end":
+            _renderer.finish(event["stream"])
+        elif kind in _TEXT_EVENTS:
+            _renderer.clear()
+            for line in _event_text(event).splitlines():
+                sys.stdout.write(f"{prefix}{line}\n")
+
+    def flush(self) -> None:
+        sys.stdout.flush()
+
+
+class LogFileSink:
+    """Plain-text install.log: every log line and every output line, without ANSI."""
+
+    def __init__(self, path: Path):
+        self.file = path.open("w")
+
+    def write(self, event: dict) -> None:
+        if event["kind"] == "output":
+            self.file.write(_ansi_re.sub("", f"{event['prefix']}{event['text']}") + "\n")
+        elif event["kind"] in _TEXT_EVENTS:
+            for line in _ansi_re.sub("", _event_text(event)).splitlines():
+                self.file.write(f"{event['prefix']}{line}\n")
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JsonlSink:
+    """install.jsonl: one structured event per line for log indexing."""
+
+    def __init__(self, path: Path):
+        self.file = path.open("w")
+
+    def write(self, event: dict) -> None:
+        if event["kind"] == "output_end":
+            return
+        record = {k: v for k, v in event.items() if k not in ("prefix", "stream")}
+        if "text" in record:
+            record["text"] = _ansi_re.sub("", record["text"])
+        self.file.write(json.dumps(record) + "\n")
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+_TEXT_EVENTS = {"log", "warn", "task", "cmd"}
+
+
+def _event_text(event: dict) -> str:
+    """The line(s) an event shows on the terminal and in install.log."""
+    kind = event["kind"]
+    if kind == "warn":
+        return f"WARNING: {event['text']}"
+    if kind == "task":
+        return f"▶ {event['task']}"
+    if kind == "cmd":
+        return f"\033[2m$ {event['cmd']}\033[0m"
+    return event["text"]
+
+
+class EventLog:
+    """Fans task, log, warn and command events out to sinks.
+
+    Until start() events are written inline on the calling thread (menu,
+    --plan, tests). Once started, emit() only enqueues and a background
+    writer drains the queue in batches, so a thread streaming output never
+    waits on disk or terminal I/O. Events keep their emission order.
+    """
+
+    BATCH = 512
+
+    def __init__(self):
+        self.sinks: list = [TerminalSink()]
+        self.queue: queue.SimpleQueue | None = None
+        self.thread = None
+
+    def emit(self, event: dict) -> None:
+        if self.queue is None:
+            with _out_lock:
+                self._write([event])
+            return
+        self.queue.put(event)
+
+    def _write(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        for sink in self.sinks:
+            for event in batch:
+                sink.write(event)
+            sink.flush()
+
+    def start(self, *sinks) -> None:
+        self.sinks.extend(sinks)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch, waiters = [], []
+            item = self.queue.get()
+            while True:
+                # flush() enqueues a threading.Event, set once everything before it is written.
+                (waiters if isinstance(item, threading.Event) else batch).append(item)
+                if len(batch) >= self.BATCH:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                with _out_lock:
+                    self._write(batch)
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+
+    def flush(self) -> None:
+        """Wait until every event emitted so far has been written (e.g. before a prompt)."""
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        self.flush()
+        for sink in [s for s in self.sinks if hasattr(s, "close")]:
+            sink.close()
+            self.sinks.remove(sink)
+
+
+_events = EventLog()
+
+
+class LiveRenderer:
+    """Latest output line of each running command, repainted at a fixed frame rate.
+
+    Streamed output only replaces a task's line; a background thread redraws
+    the region below the log at most `hz` times a second, in one write per
+    frame. log() clears the region before printing and the next frame
+    redraws it. Without a terminal (CI logs) nothing is drawn and every line
+    is printed as it arrives. Callers hold `_out_lock`.
+    """
+
+    def __init__(self, hz: float = 15, stream=None):
+        self.hz = hz
+        self.stream = stream  # None: sys.stdout at the time of writing
+        self.lines: dict[int, str] = {}  # stream key -> latest line
+        self.drawn = 0
+        self.dirty = False
+        self.thread = None
+
+    def _out(self):
+        return self.stream or sys.stdout
+
+    def _tty(self) -> bool:
+        try:
+            return self._out().isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    def update(self, key: int, text: str) -> None:
+        # A progress bar redraws with \r: only its last state is shown.
+        line = _ansi_re.sub("", text).rsplit("\r", 1)[-1]
+        if not self._tty():
+            self._out().write(line + "\n")
+            self._out().flush()
+            return
+        self.lines[key] = line
+        self.dirty = True
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="renderer", daemon=True)
+            self.thread.start()
+
+    def finish(self, key: int) -> None:
+        self.lines.pop(key, None)
+        if not self._tty():
+            return
+        if not self.lines:
+            self.clear()
+        else:
+            self.dirty = True
+
+    def clear(self) -> None:
+        if self.drawn:
+            self._out().write(f"\033[{self.drawn}F\033[J")
+            self._out().flush()
+            self.drawn = 0
+        self.dirty = bool(self.lines)
+
+    def paint(self) -> None:
+        width = max(shutil.get_terminal_size().columns - 1, 10)
+        frame = f"\033[{self.drawn}F\033[J" if self.drawn else ""
+        frame += "".join(f"{text[:width]}\n" for text in self.lines.values())
+        self._out().write(frame)
+        self._out().flush()
+        self.drawn = len(self.lines)
+        self.dirty = False
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(1 / self.hz)
+            with _out_lock:
+                if self.dirty:
+                    self.paint()
+
+
+_renderer = LiveRenderer()
+
+
+def warn(msg, diff=None):
+    _emit("warn", text=msg)
+    if not getattr(_local, "quiet", False):  # background prefetch; the real install reports it
+        _warnings.append((msg, diff))
+
+
+def _config_diff(src, dst):
+    """Compare two config files ignoring whitespace around each line.
+
+    Streams both files and stops at the first differing line. Returns None
+    if they are equivalent, otherwise a ConfigDiff that builds the unified
+    diff only when it is printed.
+    """
+    with open(src) as a, open(dst) as b:
+        for x, y in itertools.zip_longest(a, b):
+            if x is None or y is None or x.strip() != y.strip():
+                return ConfigDiff(src, dst)
+    return None
+
+
+class ConfigDiff:
+    """A difference between two config files, rendered on demand.
+
+    Only the paths are kept; the files are read again when the warnings are
+    printed, and at most `limit` diff lines are generated.
+    """
+
+    def __init__(self, src, dst):
+        self.src, self.dst = src, dst
+
+    def lines(self, limit: int | None = None) -> list[str]:
+        diff = difflib.unified_diff(
+            self.dst.read_text().splitlines(), self.src.read_text().splitlines(),
+            fromfile=str(self.dst), tofile=str(self.src),
+            lineterm="",
+        )
+        out = list(itertools.islice(diff, limit))
+        if limit is not None and next(diff, None) is not None:
+            out.append(f"... (truncated at {limit} lines; --diff-lines 0 shows all)")
+        return out
+
+    def __str__(self):
+        return "\n".join(self.lines())
+
+
+@contextmanager
+def task(name):
+    _emit("task", task=name)
+    _local.indent = _depth() + 1
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(name)
+    start, ok = time.monotonic(), False
+    path = " / ".join(stack)
+    try:
+        with _timed(name, "task"):
+            yield
+        ok = True
+    finally:
+        item = getattr(_local, "item", None)
+        if ok:
+            _journal.step_done(f"{item}: {path}" if item else path)
+        else:
+            _journal.step_failed(item, path)
+        stack.pop()
+        _local.indent = _depth() - 1
+        _emit("task_end", task=name, ok=ok, dur=round(time.monotonic() - start, 3))
+
+
+@contextmanager
+def _timed(name, cat):
+    """Record a span (monotonic clock) for the timing summary and --trace."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        end = time.monotonic()
+        thread = threading.current_thread()
+        with _spans_lock:
+            tid = _span_threads.setdefault(thread.ident, (len(_span_threads) + 1, thread.name))[0]
+            _spans.append({
+                "name": name, "cat": cat, "start": start, "dur": end - start, "tid": tid,
+                "path": " / ".join(getattr(_local, "stack", [])),
+                "item": getattr(_local, "item", None),
+            })
+
+
+def print_warnings() -> None:
+    """Log the run's warnings, with config diffs capped at --diff-lines."""
+    if not _warnings:
+        return
+    log("")
+    log("Warnings:")
+    for msg, diff in _warnings:
+        log(f"  - {msg}")
+        if diff:
+            for line in diff.lines(_options.diff_lines or None):
+                log(f"    {line}")
+
+
+def print_timing_summary(limit: int = 15) -> None:
+    """Log the slowest tasks and commands of the run."""
+    with _spans_lock:
+        spans = sorted(_spans, key=lambda sp: sp["dur"], reverse=True)[:limit]
+    if not spans:
+        return
+    log("")
+    log("Timing (slowest first):")
+    for sp in spans:
+        label = sp["name"] if len(sp["name"]) <= 70 else sp["name"][:67] + "..."
+        log(f"  {sp['dur']:8.2f}s  {sp['cat']:<4}  {label}")
+
+
+def write_trace(path) -> None:
+    """Write recorded spans as Chrome trace-event JSON (loadable in Perfetto)."""
+    with _spans_lock:
+        spans = list(_spans)
+        threads = dict(_span_threads)
+    origin = min((sp["start"] for sp in spans), default=0.0)
+    pid = os.getpid()
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in threads.values()
+    ]
+    for sp in sorted(spans, key=lambda sp: sp["start"]):
+        events.append({
+            "name": sp["name"], "cat": sp["cat"], "ph": "X", "pid": pid, "tid": sp["tid"],
+            "ts": round((sp["start"] - origin) * 1e6), "dur": round(sp["dur"] * 1e6),
+            "args": {"path": sp["path"], "item": sp["item"]},
+        })
+    Path(path).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+def _stream_output(proc):
+    for line in proc.stdout:
+        _emit("output", text=line.rstrip("\n"))
+    _emit("output_end")
+    proc.wait()
+
+
+def _stream_command(kind: str, cmd: str) -> int:
+    """Run a "run" or "sudo" command with streamed output; return its exit code."""
+    _emit("cmd", cmd=cmd)
+    start = time.monotonic()
+    with _timed(cmd, "cmd"):
+        proc = _popen(kind, cmd)
+        _stream_output(proc)
+    _emit("exit", cmd=cmd, rc=proc.returncode, dur=round(time.monotonic() - start, 3))
+    return proc.returncode
+
+
+def _run_stream(cmd) -> int:
+    """Run a command with streamed output; return its exit code."""
+    return _stream_command("run", cmd)
+
+
+def run(cmd):
+    returncode = _run_stream(cmd)
+    if returncode != 0:
+        log(f"FAILED (exit {returncode}): {cmd}")
+        sys.exit(1)
+
+
+def _popen(kind: str, cmd: str):
+    """Start a "run", "sudo" or "sudo_ok" command, through the transcript if one is active.
+
+    The result behaves like a Popen with stdin already closed: iterate
+    `stdout`, then `wait()` for `returncode`.
+    """
+    if _transcript is not None and _transcript.replaying:
+        return _transcript.replay(kind, cmd)
+    if kind == "run":
+        proc = subprocess.Popen(
+            cmd, shell=True, text=True,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+    elif (helper := _sudo_helper()) is not None:
+        proc = helper.open(cmd)
+    else:
+        proc = _sudo_popen(cmd)
+        proc.stdin.close()
+    if _transcript is not None:
+        return _RecordingProc(_transcript, kind, cmd, proc)
+    return proc
+
+
+def _sudo_popen(cmd: str) -> subprocess.Popen:
+    """Open a privileged subprocess with stdin configured. Caller must close stdin."""
+    if os.geteuid() == 0:
+        full = cmd
     elif _password is None:
         full = f"sudo {cmd}"
     else:
@@ -647,27 +2541,174 @@ def _sudo_popen(cmd: str) -> subprocess.Popen:
     return proc
 
 
+# Runs as root inside the helper: one JSON request per stdin line, JSON replies
+# (output lines, then the exit code) on stdout, several commands at a time.
+_SUDO_HELPER = r"""
+import json, subprocess, sys, threading
+lock = threading.Lock()
+def send(msg):
+    with lock:
+        sys.stdout.write(json.dumps(msg) + "\n")
+        sys.stdout.flush()
+def run(job, cmd):
+    proc = subprocess.Popen(cmd, shell=True, text=True, errors="replace", stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    for line in proc.stdout:
+        send({"id": job, "line": line})
+    send({"id": job, "rc": proc.wait()})
+send({"ready": True})
+workers = []
+for raw in sys.stdin:
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        continue
+    worker = threading.Thread(target=run, args=(msg["id"], msg["cmd"]))
+    worker.start()
+    workers.append(worker)
+for worker in workers:
+    worker.join()
+"""
+
+
+class SudoHelper:
+    """One long-lived root process that runs every privileged command of the run.
+
+    Started once, on the first privileged command. sudo (and PAM) run only
+    for the helper itself; commands are then sent over its stdin and
+    multiplexed by id, so parallel tasks share it. The password is written to
+    sudo's stdin, never to argv. Closing stdin makes the helper wait for
+    running commands and exit.
+    """
+
+    def __init__(self, launcher: list[str]):
+        self.launcher = launcher  # argv prefix that runs the helper as root
+        self.proc: subprocess.Popen | None = None
+        self.lock = threading.Lock()
+        self.jobs: dict[int, queue.SimpleQueue] = {}
+        self.next_id = 0
+
+    def start(self, password: str | None = None) -> bool:
+        """Launch the helper; False if it did not come up (e.g. sudo refused)."""
+        try:
+            proc = subprocess.Popen(
+                [*self.launcher, sys.executable, "-c", _SUDO_HELPER], text=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return False
+        if password is not None:
+            proc.stdin.write(password + "\n")
+            proc.stdin.flush()
+        if not proc.stdout.readline():
+            proc.wait()
+            return False
+        self.proc = proc
+        threading.Thread(target=self._read, name="sudo-helper", daemon=True).start()
+        return True
+
+    def _read(self) -> None:
+        for raw in self.proc.stdout:
+            msg = json.loads(raw)
+            with self.lock:
+                self.jobs[msg["id"]].put(msg)
+        with self.lock:  # helper gone: fail whatever is still waiting
+            for replies in self.jobs.values():
+                replies.put({"line": "privileged helper exited unexpectedly\n"})
+                replies.put({"rc": 255})
+
+    def open(self, cmd: str) -> "_HelperJob":
+        with self.lock:
+            self.next_id += 1
+            job = self.next_id
+            self.jobs[job] = replies = queue.SimpleQueue()
+            try:
+                self.proc.stdin.write(json.dumps({"id": job, "cmd": cmd}) + "\n")
+                self.proc.stdin.flush()
+            except (OSError, ValueError):
+                replies.put({"rc": 255})
+        return _HelperJob(self, job, replies)
+
+    def close(self, timeout: float = 30) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.terminate()  # sudo relays the signal to the helper
+            self.proc.wait()
+
+
+class _HelperJob:
+    """A command running in the helper, used like a Popen: iterate `stdout`, then `wait()`."""
+
+    def __init__(self, helper: SudoHelper, job: int, replies: queue.SimpleQueue):
+        self.helper, self.job, self.replies = helper, job, replies
+        self.returncode = None
+        self.stdout = self._lines()
+
+    def _lines(self):
+        while True:
+            msg = self.replies.get()
+            if "rc" in msg:
+                self.returncode = msg["rc"]
+                with self.helper.lock:
+                    self.helper.jobs.pop(self.job, None)
+                return
+            yield msg["line"]
+
+    def wait(self) -> int:
+        for _ in self.stdout:
+            pass
+        return self.returncode
+
+
+_helper: SudoHelper | None = None
+_helper_lock = threading.Lock()
+_helper_failed = False
+
+
+def _sudo_helper() -> SudoHelper | None:
+    """The shared privileged helper, started on first use; None as root or if it cannot start."""
+    global _helper, _helper_failed
+    if os.geteuid() == 0:
+        return None
+    with _helper_lock:
+        if _helper is None and not _helper_failed:
+            # -k: always read the password we send rather than leaving it for the helper
+            launcher = ["sudo"] if _password is None else ["sudo", "-k", "-S", "-p", ""]
+            helper = SudoHelper(launcher)
+            if helper.start(_password):
+                _helper = helper
+                atexit.register(helper.close)
+            else:
+                _helper_failed = True
+                log("privileged helper did not start, running sudo per command")
+        return _helper
+
+
 def sudo_ok(cmd) -> bool:
     """Run a command with sudo privileges; return True if it exits 0, False otherwise."""
-    proc = _sudo_popen(cmd)
-    proc.stdin.close()
-    proc.wait()
+    with _timed(cmd, "cmd"):
+        proc = _popen("sudo_ok", cmd)
+        proc.wait()
     return proc.returncode == 0
 
 
+def _sudo_stream(cmd) -> int:
+    """Run a privileged command with streamed output; return its exit code."""
+    return _stream_command("sudo", cmd)
+
+
 def sudo(cmd):
-    if os.geteuid() == 0:
-        run(cmd)
-    elif _password is None:
-        run(f"sudo {cmd}")
-    else:
-        log(f"\033[2m$ {cmd}\033[0m")
-        proc = _sudo_popen(cmd)
-        proc.stdin.close()
-        _stream_output(proc)
-        if proc.returncode != 0:
-            log(f"FAILED (exit {proc.returncode}): {cmd}")
-            sys.exit(1)
+    returncode = _sudo_stream(cmd)
+    if returncode != 0:
+        log(f"FAILED (exit {returncode}): {cmd}")
+        sys.exit(1)
 
 
 def init_password():
@@ -676,6 +2717,7 @@ def init_password():
         return
     if subprocess.run("sudo -n true", shell=True, capture_output=True).returncode == 0:
         return
+    _events.flush()
     _password = getpass.getpass("Enter sudo password: ")
     result = subprocess.run(
         "sudo -S true", shell=True, text=True,
@@ -687,14 +2729,441 @@ def init_password():
         sys.exit(1)
 
 
+def apt_install(*packages):
+    """Ensure apt packages are present, logging how each was satisfied.
+
+    Packages already handled by the batched transaction in install() are not
+    touched again; anything else is installed individually.
+    """
+    packages = list(packages)
+    names = " ".join(packages)
+    if all(p in _apt_state.present for p in packages):
+        log(f"{names} already installed, skipping")
+        return
+    if all(p in _apt_state.present or p in _apt_state.batched for p in packages):
+        log(f"{names} installed in batched apt transaction")
+        return
+    installed = _dpkg_installed(packages)
+    _apt_state.present.update(installed)
+    missing = [p for p in packages if p not in installed]
+    if not missing:
+        log(f"{names} already installed, skipping")
+        return
+    # dpkg holds a system-wide lock, so parallel items take turns here.
+    with _apt_lock:
+        apt_update()
+        sudo(f"{_APT_INSTALL}{_apt_sources()} {' '.join(missing)}")
+    _probe.invalidate_dpkg()
+    _apt_state.present.update(missing)
+    log(f"installed {' '.join(missing)}")
+
+
+def apt_update():
+    """Refresh apt package lists once per run, only if they are stale.
+
+    Called lazily right before apt installs something, so runs that need no
+    packages never touch the network. Lists younger than --apt-ttl are reused
+    unless --refresh-apt was given. With --bundle-in only the bundle's
+    repository is read, so it is always refreshed.
+    """
+    if _apt_state.updated:
+        return
+    with task("apt update"):
+        age = _apt_lists_age()
+        if _bundle is not None:
+            sudo(f"DEBIAN_FRONTEND=noninteractive apt-get update -qq{_apt_sources()}")
+        elif _journal.done_before("apt update"):
+            log("refreshed before the interruption, skipping")
+        elif not _options.refresh_apt and age is not None and age < _options.apt_ttl:
+            log(f"package lists are {int(age // 60)} min old, skipping")
+        else:
+            sudo("DEBIAN_FRONTEND=noninteractive apt-get update -qq")
+        _apt_state.updated = True
+
+
+def _apt_lists_age() -> float | None:
+    """Seconds since apt package lists were last refreshed, or None if there are none."""
+    try:
+        newest = max(
+            (e.stat().st_mtime for e in os.scandir(_APT_LISTS) if e.is_file()),
+            default=None,
+        )
+    except OSError:
+        return None
+    if newest is None:
+        return None
+    return max(0.0, time.time() - newest)
+
+
+def _dpkg_installed(packages: list[str]) -> set[str]:
+    """Return the subset of packages dpkg reports as installed (from the probe snapshot)."""
+    if not packages:
+        return set()
+    installed = _probe.dpkg()
+    return {p for p in packages if p in installed}
+
+
+def install_apt_batch(chosen: list[InstallItem]) -> None:
+    """Install every missing apt package of the chosen items in one transaction."""
+    owners: dict[str, list[str]] = {}
+    for item in chosen:
+        for pkg in item.apt:
+            owners.setdefault(pkg, []).append(item.id)
+    if not owners:
+        return
+
+    with task("apt packages"):
+        installed = _dpkg_installed(list(owners))
+        _apt_state.present.update(installed)
+        missing = [pkg for pkg in owners if pkg not in installed]
+        for pkg, ids in owners.items():
+            state = "installed" if pkg in installed else "to install"
+            log(f"{pkg} ({', '.join(ids)}): {state}")
+        if not missing:
+            log("all packages already installed")
+            return
+
+        cmd = f"{_APT_INSTALL}{_apt_sources()} {_APT_RETRIES} {' '.join(missing)}"
+        with _apt_lock:
+            apt_update()
+            returncode = _sudo_stream(cmd)
+        _probe.invalidate_dpkg()
+        if returncode != 0:
+            still_missing = [p for p in missing if p not in _dpkg_installed(missing)]
+            for pkg in still_missing:
+                log(f"not installed: {pkg} (needed by {', '.join(owners[pkg])})")
+            log(f"FAILED (exit {returncode}): {cmd}")
+            sys.exit(1)
+        _apt_state.batched.update(missing)
+        log("done")
+
+
 def is_installed(cmd):
-    return shutil.which(cmd) is not None
+    return _probe.which(cmd) is not None
+
+
+_RUSTUP_PROXIES = {  # rustup proxies named differently from the component that provides them
+    "rustdoc": "rustc", "rust-gdb": "rustc", "rust-gdbgui": "rustc", "rust-lldb": "rustc",
+    "cargo-clippy": "clippy", "clippy-driver": "clippy", "cargo-fmt": "rustfmt",
+}
+
+
+def _uv_tool_dir() -> Path:
+    if os.environ.get("UV_TOOL_DIR"):
+        return Path(os.environ["UV_TOOL_DIR"])
+    return Path(os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share") / "uv" / "tools"
+
+
+class Probe:
+    """One snapshot of installed state, shared by every check in a run.
+
+    PATH directories are listed once each (re-listed only after invalidation
+    or for directories newly added to PATH, e.g. by rustup); dpkg, `cargo
+    install --list`, `uv tool list` and `rustup component list --installed`
+    are each queried once and parsed. A PATH hit counts only if it resolves
+    to an executable regular file, so a dangling symlink or a file without
+    the execute bit is not mistaken for an installed tool. Hits in the
+    directories cargo, rustup and uv manage must also be on their records
+    (see _tracked).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dirs: dict[str, set[str]] = {}
+        self._dpkg: dict[str, str] | None = None
+        self._cargo: dict[str, str] | None = None
+        self._cargo_bins: set[str] = set()
+        self._uv: dict[str, str] | None = None
+        self._rustup: list[str] | None = None
+        self._recorded: set[tuple] | None = None
+        self._copied: set[tuple] = set()  # binaries this run put in place itself; kept across invalidation
+
+    def which(self, cmd: str) -> str | None:
+        with self._lock:
+            for d in os.environ.get("PATH", "").split(os.pathsep):
+                if not d:
+                    continue
+                if d not in self._dirs:
+                    try:
+                        self._dirs[d] = {e.name for e in os.scandir(d)}
+                    except OSError:
+                        self._dirs[d] = set()
+                if cmd in self._dirs[d]:
+                    path = os.path.join(d, cmd)
+                    if os.path.isfile(path) and os.access(path, os.X_OK) and self._tracked(d, cmd, path):
+                        return path
+        return None
+
+    def _tracked(self, d: str, cmd: str, path: str) -> bool:
+        """Whether a PATH hit in a tool-managed directory is backed by that tool's records.
+
+        In ~/.cargo/bin a rustup proxy counts only if its toolchain component
+        is installed; anything else (bar cargo and rustup themselves) must be
+        listed by `cargo install --list`, or be the file this script recorded
+        in its install manifest (crates copied from a bundle are untracked).
+        A uv tool binary counts only if `uv tool list` lists its tool.
+        """
+        if Path(d) == Path.home() / ".cargo" / "bin":
+            rustup = os.path.join(d, "rustup")
+            if cmd != "rustup" and "rustup" in self._dirs[d] and filecmp.cmp(path, rustup):
+                component = _RUSTUP_PROXIES.get(cmd, cmd)
+                return any(c == component or c.startswith(f"{component}-") for c in self.rustup())
+            if cmd in ("cargo", "rustup"):
+                return True
+            self.cargo()
+            return cmd in self._cargo_bins or self._is_recorded(path)
+        real = Path(os.path.realpath(path))
+        if real.parent.parent.parent == _uv_tool_dir():
+            return real.parent.parent.name in self.uv()
+        return True
+
+    def _is_recorded(self, path: str) -> bool:
+        if self._recorded is None:
+            items = _read_json(_manifest_path()).get("items", {})
+            self._recorded = {tuple(entry["bin"]) for entry in items.values() if entry.get("bin")}
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime_ns) in self._recorded | self._copied
+
+    def record(self, path: Path) -> None:
+        """Count a binary copied into place by this script as installed until the manifest records it."""
+        st = path.stat()
+        with self._lock:
+            self._copied.add((str(path), st.st_size, st.st_mtime_ns))
+
+    def dpkg(self) -> dict[str, str]:
+        """Installed apt packages -> version."""
+        with self._lock:
+            if self._dpkg is None:
+                out = _capture(["dpkg-query", "-W", "-f=${Package}\t${db:Status-Status}\t${Version}\n"])
+                self._dpkg = {}
+                for line in out.splitlines():
+                    name, status, version = (line.split("\t") + ["", ""])[:3]
+                    if status == "installed":
+                        self._dpkg[name.split(":")[0]] = version
+            return self._dpkg
+
+    def cargo(self) -> dict[str, str]:
+        """Crates installed by cargo (incl. cargo binstall) -> version."""
+        with self._lock:
+            if self._cargo is None:
+                out = _capture(["cargo", "install", "--list"]) if self.which("cargo") else ""
+                # "name v1.2.3:" or "name v1.2.3 (https://...#rev):", binaries indented below
+                self._cargo = {
+                    m.group(1): m.group(2)
+                    for m in re.finditer(r"^(\S+) v(\S+?)(?: \(.*\))?:$", out, re.MULTILINE)
+                }
+                self._cargo_bins = {line.strip() for line in out.splitlines() if line.startswith(" ")}
+            return self._cargo
+
+    def uv(self) -> dict[str, str]:
+        """Tools installed by `uv tool install` -> version."""
+        with self._lock:
+            if self._uv is None:
+                out = _capture(["uv", "tool", "list"]) if self.which("uv") else ""
+                self._uv = {
+                    m.group(1): m.group(2)
+                    for m in re.finditer(r"^(\S+) v(\S+)", out, re.MULTILINE)
+                }
+            return self._uv
+
+    def rustup(self) -> list[str]:
+        """Installed toolchain components, e.g. "rust-analyzer-x86_64-unknown-linux-gnu"."""
+        with self._lock:
+            if self._rustup is None:
+                out = _capture(["rustup", "component", "list", "--installed"]) if self.which("rustup") else ""
+                self._rustup = out.split()
+            return self._rustup
+
+    def version(self, item: "InstallItem") -> str | None:
+        """Installed version of an item, from whichever snapshot covers its backend."""
+        if item.crate:
+            return self.cargo().get(item.crate)
+        if item.uv:
+            return self.uv().get(item.uv)
+        if item.id in self.cargo():
+            return self.cargo()[item.id]
+        if item.apt and _backend(item) == "apt":
+            return self.dpkg().get(item.apt[0])
+        return None
+
+    def invalidate(self, item: "InstallItem | None" = None) -> None:
+        """Forget state an item's installer may have changed (everything if item is None)."""
+        with self._lock:
+            self._dirs.clear()
+            if item is None or item.apt:
+                self._dpkg = None
+            if item is None or item.crate or _backend(item) in ("binstall", "rustup", "script"):
+                self._cargo = None
+            if item is None or item.uv:
+                self._uv = None
+            if item is None or _backend(item) == "rustup":
+                self._rustup = None
+            if item is None:
+                self._recorded = None
+
+    def invalidate_dpkg(self) -> None:
+        with self._lock:
+            self._dpkg = None
+
+
+def _capture(argv: list[str]) -> str:
+    """Run a read-only query command and return its stdout ("" if it cannot run)."""
+    cmd = shlex.join(argv)
+    if _transcript is not None and _transcript.replaying:
+        proc = _transcript.replay("capture", cmd)
+        out = "".join(proc.stdout)
+        proc.wait()
+        return out
+    start = time.monotonic()
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True)
+    except OSError:
+        result = subprocess.CompletedProcess(argv, 127, "")
+    if _transcript is not None:
+        offset = round(time.monotonic() - start, 4)
+        output = [[offset, line] for line in result.stdout.splitlines(keepends=True)]
+        _transcript.add("capture", cmd, result.returncode, offset, output)
+    return result.stdout
+
+
+_probe = Probe()
+
+
+# ---------------------------------------------------------------------------
+# Command transcripts (--record / --replay)
+# ---------------------------------------------------------------------------
+
+class Transcript:
+    """Every run/sudo/sudo_ok command and probe query of a run, for --record and --replay.
+
+    The file is JSON lines, one finished command each: kind, command, exit
+    code, duration and output lines with their offsets from the start.
+    Replay serves recordings in order per (kind, command); the last one is
+    reused once a command runs more often than it was recorded. Commands
+    missing from the transcript succeed at once with no output and are
+    listed in `missing`. File writes and downloads done in Python are not
+    part of the transcript.
+    """
+
+    def __init__(self, path: Path, replaying: bool = False, scale: float = 1.0):
+        self.replaying = replaying
+        self.scale = scale
+        self.missing: list[str] = []
+        self.lock = threading.Lock()
+        self.entries: dict[tuple[str, str], list[dict]] = {}
+        self.file = None
+        if replaying:
+            for line in Path(path).read_text().splitlines():
+                entry = json.loads(line)
+                self.entries.setdefault((entry["kind"], entry["cmd"]), []).append(entry)
+        else:
+            self.file = Path(path).open("w")
+
+    def add(self, kind: str, cmd: str, returncode: int, dur: float, output: list) -> None:
+        line = json.dumps({"kind": kind, "cmd": cmd, "rc": returncode, "dur": dur, "out": output})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def replay(self, kind: str, cmd: str) -> "_ReplayProc":
+        with self.lock:
+            queue = self.entries.get((kind, cmd))
+            if queue:
+                entry = queue.pop(0) if len(queue) > 1 else queue[0]
+            else:
+                self.missing.append(cmd)
+                entry = {"rc": 0, "dur": 0.0, "out": []}
+        return _ReplayProc(entry, self.scale)
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+
+
+class _RecordingProc:
+    """A live process whose output and exit code are added to the transcript as they happen."""
+
+    def __init__(self, transcript: Transcript, kind: str, cmd: str, proc: subprocess.Popen):
+        self.transcript, self.kind, self.cmd, self.proc = transcript, kind, cmd, proc
+        self.start = time.monotonic()
+        self.output: list = []
+        self.returncode = None
+        self.stdout = self._lines()
+
+    def _lines(self):
+        for line in self.proc.stdout:
+            self.output.append([round(time.monotonic() - self.start, 4), line])
+            yield line
+
+    def wait(self) -> int:
+        for _ in self.stdout:
+            pass
+        self.returncode = self.proc.wait()
+        dur = round(time.monotonic() - self.start, 4)
+        self.transcript.add(self.kind, self.cmd, self.returncode, dur, self.output)
+        return self.returncode
+
+
+class _ReplayProc:
+    """Plays a recorded command back, sleeping its recorded delays times `scale`."""
+
+    def __init__(self, entry: dict, scale: float):
+        self.entry, self.scale = entry, scale
+        self.start = time.monotonic()
+        self.returncode = None
+        self.stdout = self._lines()
+
+    def _sleep_until(self, offset: float) -> None:
+        delay = self.start + offset * self.scale - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _lines(self):
+        for offset, line in self.entry["out"]:
+            self._sleep_until(offset)
+            yield line
+
+    def wait(self) -> int:
+        for _ in self.stdout:
+            pass
+        self._sleep_until(self.entry["dur"])
+        self.returncode = self.entry["rc"]
+        return self.returncode
+
+
+_transcript: Transcript | None = None
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
+@dataclass
+class Options:
+    """Run-wide settings from the command line (besides the selection)."""
+    jobs: int = 4
+    refresh_apt: bool = False
+    apt_ttl: int = 6 * 60 * 60  # seconds
+    cache_dir: Path | None = None  # None = ~/.cache/devenv
+    cache_max_mb: int = 1024
+    release_ttl: int = 60 * 60  # seconds
+    plan: str | None = None  # "text" or "json": print the plan instead of installing
+    trace: Path | None = None  # write a Chrome trace of the run here
+    record: Path | None = None  # write a command transcript here
+    replay: Path | None = None  # run against this transcript instead of the system
+    replay_scale: float = 1.0  # multiplier for recorded delays during replay
+    force: bool = False  # ignore the install manifest and run every selected item
+    resume: bool = False  # continue the interrupted run recorded in the journal
+    diff_lines: int = 100  # config diff lines shown per warning, 0 = all
+    bundle_out: Path | None = None  # write an offline bundle of the selection here instead of installing
+    bundle_in: Path | None = None  # install from this offline bundle, without network access
+    targets: list[Target] = field(default_factory=list)  # fleet mode: provision these instead of this machine
+    fleet_jobs: int = 8  # targets provisioned at once
+
+
+_options = Options()
+
+
 def _parse_args(items: list[InstallItem]) -> set[str] | None:
     """Parse CLI arguments and return the user_selected set (as canonical ids).
 
@@ -726,7 +3195,105 @@ def _parse_args(items: list[InstallItem]) -> set[str] | None:
         "--skip", nargs="+", metavar="ITEM",
         help=f"install everything except the listed items (valid: {valid_names})",
     )
+    parser.add_argument(
+        "--plan", nargs="?", const="text", choices=["text", "json"],
+        help="show what would be installed, with size and time estimates, and exit (no sudo)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=Options.jobs, metavar="N",
+        help=f"install up to N independent items at once; 1 installs one at a time in dependency order (default: {Options.jobs})",
+    )
+    parser.add_argument(
+        "--refresh-apt", action="store_true",
+        help="run apt update before installing apt packages even if the lists are fresh",
+    )
+    parser.add_argument(
+        "--apt-ttl", type=int, default=Options.apt_ttl, metavar="SECONDS",
+        help=f"reuse apt package lists younger than this (default: {Options.apt_ttl})",
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path, metavar="DIR",
+        help="download cache location (default: ~/.cache/devenv)",
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=int, default=Options.cache_max_mb, metavar="MB",
+        help=f"evict least recently used downloads above this size (default: {Options.cache_max_mb})",
+    )
+    parser.add_argument(
+        "--release-ttl", type=int, default=Options.release_ttl, metavar="SECONDS",
+        help=f"reuse cached GitHub release metadata younger than this (default: {Options.release_ttl})",
+    )
+    parser.add_argument(
+        "--trace", type=Path, metavar="FILE",
+        help="write task and command timings as Chrome trace-event JSON (open in Perfetto)",
+    )
+    parser.add_argument(
+        "--targets", nargs="+", type=parse_target, default=[], metavar="TARGET",
+        help="provision these machines instead of this one: ssh:HOST (or HOST), incus:NAME, local:DIR",
+    )
+    parser.add_argument(
+        "--fleet-jobs", type=int, default=Options.fleet_jobs, metavar="N",
+        help=f"provision up to N targets at once (default: {Options.fleet_jobs})",
+    )
+    parser.add_argument(
+        "--diff-lines", type=int, default=Options.diff_lines, metavar="N",
+        help=f"show at most N lines of each config diff in the warnings (default: {Options.diff_lines}, 0 = all)",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="run every selected item even if the install manifest says it is unchanged",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="continue an interrupted run: same selection, skipping what it finished, reusing partial downloads",
+    )
+    bundle = parser.add_mutually_exclusive_group()
+    bundle.add_argument(
+        "--bundle-out", type=Path, metavar="FILE",
+        help="download everything the selection needs into an offline bundle (.tar.gz) instead of installing",
+    )
+    bundle.add_argument(
+        "--bundle-in", type=Path, metavar="FILE",
+        help="install from an offline bundle without network access (default selection: everything in it)",
+    )
+    transcript = parser.add_mutually_exclusive_group()
+    transcript.add_argument(
+        "--record", type=Path, metavar="FILE",
+        help="save every command with its output and timing to a transcript",
+    )
+    transcript.add_argument(
+        "--replay", type=Path, metavar="FILE",
+        help="feed commands from a transcript instead of running them (benchmarking)",
+    )
+    parser.add_argument(
+        "--replay-scale", type=float, default=1.0, metavar="FACTOR",
+        help="multiply recorded delays during --replay (default 1, 0 = no delays)",
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.fleet_jobs < 1:
+        parser.error("--fleet-jobs must be at least 1")
+    if args.diff_lines < 0:
+        parser.error("--diff-lines must not be negative")
+    _options.jobs = args.jobs
+    _options.refresh_apt = args.refresh_apt
+    _options.apt_ttl = args.apt_ttl
+    _options.cache_dir = args.cache_dir
+    _options.cache_max_mb = args.cache_max_mb
+    _options.release_ttl = args.release_ttl
+    _options.plan = args.plan
+    _options.trace = args.trace
+    _options.record = args.record
+    _options.replay = args.replay
+    _options.replay_scale = args.replay_scale
+    _options.force = args.force
+    _options.resume = args.resume
+    _options.diff_lines = args.diff_lines
+    _options.bundle_out = args.bundle_out
+    _options.bundle_in = args.bundle_in
+    _options.targets = args.targets
+    _options.fleet_jobs = args.fleet_jobs
 
     if args.list:
         _print_item_list(items)
@@ -750,6 +3317,16 @@ def _parse_args(items: list[InstallItem]) -> set[str] | None:
         return all_ids - _resolve(args.skip)
 
     # No flag given
+    if args.bundle_in:
+        return _resolve(n for n in read_bundle_manifest(args.bundle_in)["items"] if n in name_to_id)
+    if args.resume:
+        journal = Journal.unfinished()
+        if journal is None:
+            parser.error("--resume: the last run completed, there is nothing to resume")
+        _validate(journal["selection"])
+        return _resolve(journal["selection"])
+    if args.plan:
+        return all_ids
     if not sys.stdin.isatty():
         print(
             "Error: no TTY detected and no selection flag given.\n"
@@ -761,9 +3338,31 @@ def _parse_args(items: list[InstallItem]) -> set[str] | None:
     return None  # signal: launch TUI
 
 
+def _require_menu_deps() -> None:
+    """Exit with guidance if the menu's third-party dependencies are missing.
+
+    Everything else is stdlib-only, so non-interactive runs work under any
+    Python 3.12 (see bootstrap_inst.sh).
+    """
+    try:
+        import textual  # noqa: F401
+    except ImportError:
+        print(
+            "Error: the interactive menu needs textual. Run this script via './install.py' (requires uv), "
+            "or pass --all, --only or --skip to run without third-party dependencies."
+        )
+        sys.exit(100)
+
+
 def _print_item_list(items: list[InstallItem]) -> None:
-    from rich.console import Console
-    from rich.table import Table
+    try:
+        from rich.console import Console
+        from rich.table import Table
+    except ImportError:  # stdlib-only run
+        print("ID")
+        for item in items:
+            print(item.id)
+        return
     table = Table(show_header=True)
     table.add_column("ID")
     for item in items:
@@ -772,57 +3371,97 @@ def _print_item_list(items: list[InstallItem]) -> None:
 
 
 def main():
-    global _logfile
+    global _transcript, _bundle
 
     items = _items()
-    groups = _groups()
+    graph = DepGraph(items, _groups())
     user_selected = _parse_args(items)
 
+    if _options.plan:
+        print_plan(build_plan(items, user_selected), _options.plan)
+        return
+
     if user_selected is None:
-        user_selected = run_selection_menu(items, groups)
-        if user_selected is None:
+        _require_menu_deps()
+        # fleet mode installs nothing on this machine, so there is nothing to prefetch
+        prefetch = None if _options.targets else Prefetcher(items)
+        if prefetch is not None:
+            prefetch.start({item.id for item in items})
+        user_selected = run_selection_menu(
+            graph, on_change=prefetch and (lambda ids: prefetch.update(graph.closure(ids))),
+        )
+        if user_selected is not None:
+            selected = graph.closure(user_selected)
+            added = selected - user_selected
+            if added:
+                print("The following items will be added to satisfy dependencies:")
+                for item_id in sorted(added):
+                    print(f"  + {item_id}")
+                if input("Continue? [Y/n] ").strip().lower() in ("n", "no"):
+                    user_selected = None
+        if user_selected is None:  # quit in the menu, or declined the added dependencies
+            if prefetch is not None:
+                prefetch.abort()
             print("Aborted.")
             sys.exit(0)
-        selected = resolve_selection(items, user_selected)
-        added = selected - user_selected
-        if added:
-            print("The following items will be added to satisfy dependencies:")
-            for item_id in sorted(added):
-                print(f"  + {item_id}")
-            ans = input("Continue? [Y/n] ").strip().lower()
-            if ans in ("n", "no"):
-                print("Aborted.")
-                sys.exit(0)
+        if prefetch is not None:
+            prefetch.finish(selected)
     else:
-        selected = resolve_selection(items, user_selected)
+        selected = graph.closure(user_selected)
         for item_id in sorted(selected - user_selected):
             warn(f"auto-added {item_id} (required dependency)")
 
-    _logfile = (SCRIPT_DIR / "install.log").open("w")
-    atexit.register(_logfile.close)
-
-    with task("Dev environment setup"):
-        init_password()
-
-        with task("apt update"):
-            sudo("DEBIAN_FRONTEND=noninteractive apt-get update -qq")
+    if _options.record or _options.replay:
+        _transcript = Transcript(
+            _options.replay or _options.record,
+            replaying=_options.replay is not None, scale=_options.replay_scale,
+        )
+        atexit.register(_transcript.close)
+
+    _events.start(LogFileSink(SCRIPT_DIR / "install.log"), JsonlSink(SCRIPT_DIR / "install.jsonl"))
+    atexit.register(_events.close)
+    if _options.trace:
+        atexit.register(write_trace, _options.trace)  # also written if the run fails
+
+    if _options.bundle_out:
+        with task("Offline bundle"):
+            if any(item.apt for item in items if item.id in selected):
+                init_password()
+            build_bundle(items, selected, _options.bundle_out)
+        print_timing_summary()
+        return
 
-        install(items, selected)
+    if _options.targets:
+        with task(f"Fleet setup ({len(_options.targets)} targets)"):
+            results = run_fleet(_options.targets, fleet_command(selected, items), _options.fleet_jobs)
+        print_fleet_summary(results)
+        print_timing_summary()
+        if not all(r["ok"] for r in results):
+            sys.exit(1)
+        return
 
-    if _warnings:
-        log("")
-        log("Warnings:")
-        for msg, diff in _warnings:
-            log(f"  - {msg}")
-            if diff:
-                for line in diff.splitlines():
-                    log(f"    {line}")
+    if _options.bundle_in:
+        with task("Offline bundle"):
+            _bundle = open_bundle(_options.bundle_in)
+            selected = bundle_selection(selected)
 
+    _journal.begin(selected, _options.resume)
+    try:
+        with task("Dev environment setup"):
+            install(items, selected, jobs=_options.jobs, authenticate=None if _options.replay else init_password)
+    except BaseException:
+        _journal.end(ok=False)
+        log(f"Run './install.py --resume' to continue from here (journal: {Journal.path()}).")
+        raise
+    _journal.end(ok=True)
+    if _transcript is not None and _transcript.missing:
+        warn(f"{len(_transcript.missing)} command(s) not in the transcript were treated as successful: "
+             + ", ".join(sorted(set(_transcript.missing))))
+
+    print_warnings()
+    print_timing_summary()
     log("Setup complete.")
 
 
 if __name__ == "__main__":
-    if not os.environ.get("VIRTUAL_ENV"):
-        print("Error: no virtual environment detected. Run this script via './install.py' (requires uv), or activate a virtual environment first.")
-        sys.exit(100)
     main()
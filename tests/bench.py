@@ -0,0 +1,258 @@
+"""Orchestration benchmarks for install.py, run against replayed command transcripts.
+
+No network, sudo or container needed. Run with
+`uv run --with pytest pytest -s tests/bench.py`; each benchmark prints one
+result line. Bounds are loose so only real regressions fail on a plain box.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tarfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("VIRTUAL_ENV", "1")
+
+import pytest
+import install
+
+SCALE = 0.1  # replay recorded delays at a tenth of real time
+
+
+@pytest.fixture(autouse=True)
+def reset_install_state(tmp_path, monkeypatch):
+    """Isolate HOME, PATH and module globals; output goes to a throwaway log."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / "bin").mkdir()
+    monkeypatch.setenv("PATH", str(tmp_path / "bin"))
+    monkeypatch.setattr(install, "SCRIPT_DIR", tmp_path)
+    monkeypatch.setattr(install, "_probe", install.Probe())
+    monkeypatch.setattr(install, "_options", install.Options())
+    monkeypatch.setattr(install, "_transcript", None)
+    monkeypatch.setattr(install, "_journal", install.Journal())
+    monkeypatch.setattr(install, "_events", install.EventLog())
+    install._events.start(install.LogFileSink(tmp_path / "bench.log"))
+    install._warnings.clear()
+    install._local.__dict__.clear()
+    install._apt_state.present.clear()
+    install._apt_state.batched.clear()
+    install._apt_state.updated = False
+    install._spans.clear()
+    install._span_threads.clear()
+    yield
+    install._events.close()
+
+
+def _entry(kind, cmd, dur, lines=0, rc=0):
+    """A recorded command whose output lines are spread evenly over `dur` seconds."""
+    out = [[dur * (i + 1) / (lines + 1), f"{cmd}: line {i}\n"] for i in range(lines)]
+    return {"kind": kind, "cmd": cmd, "rc": rc, "dur": dur, "out": out}
+
+
+def _replay(tmp_path, monkeypatch, entries, scale=SCALE):
+    path = tmp_path / "transcript.jsonl"
+    path.write_text("".join(json.dumps(e) + "\n" for e in entries))
+    transcript = install.Transcript(path, replaying=True, scale=scale)
+    monkeypatch.setattr(install, "_transcript", transcript)
+    return transcript
+
+
+def _report(name, value, unit):
+    install._events.flush()
+    print(f"\nbench {name}: {value:.3f} {unit}")
+
+
+def _chain_items():
+    """Three independent two-step chains: a -> a2, b -> b2, c -> c2."""
+    def installer(item_id):
+        return lambda: install.run(f"build {item_id}")
+
+    items = []
+    for root in "abc":
+        items.append(install.InstallItem(root, installer(root)))
+        items.append(install.InstallItem(f"{root}2", installer(f"{root}2"), requires=[root]))
+    return items
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_bench_scheduler_wall_time(tmp_path, monkeypatch, capsys, jobs):
+    items = _chain_items()
+    _replay(tmp_path, monkeypatch, [_entry("run", f"build {item.id}", 1.0, lines=20) for item in items])
+    start = time.monotonic()
+    install.install(items, {item.id for item in items}, jobs=jobs)
+    wall = time.monotonic() - start
+    with capsys.disabled():
+        _report(f"scheduler jobs={jobs}", wall, "s")
+    recorded = 6 * 1.0 * SCALE
+    critical_path = 2 * 1.0 * SCALE
+    assert wall < (recorded if jobs == 1 else critical_path) + 0.5
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_bench_logging_overhead(tmp_path, monkeypatch, capsys, parallel):
+    lines = 20_000
+    _replay(tmp_path, monkeypatch, [_entry("run", "noisy", 0.0, lines=lines)], scale=0)
+    if parallel:
+        install._local.item = "noisy"  # prefixed, log-file-only path of parallel runs
+    start = time.monotonic()
+    install.run("noisy")
+    per_line = (time.monotonic() - start) / lines
+    with capsys.disabled():
+        _report(f"logging {'parallel' if parallel else 'serial'}", per_line * 1e6, "µs/line")
+    assert per_line < 200e-6
+
+
+def test_bench_probe_which(tmp_path, capsys):
+    bins = tmp_path / "bin"
+    for i in range(500):
+        exe = bins / f"tool{i}"
+        exe.write_text("")
+        exe.chmod(0o755)
+    lookups = 20_000
+    start = time.monotonic()
+    for i in range(lookups):
+        install._probe.which(f"tool{i % 1000}")  # half hit, half miss
+    per_lookup = (time.monotonic() - start) / lookups
+    with capsys.disabled():
+        _report("probe which", per_lookup * 1e6, "µs/lookup")
+    assert per_lookup < 100e-6
+
+
+def test_bench_probe_dpkg_parse(tmp_path, monkeypatch, capsys):
+    query = ["dpkg-query", "-W", "-f=${Package}\t${db:Status-Status}\t${Version}\n"]
+    out = [[0.0, f"pkg{i}\tinstalled\t1.{i}\n"] for i in range(5000)]
+    _replay(tmp_path, monkeypatch, [{"kind": "capture", "cmd": install.shlex.join(query), "rc": 0, "dur": 0.0, "out": out}])
+    start = time.monotonic()
+    versions = install._probe.dpkg()
+    elapsed = time.monotonic() - start
+    with capsys.disabled():
+        _report("probe dpkg 5000 packages", elapsed * 1e3, "ms")
+    assert versions["pkg4999"] == "1.4999"
+    assert elapsed < 1.0
+
+
+def test_bench_main_apt_items(tmp_path, monkeypatch, capsys):
+    ids = ["htop", "btop", "unattended-upgrades"]
+    apt_install = f"{install._APT_INSTALL} {install._APT_RETRIES} {' '.join(ids)}"
+    path = tmp_path / "transcript.jsonl"
+    path.write_text("".join(json.dumps(e) + "\n" for e in [
+        _entry("sudo", "DEBIAN_FRONTEND=noninteractive apt-get update -qq", 3.0, lines=30),
+        _entry("sudo", apt_install, 8.0, lines=200),
+    ]))
+    monkeypatch.setattr(sys, "argv", [
+        "install.py", "--only", *ids, "--replay", str(path), "--replay-scale", str(SCALE),
+    ])
+    monkeypatch.setattr(install, "_events", install.EventLog())  # main() starts its own writer
+    start = time.monotonic()
+    install.main()
+    wall = time.monotonic() - start
+    install._events.flush()
+    with capsys.disabled():
+        _report("main apt items", wall, "s")
+    assert apt_install not in install._transcript.missing
+    assert wall < (3.0 + 8.0) * SCALE + 1.0
+
+
+def test_bench_dep_graph(capsys):
+    noop = lambda: None
+    n = 2000
+    # listed dependents-first, each item requiring up to three later ones
+    items = [install.InstallItem(f"i{k}", noop, requires=[f"i{j}" for j in (k + 1, k + 7, k * 2 + 1) if j < n]) for k in range(n)]
+    start = time.monotonic()
+    graph = install.DepGraph(items)
+    chosen = graph.ordered(graph.closure({"i0"}))
+    elapsed = time.monotonic() - start
+    with capsys.disabled():
+        _report(f"dependency graph {n} items", elapsed * 1e3, "ms")
+    assert chosen[0].id == f"i{n - 1}" and chosen[-1].id == "i0"
+    assert elapsed < 0.5
+
+
+def test_bench_menu_index(capsys):
+    groups = [install.Group(f"g{k}", parent=f"g{k // 4}" if k else None) for k in range(100)]
+    items = [install.InstallItem(f"i{k}", lambda: None, parent=f"g{k % 100}") for k in range(2000)]
+    graph = install.DepGraph(items, groups)
+    start = time.monotonic()
+    menu = install._menu_index(graph.children)
+    elapsed = time.monotonic() - start
+    with capsys.disabled():
+        _report("menu index 2100 nodes", elapsed * 1e3, "ms")
+    assert len(menu.subtree["g0"]) == 2099
+    assert elapsed < 0.5
+
+
+STARTUP_BUDGET = 1.0  # seconds, median cold start of a non-interactive run
+
+
+def test_bench_startup_stdlib_only(tmp_path, capsys):
+    script = Path(install.__file__)
+    env = {k: v for k, v in os.environ.items() if k != "VIRTUAL_ENV"}
+    env["HOME"] = str(tmp_path)
+    probe = (
+        "import runpy, sys; sys.argv = [sys.argv[1], '--plan', 'json', '--only', 'tok'];"
+        "runpy.run_path(sys.argv[0], run_name='__main__');"
+        "print(sorted(m for m in ('rich', 'textual') if m in sys.modules), file=sys.stderr)"
+    )
+    times = []
+    for _ in range(5):
+        start = time.monotonic()
+        result = subprocess.run([sys.executable, "-c", probe, str(script)], env=env, capture_output=True, text=True)
+        times.append(time.monotonic() - start)
+        assert result.returncode == 0, result.stderr
+        assert result.stderr.strip().endswith("[]")  # no third-party imports
+    median = sorted(times)[len(times) // 2]
+    with capsys.disabled():
+        _report("startup --plan (stdlib only)", median, "s")
+    assert median < STARTUP_BUDGET
+
+
+def test_bench_noop_rerun(tmp_path, capsys):
+    bins = tmp_path / "bin"
+    config = tmp_path / "config.toml"
+    config.write_text("x = 1\n")
+    items = []
+    for i in range(20):
+        (bins / f"tool{i}").write_text("#!/bin/sh\n")
+        (bins / f"tool{i}").chmod(0o755)
+        items.append(install.InstallItem(f"tool{i}", lambda: None, bin=f"tool{i}", inputs=[str(config)]))
+    ids = {item.id for item in items}
+    install.install(items, ids, jobs=4)
+    start = time.monotonic()
+    install.install(items, ids, jobs=4, authenticate=lambda: pytest.fail("no-op re-run prompted for sudo"))
+    wall = time.monotonic() - start
+    with capsys.disabled():
+        _report("no-op re-run (20 items)", wall * 1e3, "ms")
+    assert wall < 0.5
+
+
+def test_bench_bundle_in(tmp_path, monkeypatch, capsys):
+    root = tmp_path / "staging"
+    (root / "artifacts").mkdir(parents=True)
+    body = os.urandom(32 << 20)
+    sha = hashlib.sha256(body).hexdigest()
+    (root / "artifacts" / sha).write_bytes(body)
+    release = {"tag": "v1", "assets": {"tool": {"url": "http://offline.invalid/tool", "size": len(body), "sha256": sha}}}
+    (root / "bundle.json").write_text(json.dumps({
+        "version": install._BUNDLE_VERSION, "created_at": "", "arch": platform.machine(), "codename": None,
+        "items": ["tool"], "apt": [], "crates": {}, "uv": {},
+        "releases": {"org/tool": release},
+        "artifacts": {"org/tool@v1/tool": {"sha256": sha, "size": len(body)}},
+        "files": {f"artifacts/{sha}": sha},
+    }))
+    out = tmp_path / "bundle.tar.gz"
+    with tarfile.open(out, "w:gz", compresslevel=1) as tar:
+        tar.add(root, arcname=".")
+    start = time.monotonic()
+    monkeypatch.setattr(install, "_bundle", install.open_bundle(out))
+    blob = install.fetch_release_asset("org/tool", "^tool$")
+    wall = time.monotonic() - start
+    with capsys.disabled():
+        _report("bundle-in 32 MB asset", wall, "s")
+    assert blob.stat().st_size == len(body)
+    assert wall < 2.0
@@ -128,7 +128,7 @@ else
     fail "warning emitted for existing config"
 fi
 
-# --- Install log (2 checks) ---
+# --- Install log (3 checks) ---
 echo ""
 echo "=== Install log test ==="
 
@@ -144,6 +144,12 @@ else
     pass "install.log contains no ANSI escapes"
 fi
 
+if cexec "python3 -c 'import json, sys; [json.loads(l) for l in open(sys.argv[1])]' /root/setup/install.jsonl"; then
+    pass "install.jsonl parses"
+else
+    fail "install.jsonl parses"
+fi
+
 # --- Summary ---
 echo ""
 if [ "$FAILURES" -eq 0 ]; then
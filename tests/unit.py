@@ -1,7 +1,15 @@
 """Unit tests for install.py — file-operation logic only. No container required."""
 
+import hashlib
+import io
+import json
 import os
+import re
 import sys
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -17,7 +25,90 @@ def reset_install_state(tmp_path, monkeypatch):
     """Redirect HOME to tmp_path and reset module globals before each test."""
     monkeypatch.setenv("HOME", str(tmp_path))
     install._warnings.clear()
-    install._indent = 0
+    install._local.__dict__.clear()
+    install._apt_state.present.clear()
+    install._apt_state.batched.clear()
+    install._apt_state.updated = False
+    install._releases.clear()
+    install._binstall_batch.crates = []
+    install._binstall_batch.returncode = None
+    install._timings.clear()
+    install._spans.clear()
+    install._span_threads.clear()
+    monkeypatch.setattr(install, "_probe", install.Probe())
+    monkeypatch.setattr(install, "_options", install.Options())
+    monkeypatch.setattr(install, "_transcript", None)
+    monkeypatch.setattr(install, "_events", install.EventLog())
+    monkeypatch.setattr(install, "_helper", None)
+    monkeypatch.setattr(install, "_helper_failed", False)
+    monkeypatch.setattr(install, "_journal", install.Journal())
+    monkeypatch.setattr(install, "_RETRY_DELAY", 0)
+    monkeypatch.setattr(install, "_bundle", None)
+
+
+@pytest.fixture
+def http_server():
+    """Local stand-in for GitHub: serves `files` (path -> bytes) and counts hits per path.
+
+    Honours "Range: bytes=N-[M]" unless `ranges` is False. Connection drops
+    are injected with `drops` (path -> list of byte counts): each request
+    takes the next count, sends that many bytes of its body and disconnects.
+    `sent` totals the body bytes served.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.requests.append((self.path, dict(self.headers)))
+            body = server.files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            etag = server.etags.get(self.path)
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            start, end = 0, len(body) - 1
+            match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match and server.ranges:
+                start, end = int(match[1]), min(int(match[2] or end), end)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            else:
+                self.send_response(200)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(end + 1 - start))
+            self.end_headers()
+            with server.lock:
+                drops = server.drops.get(self.path)
+                cut = drops.pop(0) if drops else None
+            chunk = body[start:end + 1][:cut]
+            self.wfile.write(chunk)
+            with server.lock:
+                server.sent += len(chunk)
+            if cut is not None:
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.files = {}
+    server.etags = {}
+    server.hits = {}
+    server.requests = []
+    server.ranges = True
+    server.drops = {}
+    server.sent = 0
+    server.lock = threading.Lock()
+    server.url = lambda path: f"http://127.0.0.1:{server.server_port}{path}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
 
 
 # ---------------------------------------------------------------------------
@@ -40,6 +131,29 @@ def test_config_diff_different(tmp_path):
     assert install._config_diff(a, b) is not None
 
 
+def test_config_diff_stops_at_first_difference(tmp_path, monkeypatch):
+    a = tmp_path / "a.toml"
+    b = tmp_path / "b.toml"
+    a.write_text("key = 'value'\n")
+    b.write_bytes(b"key = 'other'\n" + b"x = 1\n" * 100_000 + b"\xff\xfe not utf-8\n")
+    monkeypatch.setattr(install.difflib, "unified_diff", lambda *a, **kw: pytest.fail("diff built eagerly"))
+    assert install._config_diff(a, b) is not None  # never decodes the tail
+
+
+def test_config_diff_capped_in_warnings(tmp_path, capsys):
+    a = tmp_path / "a.toml"
+    b = tmp_path / "b.toml"
+    a.write_text("".join(f"a{i} = 1\n" for i in range(500)))
+    b.write_text("".join(f"b{i} = 1\n" for i in range(500)))
+    install.warn("differs", diff=install._config_diff(a, b))
+    install._options.diff_lines = 10
+    install.print_warnings()
+    out = capsys.readouterr().out
+    assert "-b0 = 1" in out and "b9 = 1" not in out
+    assert "truncated at 10 lines" in out
+    assert len(str(install._config_diff(a, b)).splitlines()) == 1003
+
+
 # ---------------------------------------------------------------------------
 # _link_helix_config
 # ---------------------------------------------------------------------------
@@ -85,6 +199,47 @@ def test_helix_config_skips_equivalent_real_file(tmp_path):
     assert len(install._warnings) == 0
 
 
+# ---------------------------------------------------------------------------
+# config links
+# ---------------------------------------------------------------------------
+
+def test_links_cover_existing_resources():
+    for link in install.LINKS:
+        assert (install.SCRIPT_DIR / "resources" / link.src).is_file()
+    assert install.link_inputs("tok") == ["resources/tok/tok.py", "~/.local/bin/tok"]
+
+
+def _equivalent_helix_configs(tmp_path):
+    """Real files with the resource content, old enough to have their hashes cached."""
+    for filename in ("config.toml", "languages.toml"):
+        src = install.SCRIPT_DIR / "resources" / "helix" / filename
+        dst = tmp_path / ".config" / "helix" / filename
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.write_text(src.read_text())
+        os.utime(dst, ns=(time.time_ns() - 10**10,) * 2)
+
+
+def test_links_unchanged_files_not_reread(tmp_path, monkeypatch):
+    _equivalent_helix_configs(tmp_path)
+    install.reconcile_links("helix")
+    opened = []
+    real_open = Path.open
+    monkeypatch.setattr(Path, "open", lambda self, *a, **kw: opened.append(self) or real_open(self, *a, **kw))
+    install.reconcile_links("helix")
+    assert [path for path in opened if path.suffix == ".toml"] == []  # only the hash cache is read
+    assert install._warnings == []
+
+
+def test_links_modified_file_rehashed(tmp_path):
+    _equivalent_helix_configs(tmp_path)
+    install.reconcile_links("helix")
+    dst = tmp_path / ".config" / "helix" / "config.toml"
+    dst.write_text(dst.read_text() + "extra = 1\n")
+    install.reconcile_links("helix")
+    [(msg, diff)] = install._warnings
+    assert str(dst) in msg and "-extra = 1" in str(diff)
+
+
 # ---------------------------------------------------------------------------
 # install_tok
 # ---------------------------------------------------------------------------
@@ -119,7 +274,7 @@ def test_install_tok_does_not_overwrite_real_file(tmp_path):
 
 
 # ---------------------------------------------------------------------------
-# resolve_selection
+# selection closure (DepGraph.closure)
 # ---------------------------------------------------------------------------
 
 def _make_items():
@@ -140,26 +295,26 @@ def _make_items():
 
 def test_resolve_activates_prerequisite():
     items = _make_items()
-    selected = install.resolve_selection(items, {"b"})
+    selected = install.DepGraph(items).closure({"b"})
     assert "a" in selected
 
 
 def test_resolve_user_selected_item_kept():
     items = _make_items()
-    selected = install.resolve_selection(items, {"b"})
+    selected = install.DepGraph(items).closure({"b"})
     assert "b" in selected
 
 
 def test_resolve_unrelated_item_excluded():
     items = _make_items()
-    selected = install.resolve_selection(items, {"b"})
+    selected = install.DepGraph(items).closure({"b"})
     assert "d" not in selected
 
 
 def test_resolve_deselect_drops_auto_prerequisite():
     # b was selected (auto-activating a); deselecting b removes a
     items = _make_items()
-    selected = install.resolve_selection(items, set())
+    selected = install.DepGraph(items).closure(set())
     assert "a" not in selected
     assert "b" not in selected
 
@@ -167,14 +322,14 @@ def test_resolve_deselect_drops_auto_prerequisite():
 def test_resolve_shared_prerequisite_kept_while_one_dependent_remains():
     # b and c both require a; deselecting b (only c remains) keeps a
     items = _make_items()
-    selected = install.resolve_selection(items, {"c"})
+    selected = install.DepGraph(items).closure({"c"})
     assert "a" in selected
 
 
 def test_resolve_prerequisite_kept_when_independently_selected():
     # user explicitly selected both a and b; deselecting b (user_selected={"a"}) keeps a
     items = _make_items()
-    selected = install.resolve_selection(items, {"a"})
+    selected = install.DepGraph(items).closure({"a"})
     assert "a" in selected
     assert "b" not in selected
 
@@ -182,14 +337,14 @@ def test_resolve_prerequisite_kept_when_independently_selected():
 def test_resolve_all_items_selected_by_default():
     items = _make_items()
     all_ids = {item.id for item in items}
-    selected = install.resolve_selection(items, all_ids)
+    selected = install.DepGraph(items).closure(all_ids)
     assert selected == all_ids
 
 
 def test_resolve_only_flag_subset():
     items = _make_items()
     # --only d: no prerequisites needed
-    selected = install.resolve_selection(items, {"d"})
+    selected = install.DepGraph(items).closure({"d"})
     assert selected == {"d"}
 
 
@@ -198,7 +353,7 @@ def test_resolve_skip_flag_subset():
     all_ids = {item.id for item in items}
     # --skip b,c: remove b and c from user_selected; a no longer required
     user_selected = all_ids - {"b", "c"}
-    selected = install.resolve_selection(items, user_selected)
+    selected = install.DepGraph(items).closure(user_selected)
     assert "b" not in selected
     assert "c" not in selected
     assert "a" in selected   # a is still user-selected independently
@@ -209,10 +364,1668 @@ def test_resolve_skip_removes_prerequisite_when_no_longer_needed():
     items = _make_items()
     # --skip a,b,c: none require anything; a,b,c all gone
     user_selected = {"d"}
-    selected = install.resolve_selection(items, user_selected)
+    selected = install.DepGraph(items).closure(user_selected)
     assert selected == {"d"}
 
 
+# ---------------------------------------------------------------------------
+# dependency graph
+# ---------------------------------------------------------------------------
+
+def test_graph_order_puts_requirements_first_regardless_of_list_order():
+    noop = lambda: None
+    items = [
+        install.InstallItem("c", noop, requires=["b"]),
+        install.InstallItem("x", noop),
+        install.InstallItem("b", noop, requires=["a"]),
+        install.InstallItem("a", noop),
+    ]
+    assert install.DepGraph(items).order == ["x", "a", "b", "c"]
+    assert [i.id for i in install.DepGraph(items).ordered({"c", "a"})] == ["a", "c"]
+
+
+def test_graph_registry_order_is_a_valid_install_order():
+    graph = install.DepGraph(install._items(), install._groups())
+    position = {item_id: i for i, item_id in enumerate(graph.order)}
+    for item in install._items():
+        assert all(position[r] < position[item.id] for r in item.requires)
+
+
+def test_graph_closure_and_reverse_index():
+    graph = install.DepGraph(_make_items())
+    assert graph.closure({"b"}) == {"a", "b"}
+    assert graph.closure(set()) == set()
+    assert graph.required_by["a"] == ["b", "c"]
+
+
+def test_graph_rejects_unknown_requires():
+    items = [install.InstallItem("a", lambda: None, requires=["nope"])]
+    with pytest.raises(ValueError, match="unknown requires: a -> nope"):
+        install.DepGraph(items)
+
+
+def test_graph_rejects_cycle():
+    noop = lambda: None
+    items = [
+        install.InstallItem("a", noop),
+        install.InstallItem("b", noop, requires=["d"]),
+        install.InstallItem("c", noop, requires=["b"]),
+        install.InstallItem("d", noop, requires=["c", "a"]),
+    ]
+    with pytest.raises(ValueError, match="requires cycle: b -> d -> c -> b"):
+        install.DepGraph(items)
+
+
+def test_graph_rejects_duplicate_ids_and_unknown_parent():
+    noop = lambda: None
+    with pytest.raises(ValueError, match="duplicate item ids: a"):
+        install.DepGraph([install.InstallItem("a", noop), install.InstallItem("a", noop)])
+    with pytest.raises(ValueError, match="unknown parent: a -> Nope"):
+        install.DepGraph([install.InstallItem("a", noop, parent="Nope")], [install.Group("G")])
+
+
+def test_graph_rejects_parent_cycle():
+    noop = lambda: None
+    items = [install.InstallItem("a", noop, parent="b"), install.InstallItem("b", noop, parent="a"), install.InstallItem("c", noop)]
+    with pytest.raises(ValueError, match="parent cycle: a, b"):
+        install.DepGraph(items, [])
+
+
+def test_graph_menu_tree():
+    graph = install.DepGraph(install._items(), install._groups())
+    assert ("Resource", True) in graph.children["System"]
+    assert ("rust-analyzer", False) in graph.children["rust"]
+    assert graph.parent["htop"] == "Resource"
+    assert graph.parent["System"] is None
+
+
+# ---------------------------------------------------------------------------
+# install scheduling
+# ---------------------------------------------------------------------------
+
+def _recording_items(order, requires=None, barrier=None):
+    """Items a..d whose installers append their id to `order`."""
+    requires = requires or {}
+
+    def make(item_id):
+        def installer():
+            if barrier is not None and not requires.get(item_id):
+                barrier.wait(timeout=5)
+            order.append(item_id)
+        return installer
+
+    return [
+        install.InstallItem(i, make(i), requires=requires.get(i, []))
+        for i in ("a", "b", "c", "d")
+    ]
+
+
+def test_install_jobs_1_keeps_list_order():
+    order = []
+    items = _recording_items(order)
+    install.install(items, {"a", "b", "c", "d"}, jobs=1)
+    assert order == ["a", "b", "c", "d"]
+
+
+def test_install_jobs_1_runs_requirements_first():
+    order = []
+    items = _recording_items(order, requires={"a": ["d"]})
+    install.install(items, {"a", "b", "c", "d"}, jobs=1)
+    assert order == ["b", "c", "d", "a"]
+
+
+def test_install_parallel_respects_requires():
+    order = []
+    items = _recording_items(order, requires={"b": ["a"], "c": ["b"]})
+    install.install(items, {"a", "b", "c", "d"}, jobs=4)
+    assert order.index("a") < order.index("b") < order.index("c")
+    assert sorted(order) == ["a", "b", "c", "d"]
+
+
+def test_install_parallel_runs_independent_items_concurrently():
+    import threading
+    order = []
+    # a, b, d have no requires and must all be in flight at once to pass the barrier
+    barrier = threading.Barrier(3)
+    items = _recording_items(order, requires={"c": ["a"]}, barrier=barrier)
+    install.install(items, {"a", "b", "c", "d"}, jobs=3)
+    assert order.index("a") < order.index("c")
+    assert sorted(order) == ["a", "b", "c", "d"]
+
+
+def test_install_parallel_failure_stops_dependents():
+    ran = []
+    def fail():
+        sys.exit(1)
+    items = [
+        install.InstallItem("a", fail),
+        install.InstallItem("b", lambda: ran.append("b"), requires=["a"]),
+    ]
+    with pytest.raises(SystemExit):
+        install.install(items, {"a", "b"}, jobs=2)
+    assert ran == []
+
+
+def test_install_parallel_serialises_git_config_writes(tmp_path, monkeypatch):
+    # the fake git fails like the real one when ~/.gitconfig.lock is already taken
+    bins = tmp_path / "bin"
+    bins.mkdir()
+    (bins / "git").write_text(
+        "#!/bin/sh\n"
+        'mkdir "$HOME/.gitconfig.lock" 2>/dev/null || { echo "error: could not lock config file" >&2; exit 255; }\n'
+        'echo "$*" >> "$HOME/git.log"\nsleep 0.05\nrmdir "$HOME/.gitconfig.lock"\n'
+    )
+    for name in ("git", "delta", "difft"):
+        (bins / name).touch()
+        (bins / name).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bins}{os.pathsep}{os.environ['PATH']}")
+    items = [
+        install.InstallItem("delta", install.install_delta, bin="delta"),
+        install.InstallItem("difft", install.install_difft, bin="difft"),
+    ]
+    install.install(items, {"delta", "difft"}, jobs=2)
+    assert len((tmp_path / "git.log").read_text().splitlines()) == 7
+
+
+def test_parse_args_jobs(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["install.py", "--all", "--jobs", "1"])
+    install._parse_args(_named_items())
+    assert install._options.jobs == 1
+
+
+# ---------------------------------------------------------------------------
+# batched apt
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def fake_apt(monkeypatch, tmp_path):
+    """Fake dpkg state and capture privileged commands instead of running them.
+
+    Package lists start fresh, so apt update is skipped unless a test ages them.
+    """
+    state = {"installed": set(), "commands": [], "fail": set()}
+    lists = tmp_path / "apt-lists"
+    lists.mkdir()
+    (lists / "archive_InRelease").write_text("")
+    state["lists"] = lists
+    monkeypatch.setattr(install, "_APT_LISTS", lists)
+
+    def dpkg_installed(packages):
+        return {p for p in packages if p in state["installed"]}
+
+    def sudo_stream(cmd):
+        state["commands"].append(cmd)
+        pkgs = [w for w in cmd.split() if not w.startswith("-") and "=" not in w]
+        state["installed"].update(p for p in pkgs if p not in state["fail"])
+        return 100 if state["fail"] & set(pkgs) else 0
+
+    monkeypatch.setattr(install, "_dpkg_installed", dpkg_installed)
+    monkeypatch.setattr(install, "_sudo_stream", sudo_stream)
+    return state
+
+
+def _apt_items():
+    return [
+        install.InstallItem("x", lambda: install.apt_install("pkg-x"), apt=["pkg-x"]),
+        install.InstallItem("y", lambda: install.apt_install("pkg-y"), apt=["pkg-y", "shared"]),
+        install.InstallItem("z", lambda: None, apt=["shared"]),
+    ]
+
+
+def test_apt_batch_single_transaction(fake_apt):
+    install.install(_apt_items(), {"x", "y", "z"})
+    assert len(fake_apt["commands"]) == 1
+    cmd = fake_apt["commands"][0]
+    assert "pkg-x" in cmd and "pkg-y" in cmd and cmd.count("shared") == 1
+
+
+def test_apt_batch_skips_installed_packages(fake_apt):
+    fake_apt["installed"] = {"pkg-x", "pkg-y", "shared"}
+    install.install(_apt_items(), {"x", "y", "z"})
+    assert fake_apt["commands"] == []
+
+
+def test_apt_batch_only_installs_missing(fake_apt):
+    fake_apt["installed"] = {"pkg-x"}
+    install.install(_apt_items(), {"x", "y"})
+    assert len(fake_apt["commands"]) == 1
+    assert "pkg-x" not in fake_apt["commands"][0]
+
+
+def test_apt_batch_failure_names_owning_item(fake_apt, capsys):
+    fake_apt["fail"] = {"pkg-y"}
+    with pytest.raises(SystemExit):
+        install.install(_apt_items(), {"x", "y"})
+    out = capsys.readouterr().out
+    assert "pkg-y (needed by y)" in out
+    assert out.splitlines()[-1].strip().startswith("FAILED (exit 100)")
+
+
+def test_apt_install_outside_batch_installs_individually(fake_apt):
+    install.apt_install("lonely")
+    assert len(fake_apt["commands"]) == 1
+    assert fake_apt["commands"][0].endswith("lonely")
+
+
+def _age_apt_lists(lists, seconds):
+    for f in lists.iterdir():
+        t = f.stat().st_mtime - seconds
+        os.utime(f, (t, t))
+
+
+def _updates(commands):
+    return [c for c in commands if "apt-get update" in c]
+
+
+def test_apt_update_skipped_when_lists_fresh(fake_apt):
+    install.install(_apt_items(), {"x"})
+    assert _updates(fake_apt["commands"]) == []
+    assert len(fake_apt["commands"]) == 1
+
+
+def test_apt_update_runs_once_when_lists_stale(fake_apt):
+    _age_apt_lists(fake_apt["lists"], install.Options.apt_ttl + 60)
+    install.install(_apt_items(), {"x", "y"})
+    install.apt_install("lonely")
+    assert len(_updates(fake_apt["commands"])) == 1
+    assert "apt-get update" in fake_apt["commands"][0]
+
+
+def test_apt_update_not_run_when_nothing_missing(fake_apt):
+    _age_apt_lists(fake_apt["lists"], install.Options.apt_ttl + 60)
+    fake_apt["installed"] = {"pkg-x", "pkg-y", "shared"}
+    install.install(_apt_items(), {"x", "y", "z"})
+    assert fake_apt["commands"] == []
+
+
+def test_apt_update_forced_by_refresh_flag(fake_apt):
+    install._options.refresh_apt = True
+    install.install(_apt_items(), {"x"})
+    assert len(_updates(fake_apt["commands"])) == 1
+
+
+def test_apt_update_runs_when_lists_missing(fake_apt):
+    for f in fake_apt["lists"].iterdir():
+        f.unlink()
+    install.install(_apt_items(), {"x"})
+    assert len(_updates(fake_apt["commands"])) == 1
+
+
+# ---------------------------------------------------------------------------
+# release artifact cache
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def fake_release(http_server, monkeypatch):
+    """Point _github_release at the local server; returns a setter for the current release."""
+    current = {}
+
+    def publish(tag, name, body, sha256=None):
+        path = f"/download/{tag}/{name}"
+        http_server.files[path] = body
+        current.update(tag=tag, assets={name: {
+            "url": http_server.url(path),
+            "size": len(body),
+            "sha256": sha256 or hashlib.sha256(body).hexdigest(),
+        }})
+        return path
+
+    monkeypatch.setattr(install, "_github_release", lambda repo: current)
+    return publish
+
+
+def test_release_asset_downloaded_and_cached(fake_release, http_server):
+    path = fake_release("v1", "tool-linux", b"binary-v1")
+    first = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    second = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    assert first == second
+    assert first.read_bytes() == b"binary-v1"
+    assert first.name == hashlib.sha256(b"binary-v1").hexdigest()
+    assert http_server.hits[path] == 1
+
+
+def test_release_asset_new_tag_downloads_again(fake_release, http_server):
+    fake_release("v1", "tool-linux", b"binary-v1")
+    install.fetch_release_asset("org/tool", r"^tool-linux$")
+    fake_release("v2", "tool-linux", b"binary-v2")
+    blob = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    assert blob.read_bytes() == b"binary-v2"
+
+
+def test_release_asset_checksum_mismatch_fails(fake_release, tmp_path):
+    fake_release("v1", "tool-linux", b"tampered", sha256="0" * 64)
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/tool", r"^tool-linux$")
+    store = tmp_path / ".cache" / "devenv" / "artifacts"
+    assert [p.name for p in store.iterdir()] == []
+
+
+def test_release_asset_cache_dir_option(fake_release, tmp_path):
+    install._options.cache_dir = tmp_path / "elsewhere"
+    fake_release("v1", "tool-linux", b"binary-v1")
+    blob = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    assert blob.parent == tmp_path / "elsewhere" / "artifacts"
+
+
+def test_release_asset_cache_evicts_least_recently_used(fake_release, tmp_path):
+    install._options.cache_max_mb = 1
+    mb = 1024 * 1024
+    fake_release("v1", "a", b"a" * (mb // 2))
+    old = install.fetch_release_asset("org/a", "^a$")
+    os.utime(old, (1, 1))
+    fake_release("v1", "b", b"b" * (mb // 2))
+    install.fetch_release_asset("org/b", "^b$")
+    fake_release("v1", "c", b"c" * (mb // 2))
+    newest = install.fetch_release_asset("org/c", "^c$")
+    assert not old.exists()
+    assert newest.exists()
+
+
+# ---------------------------------------------------------------------------
+# release metadata resolver
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def github_api(http_server, monkeypatch):
+    """Serve releases/latest for fake repos; returns a publish(repo, tag, etag) helper."""
+    monkeypatch.setattr(install, "GITHUB_API", http_server.url(""))
+
+    def publish(repo, tag, etag):
+        path = f"/repos/{repo}/releases/latest"
+        http_server.files[path] = json.dumps({
+            "tag_name": tag,
+            "assets": [{
+                "name": "tool-linux",
+                "browser_download_url": f"https://example.invalid/{tag}/tool-linux",
+                "size": 3,
+                "digest": "sha256:" + "a" * 64,
+            }],
+        }).encode()
+        http_server.etags[path] = etag
+        return path
+
+    return publish
+
+
+def _forget_releases():
+    install._releases.clear()
+
+
+def test_resolve_releases_fetches_all_repos(github_api):
+    github_api("org/one", "v1", '"e1"')
+    github_api("org/two", "v2", '"e2"')
+    releases = install.resolve_releases(["org/one", "org/two"])
+    assert releases["org/one"]["tag"] == "v1"
+    assert releases["org/two"]["tag"] == "v2"
+    asset = releases["org/one"]["assets"]["tool-linux"]
+    assert asset["url"].endswith("/v1/tool-linux")
+    assert asset["sha256"] == "a" * 64
+
+
+def test_resolve_releases_within_ttl_uses_disk_cache(github_api, http_server):
+    path = github_api("org/one", "v1", '"e1"')
+    install.resolve_releases(["org/one"])
+    _forget_releases()
+    assert install.resolve_releases(["org/one"])["org/one"]["tag"] == "v1"
+    assert http_server.hits[path] == 1
+
+
+def test_resolve_releases_revalidates_with_etag(github_api, http_server):
+    path = github_api("org/one", "v1", '"e1"')
+    install._options.release_ttl = 0
+    install.resolve_releases(["org/one"])
+    _forget_releases()
+    assert install.resolve_releases(["org/one"])["org/one"]["tag"] == "v1"
+    assert http_server.requests[-1][1].get("If-None-Match") == '"e1"'
+    assert http_server.hits[path] == 2
+
+
+def test_resolve_releases_picks_up_new_release(github_api):
+    github_api("org/one", "v1", '"e1"')
+    install._options.release_ttl = 0
+    install.resolve_releases(["org/one"])
+    _forget_releases()
+    github_api("org/one", "v2", '"e2"')
+    assert install.resolve_releases(["org/one"])["org/one"]["tag"] == "v2"
+
+
+def test_resolve_releases_falls_back_to_stale_cache(github_api, http_server):
+    path = github_api("org/one", "v1", '"e1"')
+    install._options.release_ttl = 0
+    install.resolve_releases(["org/one"])
+    _forget_releases()
+    del http_server.files[path]  # lookup now 404s
+    assert install.resolve_releases(["org/one"])["org/one"]["tag"] == "v1"
+    assert any("using cached v1" in msg for msg, _ in install._warnings)
+
+
+def test_resolve_releases_failure_without_cache_exits(github_api):
+    with pytest.raises(SystemExit):
+        install.resolve_releases(["org/missing"])
+
+
+# ---------------------------------------------------------------------------
+# Prefetcher
+# ---------------------------------------------------------------------------
+
+def _prefetch_items():
+    noop = lambda: None
+    return [
+        install.InstallItem("tool", noop, bin="devenv-test-missing-bin", github="org/tool", asset="^tool-linux$"),
+        install.InstallItem("other", noop),
+    ]
+
+
+def _artifact_blobs(tmp_path):
+    store = tmp_path / ".cache" / "devenv" / "artifacts"
+    return [p for p in store.glob("*") if p.name != "index.json" and not p.name.startswith(".")] if store.exists() else []
+
+
+def test_prefetch_download_reused_by_install(fake_release, http_server, monkeypatch, capsys):
+    monkeypatch.setattr(install, "resolve_releases", lambda repos: {})
+    path = fake_release("v1", "tool-linux", b"binary-v1")
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool", "other"})
+    prefetch.finish({"tool", "other"})
+    assert capsys.readouterr().out == ""  # background work is silent
+    blob = install.fetch_release_asset("org/tool", "^tool-linux$")
+    assert blob.read_bytes() == b"binary-v1"
+    assert http_server.hits[path] == 1
+
+
+def test_prefetch_deselected_item_is_cancelled(fake_release, http_server, monkeypatch, tmp_path):
+    monkeypatch.setattr(install, "resolve_releases", lambda repos: {})
+    fake_release("v1", "tool-linux", b"binary-v1")
+    release_lookup = install._github_release
+    gate = threading.Event()
+
+    def slow_lookup(repo):
+        gate.wait(timeout=5)
+        return release_lookup(repo)
+
+    monkeypatch.setattr(install, "_github_release", slow_lookup)
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool"})
+    prefetch.update(set())  # deselect while the download is still waiting
+    gate.set()
+    prefetch.finish(set())
+    assert _artifact_blobs(tmp_path) == []
+
+
+def test_prefetch_failures_stay_out_of_the_warnings_summary(monkeypatch):
+    def failing(repos):
+        install.warn("release lookup failed")
+        sys.exit(1)
+
+    monkeypatch.setattr(install, "resolve_releases", failing)
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool"})
+    prefetch.finish(set())
+    assert install._warnings == []
+
+
+def test_prefetch_resolves_releases_of_selected_items_only(monkeypatch):
+    resolved = []
+    monkeypatch.setattr(install, "resolve_releases", lambda repos: resolved.append(repos) or {})
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"other"})
+    prefetch.finish({"other"})
+    assert resolved == []
+
+
+def _gated_fetches(monkeypatch):
+    """Replace fetch_release_asset; the first call blocks until the returned gate is set."""
+    monkeypatch.setattr(install, "resolve_releases", lambda repos: {})
+    events = []
+    gate = threading.Event()
+
+    def fetch(repo, asset, cancel=None):
+        events.append("start")
+        if events.count("start") == 1:
+            gate.wait(timeout=5)
+        events.append("end")
+
+    monkeypatch.setattr(install, "fetch_release_asset", fetch)
+    return events, gate
+
+
+def test_prefetch_reselected_item_waits_for_cancelled_download(monkeypatch):
+    events, gate = _gated_fetches(monkeypatch)
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool"})
+    while not events:
+        time.sleep(0.01)
+    prefetch.update(set())
+    prefetch.update({"tool"})
+    time.sleep(0.1)
+    assert events == ["start"]  # the new download waits for the cancelled one to clean up
+    gate.set()
+    prefetch.finish({"tool"})
+    assert events == ["start", "end", "start", "end"]
+
+
+def test_prefetch_abort_does_not_wait(monkeypatch, capsys):
+    events, gate = _gated_fetches(monkeypatch)
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool"})
+    start = time.monotonic()
+    prefetch.abort()
+    assert time.monotonic() - start < 0.5
+    gate.set()
+
+
+def test_prefetch_finish_says_what_it_waits_for(monkeypatch, capsys):
+    events, gate = _gated_fetches(monkeypatch)
+    monkeypatch.setattr(install.Prefetcher, "_NOTICE_AFTER", 0.05)
+    prefetch = install.Prefetcher(_prefetch_items())
+    prefetch.start({"tool"})
+    threading.Timer(0.2, gate.set).start()
+    prefetch.finish({"tool"})
+    assert capsys.readouterr().out == "Waiting for background work: tool\n"
+    assert events == ["start", "end"]
+
+
+def test_menu_declined_dependencies_abort_prefetch_without_waiting(monkeypatch, capsys):
+    calls = []
+
+    class FakePrefetcher:
+        def __init__(self, items):
+            pass
+
+        def start(self, selected):
+            calls.append("start")
+
+        def finish(self, selected):
+            calls.append("finish")
+
+        def abort(self):
+            calls.append("abort")
+
+    monkeypatch.setattr(sys, "argv", ["install.py"])
+    monkeypatch.setattr(sys, "stdin", _FakeTerminal())
+    monkeypatch.setattr(install, "_require_menu_deps", lambda: None)
+    monkeypatch.setattr(install, "Prefetcher", FakePrefetcher)
+    monkeypatch.setattr(install, "run_selection_menu", lambda graph, on_change=None: {"zellij"})
+    monkeypatch.setattr("builtins.input", lambda prompt: calls.append("prompt") or "n")
+    with pytest.raises(SystemExit):
+        install.main()
+    assert calls == ["start", "prompt", "abort"]
+    assert capsys.readouterr().out.endswith("Aborted.\n")
+
+
+def test_fetch_release_asset_cancelled_leaves_nothing(fake_release, tmp_path):
+    fake_release("v1", "tool-linux", b"binary-v1")
+    cancel = threading.Event()
+    cancel.set()
+    assert install.fetch_release_asset("org/tool", "^tool-linux$", cancel) is None
+    assert _artifact_blobs(tmp_path) == []
+    assert not list((tmp_path / ".cache" / "devenv" / "artifacts").glob(".partial-*"))
+
+
+# ---------------------------------------------------------------------------
+# batched cargo binstall
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    """Capture unprivileged commands; crates listed in `fail` make a command fail."""
+    state = {"commands": [], "fail": set()}
+
+    def run_stream(cmd):
+        state["commands"].append(cmd)
+        return 1 if any(c in cmd.split() for c in state["fail"]) else 0
+
+    monkeypatch.setattr(install, "_run_stream", run_stream)
+    return state
+
+
+def _crate_items():
+    return [
+        install.InstallItem(c, lambda c=c: install.binstall(f"crate-{c}"), bin=f"devenv-test-missing-{c}", crate=f"crate-{c}")
+        for c in ("x", "y", "z")
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_binstall_single_invocation(fake_run, jobs):
+    install.install(_crate_items(), {"x", "y", "z"}, jobs=jobs)
+    assert fake_run["commands"] == ["cargo binstall --no-confirm crate-x crate-y crate-z"]
+
+
+def test_binstall_only_selected_crates(fake_run):
+    install.install(_crate_items(), {"x", "z"})
+    assert fake_run["commands"] == ["cargo binstall --no-confirm crate-x crate-z"]
+
+
+def test_binstall_failure_retries_per_item(fake_run, capsys):
+    fake_run["fail"] = {"crate-y"}
+    with pytest.raises(SystemExit):
+        install.install(_crate_items(), {"x", "y", "z"})
+    assert fake_run["commands"][1:] == [
+        "cargo binstall --no-confirm crate-x",
+        "cargo binstall --no-confirm crate-y",
+    ]
+    assert capsys.readouterr().out.splitlines()[-1].strip() == "FAILED (exit 1): cargo binstall --no-confirm crate-y"
+
+
+def test_binstall_unplanned_crate_runs_alone(fake_run):
+    install.binstall("crate-w")
+    assert fake_run["commands"] == ["cargo binstall --no-confirm crate-w"]
+
+
+# ---------------------------------------------------------------------------
+# uv tool install
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def uv_pins(tmp_path, monkeypatch):
+    pins = tmp_path / "uv-tools.toml"
+    pins.write_text("[pins]\n")
+    monkeypatch.setattr(install, "UV_PINS", pins)
+    return pins
+
+
+def test_uv_tool_install_uses_shared_cache(fake_run, uv_pins, tmp_path):
+    install.uv_tool_install("ruff")
+    cache = tmp_path / ".cache" / "devenv" / "uv"
+    assert fake_run["commands"] == [f"UV_CACHE_DIR={cache} uv tool install ruff"]
+
+
+def test_uv_tool_install_pinned_tries_offline_cache(fake_run, uv_pins, tmp_path):
+    uv_pins.write_text('[pins]\nruff = "0.14.0"\n')
+    (tmp_path / ".cache" / "devenv" / "uv").mkdir(parents=True)
+    install.uv_tool_install("ruff")
+    assert len(fake_run["commands"]) == 1
+    assert fake_run["commands"][0].endswith("uv tool install --offline ruff==0.14.0")
+
+
+def test_uv_tool_install_pinned_falls_back_online(fake_run, uv_pins, tmp_path):
+    uv_pins.write_text('[pins]\nruff = "0.14.0"\n')
+    (tmp_path / ".cache" / "devenv" / "uv").mkdir(parents=True)
+    fake_run["fail"] = {"--offline"}
+    install.uv_tool_install("ruff")
+    assert fake_run["commands"][-1].endswith("uv tool install ruff==0.14.0")
+
+
+def test_uv_tool_install_pinned_without_cache_goes_online(fake_run, uv_pins):
+    uv_pins.write_text('[pins]\nruff = "0.14.0"\n')
+    install.uv_tool_install("ruff")
+    assert len(fake_run["commands"]) == 1
+    assert "--offline" not in fake_run["commands"][0]
+
+
+# ---------------------------------------------------------------------------
+# --plan
+# ---------------------------------------------------------------------------
+
+def _plan_items():
+    noop = lambda: None
+    return [
+        install.InstallItem("present", noop, bin="sh"),
+        install.InstallItem("missing", noop, bin="devenv-test-missing-bin", requires=["present"]),
+        install.InstallItem("tool", noop, bin="devenv-test-missing-tool", github="org/tool", asset="^tool-linux$"),
+        install.InstallItem("conf", noop),
+    ]
+
+
+def _plan_entry(plan, item_id):
+    return next(e for e in plan["items"] if e["id"] == item_id)
+
+
+def test_plan_reports_state_dependencies_and_backend():
+    plan = install.build_plan(_plan_items(), {"missing", "conf"})
+    assert [e["id"] for e in plan["items"]] == ["present", "missing", "conf"]
+    assert _plan_entry(plan, "present")["satisfied"] is True
+    assert _plan_entry(plan, "present")["selected"] == "dependency"
+    assert _plan_entry(plan, "missing")["satisfied"] is False
+    assert _plan_entry(plan, "missing")["requires"] == ["present"]
+    assert _plan_entry(plan, "conf")["satisfied"] is None
+    assert _plan_entry(plan, "conf")["backend"] == "config"
+
+
+def test_plan_estimates_from_previous_runs():
+    items = _plan_items()
+    install.install(items, {"missing", "present"})
+    plan = install.build_plan(items, {"missing"})
+    assert _plan_entry(plan, "missing")["estimate_seconds"] is not None
+    assert _plan_entry(plan, "present")["estimate_seconds"] is None  # already satisfied
+
+
+def test_plan_download_size_from_cached_release(tmp_path):
+    releases = tmp_path / ".cache" / "devenv" / "releases.json"
+    releases.parent.mkdir(parents=True)
+    releases.write_text(json.dumps({"org/tool": {"etag": None, "fetched": 0, "release": {
+        "tag": "v1",
+        "assets": {"tool-linux": {"url": "https://example.invalid/x", "size": 1234, "sha256": None}},
+    }}}))
+    plan = install.build_plan(_plan_items(), {"tool"})
+    assert _plan_entry(plan, "tool")["backend"] == "github"
+    assert _plan_entry(plan, "tool")["download_bytes"] == 1234
+    assert plan["download_bytes"] == 1234
+
+
+def test_plan_json_output(capsys):
+    install.print_plan(install.build_plan(_plan_items(), {"conf"}), "json")
+    assert json.loads(capsys.readouterr().out)["items"][0]["id"] == "conf"
+
+
+def test_parse_args_plan_without_selection_plans_everything(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["install.py", "--plan", "json"])
+    assert install._parse_args(_named_items()) == {"long-name", "other"}
+    assert install._options.plan == "json"
+
+
+# ---------------------------------------------------------------------------
+# Probe
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def bin_dir(tmp_path, monkeypatch):
+    d = tmp_path / "bin"
+    d.mkdir()
+    monkeypatch.setenv("PATH", str(d))
+    return d
+
+
+def _make_exe(path):
+    path.write_text("#!/bin/sh\n")
+    path.chmod(0o755)
+
+
+def test_probe_finds_executable_on_path(bin_dir):
+    _make_exe(bin_dir / "tool")
+    assert install.is_installed("tool")
+    assert not install.is_installed("absent")
+
+
+def test_probe_rejects_broken_binaries(bin_dir):
+    (bin_dir / "dangling").symlink_to(bin_dir / "nowhere")
+    (bin_dir / "not-exec").write_text("data")
+    assert not install.is_installed("dangling")
+    assert not install.is_installed("not-exec")
+
+
+def test_probe_snapshot_until_invalidated(bin_dir):
+    assert not install.is_installed("late")
+    _make_exe(bin_dir / "late")
+    assert not install.is_installed("late")  # directory listing is cached
+    install._probe.invalidate()
+    assert install.is_installed("late")
+
+
+def test_probe_follows_path_changes(bin_dir, tmp_path, monkeypatch):
+    extra = tmp_path / "extra"
+    extra.mkdir()
+    _make_exe(extra / "tool")
+    assert not install.is_installed("tool")
+    monkeypatch.setenv("PATH", f"{extra}:{bin_dir}")
+    assert install.is_installed("tool")
+
+
+def test_probe_invalidated_after_item_installs(bin_dir):
+    item = install.InstallItem("tool", lambda: _make_exe(bin_dir / "tool"), bin="tool")
+    assert not install.is_installed("tool")
+    install.install([item], {"tool"})
+    assert install.is_installed("tool")
+
+
+def test_probe_queries_each_source_once(bin_dir, monkeypatch):
+    _make_exe(bin_dir / "cargo")
+    _make_exe(bin_dir / "uv")
+    calls = []
+    outputs = {
+        "dpkg-query": "htop\tinstalled\t3.3.0-4\nold\tconfig-files\t1.0\n",
+        "cargo": "zellij v0.41.2:\n    zellij\nmarkdown-oxide v0.25.0 (https://github.com/x/y#abc):\n    markdown-oxide\n",
+        "uv": "ruff v0.6.9\n- ruff\n",
+    }
+
+    def capture(argv):
+        calls.append(argv[0])
+        return outputs[argv[0]]
+
+    monkeypatch.setattr(install, "_capture", capture)
+    for _ in range(3):
+        assert install._dpkg_installed(["htop", "old"]) == {"htop"}
+        assert install._probe.cargo() == {"zellij": "0.41.2", "markdown-oxide": "0.25.0"}
+        assert install._probe.uv() == {"ruff": "0.6.9"}
+    assert sorted(calls) == ["cargo", "dpkg-query", "uv"]
+    assert install._probe.version(install.InstallItem("ruff", None, uv="ruff")) == "0.6.9"
+
+
+
+def test_probe_checks_rustup_proxies_against_components(tmp_path, monkeypatch):
+    cargo_bin = tmp_path / ".cargo" / "bin"
+    cargo_bin.mkdir(parents=True)
+    (cargo_bin / "rustup").write_text('#!/bin/sh\n/bin/cat "$HOME/components"\n')
+    (cargo_bin / "rustup").chmod(0o755)
+    for proxy in ("rustc", "rust-analyzer", "rustdoc"):
+        os.link(cargo_bin / "rustup", cargo_bin / proxy)
+    (tmp_path / "components").write_text("cargo-x86_64-unknown-linux-gnu\nrustc-x86_64-unknown-linux-gnu\n")
+    monkeypatch.setenv("PATH", str(cargo_bin))
+    assert install.is_installed("rustc")
+    assert install.is_installed("rustdoc")
+    assert not install.is_installed("rust-analyzer")  # proxy without the component
+
+    (tmp_path / "components").write_text("rust-analyzer-x86_64-unknown-linux-gnu\nrustc-x86_64-unknown-linux-gnu\n")
+    install._probe.invalidate(install.InstallItem("rust-analyzer", None, backend="rustup"))
+    assert install.is_installed("rust-analyzer")
+
+
+def test_probe_checks_cargo_bin_against_cargo_list(tmp_path, monkeypatch):
+    cargo_bin = tmp_path / ".cargo" / "bin"
+    cargo_bin.mkdir(parents=True)
+    for name in ("cargo", "zellij", "stray", "bundled"):
+        _make_exe(cargo_bin / name)
+    (cargo_bin / "cargo").write_text("#!/bin/sh\nprintf 'zellij v0.41.2:\\n    zellij\\n'\n")
+    st = (cargo_bin / "bundled").stat()
+    install._write_json(install._manifest_path(), {"items": {"b": {"bin": [str(cargo_bin / "bundled"), st.st_size, st.st_mtime_ns]}}})
+    monkeypatch.setenv("PATH", str(cargo_bin))
+    assert install.is_installed("zellij")
+    assert install.is_installed("bundled")  # copied from a bundle and recorded, untracked by cargo
+    assert not install.is_installed("stray")
+
+
+def test_probe_checks_uv_tools_against_uv_list(tmp_path, bin_dir, monkeypatch):
+    monkeypatch.delenv("UV_TOOL_DIR", raising=False)
+    monkeypatch.delenv("XDG_DATA_HOME", raising=False)
+    (bin_dir / "uv").write_text("#!/bin/sh\necho 'ruff v0.6.9'\n")
+    (bin_dir / "uv").chmod(0o755)
+    for tool in ("ruff", "pyright"):
+        target = tmp_path / ".local/share/uv/tools" / tool / "bin" / tool
+        target.parent.mkdir(parents=True)
+        _make_exe(target)
+        (bin_dir / tool).symlink_to(target)
+    assert install.is_installed("ruff")
+    assert not install.is_installed("pyright")  # tool environment left behind by a removed tool
+
+
+# ---------------------------------------------------------------------------
+# timing and --trace
+# ---------------------------------------------------------------------------
+
+def test_task_and_command_spans(capsys):
+    with install.task("Outer"):
+        with install.task("Inner"):
+            assert install._run_stream("true") == 0
+    spans = {sp["name"]: sp for sp in install._spans}
+    assert spans["Outer"]["cat"] == "task"
+    assert spans["true"]["cat"] == "cmd"
+    assert spans["true"]["path"] == "Outer / Inner"
+    assert spans["Outer"]["start"] <= spans["Inner"]["start"] <= spans["true"]["start"]
+    assert spans["Outer"]["dur"] >= spans["Inner"]["dur"] >= spans["true"]["dur"]
+
+
+def test_span_recorded_when_task_fails(capsys):
+    with pytest.raises(SystemExit):
+        with install.task("Broken"):
+            install.run("false")
+    assert {sp["name"] for sp in install._spans} == {"Broken", "false"}
+
+
+def test_timing_summary_sorted_by_duration(capsys):
+    install._spans.extend([
+        {"name": "fast", "cat": "cmd", "start": 0.0, "dur": 0.5, "tid": 1, "path": "", "item": None},
+        {"name": "slow", "cat": "task", "start": 0.0, "dur": 9.0, "tid": 1, "path": "", "item": None},
+    ])
+    install.print_timing_summary()
+    out = capsys.readouterr().out
+    assert out.index("slow") < out.index("fast")
+
+
+def test_trace_is_chrome_trace_json(tmp_path, capsys):
+    def item_installer():
+        with install.task("Work"):
+            install._run_stream("true")
+
+    items = [install.InstallItem(i, item_installer) for i in ("a", "b")]
+    install.install(items, {"a", "b"}, jobs=2)
+    out = tmp_path / "trace.json"
+    install.write_trace(out)
+    events = json.loads(out.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert {e["args"]["item"] for e in spans if e["name"] == "true"} == {"a", "b"}
+    assert all(e["ts"] >= 0 and e["dur"] >= 0 for e in spans)
+    named = {e["tid"] for e in events if e["ph"] == "M" and e["name"] == "thread_name"}
+    assert {e["tid"] for e in spans} <= named
+
+
+# ---------------------------------------------------------------------------
+# live renderer
+# ---------------------------------------------------------------------------
+
+class _FakeTerminal(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def isatty(self):
+        return True
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def test_renderer_rate_limits_chatty_output(tmp_path, monkeypatch):
+    term = _FakeTerminal()
+    monkeypatch.setattr(install, "_renderer", install.LiveRenderer(hz=20, stream=term))
+    install._events.start(install.LogFileSink(tmp_path / "install.log"))
+    install._run_stream(f"{sys.executable} -c \"for i in range(5000): print(i)\"")
+    install._events.close()
+    assert len((tmp_path / "install.log").read_text().splitlines()) == 5001  # command + output
+    assert term.writes < 100
+    assert "\n4999\n" not in term.getvalue()  # region cleared when the command finished
+
+
+def test_renderer_shows_concurrent_tasks_and_clears_for_log(monkeypatch, capsys):
+    term = _FakeTerminal()
+    renderer = install.LiveRenderer(stream=term)
+    monkeypatch.setattr(install, "_renderer", renderer)
+    renderer.thread = threading.current_thread()  # no repaint thread; paint by hand
+    renderer.update(1, "[a] building\x1b[1m a\x1b[0m")
+    renderer.update(2, "[b] 10%\r[b] 90%")
+    renderer.paint()
+    assert term.getvalue() == "[a] building a\n[b] 90%\n"
+    install.log("next step")
+    assert term.getvalue().endswith("\033[2F\033[J")
+    assert renderer.dirty
+
+
+def test_renderer_without_terminal_prints_every_line(capsys):
+    install._run_stream("echo one; echo two >&2")
+    assert capsys.readouterr().out.splitlines()[1:] == ["one", "two"]
+
+
+def test_renderer_without_terminal_prints_every_line_of_parallel_items(capsys):
+    install._local.item = "a"
+    install._run_stream("echo one; echo two")
+    assert capsys.readouterr().out.splitlines()[1:] == ["[a] one", "[a] two"]
+
+
+# ---------------------------------------------------------------------------
+# event log
+# ---------------------------------------------------------------------------
+
+def test_event_log_writes_plain_log_and_jsonl(tmp_path, capsys):
+    install._events.start(install.LogFileSink(tmp_path / "install.log"), install.JsonlSink(tmp_path / "install.jsonl"))
+    install._local.item = "rust"
+    with install.task("Rust"):
+        install.warn("careful")
+        install._run_stream("echo \"$(printf '\\033[1m')hi\"; exit 2")
+    install._events.close()
+
+    log_lines = (tmp_path / "install.log").read_text().splitlines()
+    assert log_lines[0] == "[rust] ▶ Rust"
+    assert "  [rust] WARNING: careful" in log_lines
+    assert log_lines[-1] == "  [rust] hi"
+
+    events = [json.loads(line) for line in (tmp_path / "install.jsonl").read_text().splitlines()]
+    assert [e["kind"] for e in events] == ["task", "warn", "cmd", "output", "exit", "task_end"]
+    assert all(e["item"] == "rust" and e["ts"] > 0 for e in events)
+    assert events[3]["path"] == ["Rust"] and events[3]["text"] == "hi"
+    assert events[4]["rc"] == 2 and events[4]["dur"] >= 0
+    assert events[5]["ok"] is True
+    assert "careful" in capsys.readouterr().out
+
+
+def test_event_log_does_not_block_emitters_and_keeps_order():
+    class SlowSink:
+        def __init__(self):
+            self.seen = []
+
+        def write(self, event):
+            self.seen.append(event["text"])
+
+        def flush(self):
+            time.sleep(0.05)
+
+    sink = SlowSink()
+    install._events.sinks = [sink]
+    install._events.start()
+    start = time.monotonic()
+    for i in range(2000):
+        install.log(str(i))
+    assert time.monotonic() - start < 0.5
+    install._events.flush()
+    assert sink.seen == [str(i) for i in range(2000)]
+
+
+def test_failed_task_end_event(tmp_path):
+    install._events.start(install.JsonlSink(tmp_path / "install.jsonl"))
+    with pytest.raises(SystemExit):
+        with install.task("Broken"):
+            install.run("false")
+    install._events.close()
+    last = json.loads((tmp_path / "install.jsonl").read_text().splitlines()[-1])
+    assert last["kind"] == "task_end" and last["ok"] is False
+
+
+# ---------------------------------------------------------------------------
+# privileged helper
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def helper():
+    """The helper protocol, run as the current user instead of through sudo."""
+    h = install.SudoHelper(launcher=[])
+    assert h.start()
+    yield h
+    h.close(timeout=5)
+
+
+def test_helper_streams_output_and_exit_code(helper):
+    job = helper.open("echo one; echo two >&2; exit 3")
+    assert list(job.stdout) == ["one\n", "two\n"]
+    assert job.wait() == 3
+    assert helper.jobs == {}
+
+
+def test_helper_multiplexes_parallel_commands(helper):
+    start = time.monotonic()
+    jobs = [helper.open(f"sleep 0.3; echo {i}") for i in range(4)]
+    assert [list(job.stdout) for job in jobs] == [[f"{i}\n"] for i in range(4)]
+    assert all(job.wait() == 0 for job in jobs)
+    assert time.monotonic() - start < 1.0  # ran concurrently, not one after another
+
+
+def test_helper_runs_in_one_process(helper):
+    pids = {list(helper.open("echo $PPID").stdout)[0] for _ in range(3)}
+    assert len(pids) == 1
+
+
+def test_helper_close_waits_for_running_commands(helper, tmp_path):
+    marker = tmp_path / "done"
+    job = helper.open(f"sleep 0.2; touch {marker}")
+    helper.close(timeout=5)
+    assert marker.exists() and job.wait() == 0
+    assert helper.proc.returncode == 0
+
+
+def test_helper_password_not_in_argv(monkeypatch):
+    launched = []
+
+    class FakePopen:
+        def __init__(self, argv, **kwargs):
+            launched.append(argv)
+            self.stdin = io.StringIO()
+            self.stdout = io.StringIO("")  # helper never becomes ready
+
+        def wait(self):
+            return 1
+
+    monkeypatch.setattr(install.os, "geteuid", lambda: 1000)
+    monkeypatch.setattr(install.subprocess, "Popen", FakePopen)
+    monkeypatch.setattr(install, "_password", "hunter2")
+    monkeypatch.setattr(install, "_helper", None)
+    monkeypatch.setattr(install, "_helper_failed", False)
+    assert install._sudo_helper() is None  # falls back to sudo per command
+    assert launched and all("hunter2" not in arg for arg in launched[0])
+
+
+# ---------------------------------------------------------------------------
+# offline bundle
+# ---------------------------------------------------------------------------
+
+_FAKE_BUNDLE_TOOLS = {
+    # cargo binstall --no-confirm --no-track --install-path DIR CRATE
+    "cargo": """
+        while [ $# -gt 0 ]; do
+            [ "$1" = --install-path ] && dir=$2
+            crate=$1; shift
+        done
+        /bin/mkdir -p "$dir"
+        printf '#!/bin/sh\necho %s\n' "$crate" > "$dir/$crate-bin"
+        /bin/chmod +x "$dir/$crate-bin"
+    """,
+    "cargo-binstall": "",
+    # curl https://sh.rustup.rs | CARGO_HOME=... RUSTUP_HOME=... sh -s -- -y --no-modify-path -c COMPONENT
+    "curl": '/bin/cat "${0%/*}/rustup-init"',
+    "rustup-init": r"""
+        while [ $# -gt 0 ]; do [ "$1" = -c ] && comps="$comps$2\n"; shift; done
+        /bin/mkdir -p "$CARGO_HOME/bin" "$RUSTUP_HOME/toolchains/stable"
+        printf "$comps" > "$RUSTUP_HOME/toolchains/stable/components"
+        printf '#!/bin/sh\n/bin/cat "${RUSTUP_HOME:-$HOME/.rustup}/toolchains/stable/components"\n' > "$CARGO_HOME/bin/rustup"
+        /bin/chmod +x "$CARGO_HOME/bin/rustup"
+        for proxy in rustc rust-analyzer; do /bin/ln "$CARGO_HOME/bin/rustup" "$CARGO_HOME/bin/$proxy"; done
+        echo 'export PATH="/staging/cargo/bin:$PATH"' > "$CARGO_HOME/env"
+    """,
+    "sh": 'exec /bin/sh "$@"',
+    "apt-cache": "printf 'pkg-a\n  Depends: libfoo\n  Depends: <virtual>\nlibfoo\n<virtual>\n'",
+    "apt-get": """
+        [ "$1" = download ] || exit 1
+        shift 2
+        for p; do echo "deb $p" > "${p}_1.0_amd64.deb"; done
+    """,
+    "dpkg-deb": """
+        name=${2##*/}
+        printf 'Package: %s\nVersion: 1.0\n' "${name%%_*}"
+    """,
+    # uv pip install --quiet --target DIR SPEC  |  uv tool install --offline SPEC
+    "uv": """
+        echo "$UV_CACHE_DIR $*" >> "$HOME/uv.log"
+        if [ "$1" = pip ]; then
+            while [ $# -gt 1 ]; do [ "$1" = --target ] && target=$2; shift; done
+            /bin/mkdir -p "$target/$1-9.9.dist-info" "$UV_CACHE_DIR/wheels"
+            echo wheel > "$UV_CACHE_DIR/wheels/$1-9.9.whl"
+        fi
+    """,
+}
+
+
+_BUNDLE_IDS = {"pkg", "tool", "rust", "rust-analyzer", "cargo-binstall", "zz", "py"}
+
+
+def _bundle_items():
+    def install_tool():
+        install._install_file(install.fetch_release_asset("org/tool", "^tool$"), Path.home() / ".local/bin/tool")
+
+    return [
+        install.InstallItem("pkg", lambda: install.apt_install("pkg-a"), apt=["pkg-a"]),
+        install.InstallItem("tool", install_tool, bin="tool", github="org/tool", asset="^tool$"),
+        install.InstallItem("rust", install.install_rust, bin="rustc", apt=["build-essential"], backend="rustup"),
+        install.InstallItem("rust-analyzer", install.install_rust_analyzer, bin="rust-analyzer", requires=["rust"], backend="rustup"),
+        install.InstallItem("cargo-binstall", install.install_cargo_binstall, bin="cargo-binstall-bin", requires=["rust"], backend="script"),
+        install.InstallItem("zz", lambda: install.binstall("crate-zz"), bin="crate-zz-bin", crate="crate-zz", requires=["cargo-binstall"]),
+        install.InstallItem("py", lambda: install.uv_tool_install("py"), uv="py"),
+    ]
+
+
+@pytest.fixture
+def built_bundle(tmp_path, bin_dir, fake_apt, fake_release, http_server, capsys):
+    """Build a bundle of _bundle_items() with fake tools, then wipe the caches like a fresh host."""
+    for name, body in _FAKE_BUNDLE_TOOLS.items():
+        (bin_dir / name).write_text(f"#!/bin/sh\n{body}\n")
+        (bin_dir / name).chmod(0o755)
+    fake_release("v1", "tool", b"tool-binary")
+    out = tmp_path / "out" / "devenv.tar.gz"
+    install.build_bundle(_bundle_items(), _BUNDLE_IDS, out)
+    install.shutil.rmtree(tmp_path / ".cache")
+    install._probe.invalidate()
+    install._apt_state.updated = False
+    http_server.files.clear()
+    http_server.requests.clear()
+    return out
+
+
+def test_bundle_contents(built_bundle, capsys):
+    manifest = install.read_bundle_manifest(built_bundle)
+    assert manifest["items"] == ["pkg", "tool", "rust", "rust-analyzer", "cargo-binstall", "zz", "py"]
+    assert manifest["crates"] == {"cargo-binstall": ["cargo-binstall-bin"], "crate-zz": ["crate-zz-bin"]}
+    assert manifest["uv"] == {"py": "9.9"}
+    assert manifest["rust"] == {"components": ["rust-analyzer"]}
+    with tarfile.open(built_bundle) as tar:
+        names = set(tar.getnames())
+        packages = tar.extractfile("./apt/Packages").read().decode()
+    assert {"./apt/libfoo_1.0_amd64.deb", "./apt/pkg-a_1.0_amd64.deb", "./bin/uv", "./rust/cargo/bin/rustc"} <= names
+    assert "./rust/cargo/env" not in names
+    assert "Package: pkg-a\nVersion: 1.0\nFilename: ./pkg-a_1.0_amd64.deb" in packages
+
+
+def test_bundle_installs_without_network(built_bundle, tmp_path, bin_dir, fake_apt, http_server, monkeypatch, capsys):
+    monkeypatch.setattr(install, "GITHUB_API", http_server.url("/api"))
+    monkeypatch.setattr(install, "_bundle", install.open_bundle(built_bundle))
+    monkeypatch.setenv("PATH", os.environ["PATH"])  # install_rust extends it; restore afterwards
+    (bin_dir / "cargo-binstall").unlink()  # the offline host has none yet
+    items = _bundle_items()
+    assert install.bundle_selection(set(_BUNDLE_IDS)) == _BUNDLE_IDS
+    install.install(items, _BUNDLE_IDS)
+
+    assert http_server.requests == []
+    assert (tmp_path / ".local/bin/tool").read_bytes() == b"tool-binary"
+    assert os.access(tmp_path / ".cargo/bin/crate-zz-bin", os.X_OK)
+    assert os.access(tmp_path / ".cargo/bin/cargo-binstall-bin", os.X_OK)
+    monkeypatch.setattr(install, "_probe", install.Probe())  # a later run
+    assert install.is_installed("crate-zz-bin")  # untracked by cargo, but recorded in the install manifest
+    cargo_bin = tmp_path / ".cargo/bin"
+    assert (cargo_bin / "rustc").stat().st_ino == (cargo_bin / "rustup").stat().st_ino  # proxies stay linked
+    assert (tmp_path / ".rustup/toolchains/stable/components").read_text() == "rust-analyzer\n"
+    assert "Rust toolchain installed from the bundle (rust-analyzer)" in capsys.readouterr().out
+    root = tmp_path / ".cache/devenv/bundle"
+    sources = f"-o Dir::Etc::SourceList={root}/apt/sources.list"
+    assert any("apt-get update" in cmd and sources in cmd for cmd in fake_apt["commands"])
+    assert any("apt-get install" in cmd and sources in cmd and cmd.endswith("pkg-a build-essential") for cmd in fake_apt["commands"])
+    assert f"{root}/uv tool install --offline py==9.9" in (tmp_path / "uv.log").read_text().splitlines()
+
+
+def test_bundle_rejects_corrupt_archive(built_bundle, tmp_path, capsys):
+    unpacked = tmp_path / "unpacked"
+    with tarfile.open(built_bundle) as tar:
+        tar.extractall(unpacked, filter="data")
+    (unpacked / "artifacts" / hashlib.sha256(b"tool-binary").hexdigest()).write_bytes(b"evil")
+    with tarfile.open(built_bundle, "w:gz") as tar:
+        tar.add(unpacked, arcname=".")
+    with pytest.raises(SystemExit):
+        install.open_bundle(built_bundle)
+    assert "is corrupt: artifacts/" in capsys.readouterr().out
+
+
+def test_bundle_selection_rejects_unbundled_items(built_bundle, monkeypatch, capsys):
+    monkeypatch.setattr(install, "_bundle", install.open_bundle(built_bundle))
+    with pytest.raises(SystemExit):
+        install.bundle_selection({"pkg", "other"})
+    assert "not in the bundle: other" in capsys.readouterr().out
+
+
+def test_bundle_out_rejects_unknown_script_items(tmp_path, capsys):
+    items = [install.InstallItem("scripted", lambda: None, backend="script")]
+    with pytest.raises(SystemExit):
+        install.build_bundle(items, {"scripted"}, tmp_path / "b.tar.gz")
+    assert "no way to bundle script-installed scripted" in capsys.readouterr().out
+
+
+def test_bundle_in_flag_selects_bundled_items(built_bundle, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["install.py", "--bundle-in", str(built_bundle)])
+    assert install._parse_args(_bundle_items()) == _BUNDLE_IDS
+
+
+# ---------------------------------------------------------------------------
+# fleet mode
+# ---------------------------------------------------------------------------
+
+def test_parse_target_specs():
+    assert install.parse_target("ssh:dev1") == install.Target("ssh", "dev1")
+    assert install.parse_target("dev2") == install.Target("ssh", "dev2")
+    assert install.parse_target("incus:c1").name == "incus:c1"
+    with pytest.raises(install.argparse.ArgumentTypeError):
+        install.parse_target("docker:x")
+
+
+def test_fleet_pushes_and_runs_on_every_target(tmp_path, capsys):
+    targets = [install.Target("local", str(tmp_path / f"t{i}")) for i in range(3)]
+    command = 'cd "$HOME/.cache/devenv/setup" && test -f install.py && test -d resources && echo "ran in $PWD"'
+    results = install.run_fleet(targets, command, jobs=2)
+    assert [r["ok"] for r in results] == [True, True, True]
+    for target in targets:
+        assert (Path(target.address) / install._FLEET_DIR / "install.py").exists()
+    assert f"[local:{targets[0].address}] ran in" in capsys.readouterr().out
+
+
+def test_fleet_reports_failures_per_target(tmp_path, capsys):
+    good = install.Target("local", str(tmp_path / "good"))
+    bad = install.Target("local", str(tmp_path / "bad"))
+    (tmp_path / "bad").mkdir()
+    (tmp_path / "bad" / "fail").write_text("")
+    results = install.run_fleet([good, bad], 'test ! -f "$HOME/fail"', jobs=2)
+    assert [(r["ok"], r["stage"], r["rc"]) for r in results] == [(True, "install", 0), (False, "install", 1)]
+    install.print_fleet_summary(results)
+    out = capsys.readouterr().out
+    assert "FAILED (install, exit 1)" in out
+    assert "1 passed, 1 failed, 2 target(s)" in out
+
+
+def test_fleet_menu_does_not_prefetch(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["install.py", "--targets", "local:/tmp/x"])
+    monkeypatch.setattr(sys, "stdin", _FakeTerminal())
+    monkeypatch.setattr(install, "_require_menu_deps", lambda: None)
+    monkeypatch.setattr(install, "Prefetcher", lambda items: pytest.fail("fleet mode prefetched locally"))
+    monkeypatch.setattr(install, "run_selection_menu", lambda graph, on_change=None: None)
+    with pytest.raises(SystemExit):
+        install.main()
+    assert "Aborted." in capsys.readouterr().out
+
+
+def test_fleet_runs_targets_concurrently(tmp_path, capsys):
+    targets = [install.Target("local", str(tmp_path / f"t{i}")) for i in range(4)]
+    start = time.monotonic()
+    install.run_fleet(targets, "sleep 0.4", jobs=4)
+    assert time.monotonic() - start < 1.2
+
+
+def test_fleet_command_forwards_selection(monkeypatch):
+    monkeypatch.setattr(install._options, "jobs", 2)
+    items = [install.InstallItem(i, lambda: None) for i in ("a", "b", "c")]
+    cmd = install.fleet_command({"c", "a"}, items)
+    assert cmd.endswith("./bootstrap_inst.sh --only a c --jobs 2")
+
+
+# ---------------------------------------------------------------------------
+# command transcripts
+# ---------------------------------------------------------------------------
+
+def _write_transcript(path, *entries):
+    path.write_text("".join(json.dumps(e) + "\n" for e in entries))
+    return path
+
+
+def test_record_then_replay_roundtrip(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "t.jsonl"
+    monkeypatch.setattr(install, "_transcript", install.Transcript(path))
+    assert install._run_stream("echo one; echo two; exit 3") == 3
+    assert install._capture([sys.executable, "-c", "print('q')"]) == "q\n"
+    install._transcript.close()
+    recorded = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [e["kind"] for e in recorded] == ["run", "capture"]
+    assert [line for _, line in recorded[0]["out"]] == ["one\n", "two\n"]
+    capsys.readouterr()
+
+    monkeypatch.setattr(install, "_transcript", install.Transcript(path, replaying=True, scale=0))
+    monkeypatch.setattr(install.subprocess, "Popen", None)  # nothing may really run
+    assert install._run_stream("echo one; echo two; exit 3") == 3
+    assert "two" in capsys.readouterr().out
+    assert install._capture([sys.executable, "-c", "print('q')"]) == "q\n"
+    assert install._transcript.missing == []
+
+
+def test_replay_sudo_kinds_and_missing(tmp_path, monkeypatch, capsys):
+    path = _write_transcript(
+        tmp_path / "t.jsonl",
+        {"kind": "sudo", "cmd": "apt-get install -y x", "rc": 0, "dur": 0.0, "out": [[0.0, "done\n"]]},
+        {"kind": "sudo_ok", "cmd": "test -d /x", "rc": 1, "dur": 0.0, "out": []},
+    )
+    monkeypatch.setattr(install, "_transcript", install.Transcript(path, replaying=True))
+    install.sudo("apt-get install -y x")
+    assert not install.sudo_ok("test -d /x")
+    install.run("never recorded")
+    assert install._transcript.missing == ["never recorded"]
+
+
+def test_replay_consumes_in_order_then_reuses_last(tmp_path, monkeypatch, capsys):
+    path = _write_transcript(
+        tmp_path / "t.jsonl",
+        {"kind": "run", "cmd": "c", "rc": 1, "dur": 0.0, "out": []},
+        {"kind": "run", "cmd": "c", "rc": 0, "dur": 0.0, "out": []},
+    )
+    monkeypatch.setattr(install, "_transcript", install.Transcript(path, replaying=True))
+    assert [install._run_stream("c") for _ in range(3)] == [1, 0, 0]
+
+
+def test_replay_scales_recorded_delays(tmp_path, monkeypatch, capsys):
+    path = _write_transcript(
+        tmp_path / "t.jsonl", {"kind": "run", "cmd": "slow", "rc": 0, "dur": 2.0, "out": [[1.0, "x\n"]]},
+    )
+    monkeypatch.setattr(install, "_transcript", install.Transcript(path, replaying=True, scale=0.05))
+    start = time.monotonic()
+    install.run("slow")
+    assert 0.09 <= time.monotonic() - start < 1.0
+
+
+# ---------------------------------------------------------------------------
+# checkpoint journal and --resume
+# ---------------------------------------------------------------------------
+
+def _journal_items(calls, fail=()):
+    def installer(item_id):
+        def run():
+            with install.task(f"build {item_id}"):
+                if item_id in fail:
+                    sys.exit(1)
+                calls.append(item_id)
+        return run
+
+    return [
+        install.InstallItem("a", installer("a")),
+        install.InstallItem("b", installer("b"), requires=["a"]),
+        install.InstallItem("c", installer("c")),
+    ]
+
+
+def _read_journal(tmp_path):
+    return json.loads((tmp_path / ".local/state/devenv/journal.json").read_text())
+
+
+def test_journal_records_items_steps_and_failure(tmp_path, capsys):
+    calls = []
+    install._journal.begin({"a", "b", "c"}, resume=False)
+    with pytest.raises(SystemExit):
+        install.install(_journal_items(calls, fail={"b"}), {"a", "b", "c"})
+    install._journal.end(ok=False)
+    journal = _read_journal(tmp_path)
+    assert journal["status"] == "failed"
+    assert journal["selection"] == ["a", "b", "c"]
+    assert journal["items"] == ["a"]
+    assert journal["steps"] == ["build a"]
+    assert journal["failed"] == {"item": None, "step": "build b"}
+
+
+def test_resume_skips_items_done_before(tmp_path, monkeypatch, capsys):
+    calls = []
+    install._journal.begin({"a", "b", "c"}, resume=False)
+    with pytest.raises(SystemExit):
+        install.install(_journal_items(calls, fail={"b"}), {"a", "b", "c"}, jobs=2)
+    install._journal.end(ok=False)
+    (tmp_path / ".local/state/devenv/manifest.json").unlink()  # only the journal may skip "a"
+
+    monkeypatch.setattr(install, "_journal", install.Journal())
+    install._journal.begin({"a", "b", "c"}, resume=True)
+    calls.clear()
+    install.install(_journal_items(calls), {"a", "b", "c"})
+    install._journal.end(ok=True)
+    assert "a" not in calls and "b" in calls
+    assert "done before the interruption, skipping: a" in capsys.readouterr().out
+    assert _read_journal(tmp_path)["status"] == "complete"
+    assert install.Journal.unfinished() is None
+
+
+def test_resume_skips_completed_apt_update(fake_apt, monkeypatch, capsys):
+    install._journal.resumed["steps"] = ["Dev environment setup / apt update"]
+    install._options.refresh_apt = True
+    install.apt_update()
+    assert not any("apt-get update" in cmd for cmd in fake_apt["commands"])
+
+
+def test_resume_skipping_rust_keeps_cargo_on_path(tmp_path, monkeypatch, capsys):
+    cargo_bin = tmp_path / ".cargo" / "bin"
+    cargo_bin.mkdir(parents=True)
+    for name in ("cargo", "cargo-binstall"):
+        (cargo_bin / name).write_text(f'#!/bin/sh\necho "{name} $*" >> "$HOME/cargo.log"\n')
+        (cargo_bin / name).chmod(0o755)
+    with (cargo_bin / "cargo").open("a") as f:  # cargo-binstall is tracked, as its installer leaves it
+        f.write('if [ "$1" = install ]; then printf "cargo-binstall v1.0.0:\\n    cargo-binstall\\n"; fi\n')
+    monkeypatch.setenv("PATH", os.environ["PATH"])  # install() extends it; restore afterwards
+    items = [
+        install.InstallItem("rust", lambda: pytest.fail("resumed run re-ran rust"), bin="rustc"),
+        install.InstallItem("zellij", install.install_zellij, bin="zellij", requires=["rust"], crate="zellij"),
+    ]
+    install._journal.resumed["items"] = ["rust"]
+    install.install(items, {"rust", "zellij"})
+    log = (tmp_path / "cargo.log").read_text().splitlines()
+    assert [line for line in log if "binstall" in line] == ["cargo binstall --no-confirm zellij"]
+
+
+def test_resume_flag_reuses_journal_selection(tmp_path, monkeypatch):
+    items = _journal_items([])
+    install._journal.begin({"b", "c"}, resume=False)
+    monkeypatch.setattr(sys, "argv", ["install.py", "--resume"])
+    assert install._parse_args(items) == {"b", "c"}
+    assert install._options.resume
+
+    install._journal.end(ok=True)
+    with pytest.raises(SystemExit):
+        install._parse_args(items)
+
+
+def test_release_asset_resumes_partial_download(fake_release, http_server, tmp_path, capsys):
+    body = bytes(range(256)) * 64
+    path = fake_release("v1", "tool-linux", body)
+    http_server.drops[path] = [5000, 0, 0, 0]  # first attempt and every reconnect
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/tool", r"^tool-linux$")
+    store = tmp_path / ".cache" / "devenv" / "artifacts"
+    [partial] = store.glob(".partial-*")
+    assert partial.stat().st_size == 5000
+
+    blob = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    assert blob.read_bytes() == body
+    assert http_server.requests[-1][1]["Range"] == "bytes=5000-"
+    assert list(store.glob(".partial-*")) == []
+
+
+def test_release_asset_restarts_when_range_ignored(fake_release, http_server, tmp_path, capsys):
+    body = b"x" * 4000 + b"y" * 4000
+    path = fake_release("v1", "tool-linux", body)
+    http_server.drops[path] = [3000, 0, 0, 0]
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/tool", r"^tool-linux$")
+    http_server.ranges = False
+    blob = install.fetch_release_asset("org/tool", r"^tool-linux$")
+    assert blob.read_bytes() == body
+
+
+# ---------------------------------------------------------------------------
+# segmented downloads
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def segmented(monkeypatch):
+    """Fetch assets of 1 KiB and more in segments; returns a 100 400-byte body."""
+    monkeypatch.setattr(install, "_SEGMENT_MIN", 1024)
+    return bytes(range(251)) * 400
+
+
+def _ranges(http_server, path):
+    return [headers.get("Range") for p, headers in http_server.requests if p == path]
+
+
+def test_segmented_download_uses_parallel_ranges(fake_release, http_server, segmented, capsys):
+    path = fake_release("v1", "big", segmented)
+    blob = install.fetch_release_asset("org/big", "^big$")
+    assert blob.read_bytes() == segmented
+    ranges = _ranges(http_server, path)
+    assert ranges[0] == "bytes=0-0"  # probe
+    assert sorted(ranges[1:]) == ["bytes=0-25099", "bytes=25100-50199", "bytes=50200-75299", "bytes=75300-100399"]
+
+
+def test_segmented_download_reconnects_after_drops(fake_release, http_server, segmented, capsys):
+    path = fake_release("v1", "big", segmented)
+    http_server.drops[path] = [None, 1000, 7000, 20000, 3000]  # probe intact, then four drops
+    blob = install.fetch_release_asset("org/big", "^big$")
+    assert blob.read_bytes() == segmented
+    assert http_server.sent < 2 * len(segmented)  # reconnects continue, they do not restart
+    assert "reconnecting" in capsys.readouterr().out
+
+
+def test_segmented_download_resumes_next_run(fake_release, http_server, segmented, tmp_path, capsys):
+    path = fake_release("v1", "big", segmented)
+    http_server.drops[path] = [None] + [5000] * 16  # every segment request drops, on every attempt
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/big", "^big$")
+    store = tmp_path / ".cache" / "devenv" / "artifacts"
+    [state] = store.glob(".partial-*.segments")
+    assert sum(seg[2] for seg in json.loads(state.read_text())["segments"]) == 16 * 5000
+
+    sent = http_server.sent
+    blob = install.fetch_release_asset("org/big", "^big$")
+    assert blob.read_bytes() == segmented
+    assert http_server.sent - sent == len(segmented) - 16 * 5000
+    assert list(store.glob(".partial-*")) == []
+
+
+def test_segmented_download_falls_back_without_ranges(fake_release, http_server, segmented, capsys):
+    path = fake_release("v1", "big", segmented)
+    http_server.ranges = False
+    blob = install.fetch_release_asset("org/big", "^big$")
+    assert blob.read_bytes() == segmented
+    assert http_server.hits[path] == 2  # probe, then one full stream
+
+
+def test_segmented_download_checksum_mismatch_discards(fake_release, http_server, segmented, tmp_path, capsys):
+    fake_release("v1", "big", segmented, sha256="0" * 64)
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/big", "^big$")
+    store = tmp_path / ".cache" / "devenv" / "artifacts"
+    assert [p.name for p in store.iterdir()] == []
+
+
+def test_segmented_download_throttles_state_writes(fake_release, http_server, segmented, monkeypatch, capsys):
+    fake_release("v1", "big", segmented)
+    monkeypatch.setattr(install, "_CHECKPOINT_INTERVAL", 3600)
+    writes = []
+    write_json = install._write_json
+    monkeypatch.setattr(install, "_write_json", lambda path, data: (writes.append(path.name), write_json(path, data)))
+    install.fetch_release_asset("org/big", "^big$")
+    assert len([w for w in writes if w.endswith(".segments")]) == 2  # initial layout, final progress
+
+
+def test_download_stale_partial_on_every_attempt_fails_cleanly(fake_release, http_server, monkeypatch, capsys):
+    fake_release("v1", "tool", b"x" * 100)
+
+    def stale(url, tmp, cancel):
+        raise install.urllib.error.HTTPError(url, 416, "Range Not Satisfiable", {}, None)
+
+    monkeypatch.setattr(install, "_fetch_stream", stale)
+    with pytest.raises(SystemExit):
+        install.fetch_release_asset("org/tool", "^tool$")
+    assert "FAILED (HTTP Error 416: Range Not Satisfiable)" in capsys.readouterr().out
+
+
+# ---------------------------------------------------------------------------
+# install manifest
+# ---------------------------------------------------------------------------
+
+def _manifest_items(tmp_path, calls):
+    conf = tmp_path / "conf.txt"
+    conf.write_text("v1")
+
+    def installer(item_id):
+        return lambda: calls.append(item_id)
+
+    return [
+        install.InstallItem("base", installer("base"), inputs=[str(conf)]),
+        install.InstallItem("child", installer("child"), requires=["base"]),
+        install.InstallItem("other", installer("other")),
+    ], conf
+
+
+def test_manifest_skips_unchanged_rerun(tmp_path, capsys):
+    calls = []
+    items, _ = _manifest_items(tmp_path, calls)
+    install.install(items, {"base", "child", "other"})
+    assert calls == ["base", "child", "other"]
+    manifest = json.loads((tmp_path / ".local/state/devenv/manifest.json").read_text())
+    assert set(manifest["items"]) == {"base", "child", "other"}
+
+    calls.clear()
+    install.install(items, {"base", "child", "other"})
+    assert calls == []
+    assert "unchanged since last run, skipping: base, child, other" in capsys.readouterr().out
+
+
+def test_manifest_changed_input_reruns_subtree(tmp_path, capsys):
+    calls = []
+    items, conf = _manifest_items(tmp_path, calls)
+    install.install(items, {"base", "child", "other"})
+    conf.write_text("v2")
+    calls.clear()
+    install.install(items, {"base", "child", "other"})
+    assert calls == ["base", "child"]
+
+
+def test_manifest_replaced_binary_reruns(tmp_path, bin_dir, capsys):
+    calls = []
+    _make_exe(bin_dir / "tool")
+    items = [install.InstallItem("tool", lambda: calls.append("tool"), bin="tool")]
+    install.install(items, {"tool"})
+    (bin_dir / "tool").write_text("#!/bin/sh\n# upgraded\n")
+    install._probe.invalidate()
+    calls.clear()
+    install.install(items, {"tool"})
+    assert calls == ["tool"]
+
+
+def test_manifest_force_runs_everything(tmp_path, monkeypatch, capsys):
+    calls = []
+    items, _ = _manifest_items(tmp_path, calls)
+    install.install(items, {"base", "child", "other"})
+    monkeypatch.setattr(install._options, "force", True)
+    calls.clear()
+    install.install(items, {"base", "child", "other"})
+    assert calls == ["base", "child", "other"]
+
+
+def test_sudo_prompt_only_when_privileged_work_remains(fake_apt, capsys):
+    prompts = []
+    items = [
+        install.InstallItem("x", lambda: install.apt_install("pkg-x"), apt=["pkg-x"]),
+        install.InstallItem("conf", lambda: None),
+    ]
+    install.install(items, {"x", "conf"}, authenticate=lambda: prompts.append(1))
+    assert prompts == [1]
+    install._probe.invalidate()
+    install.install(items, {"conf"}, authenticate=lambda: prompts.append(1))
+    install.install(items, {"x"}, authenticate=lambda: prompts.append(1), jobs=2)
+    assert prompts == [1]  # conf needs no sudo; x is unchanged and installed
+
+
 # ---------------------------------------------------------------------------
 # InstallItem
 # ---------------------------------------------------------------------------
@@ -229,7 +2042,7 @@ def test_parent_field_alone_does_not_add_install_dependency():
         install.InstallItem("parent-item", noop),
         install.InstallItem("child-item", noop, parent="parent-item"),
     ]
-    selected = install.resolve_selection(items, {"child-item"})
+    selected = install.DepGraph(items).closure({"child-item"})
     assert "parent-item" not in selected
 
 
@@ -241,7 +2054,7 @@ def test_resolve_transitive_requires():
         install.InstallItem("b", noop, requires=["a"]),
         install.InstallItem("c", noop, requires=["b"]),
     ]
-    selected = install.resolve_selection(items, {"c"})
+    selected = install.DepGraph(items).closure({"c"})
     assert "a" in selected
     assert "b" in selected
     assert "c" in selected
@@ -296,6 +2109,21 @@ def test_parse_args_list_shows_id(monkeypatch, capsys):
     assert "foo" in out
 
 
+def test_list_without_rich_prints_plain_ids(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "rich", None)
+    install._print_item_list(_named_items())
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "ID" and "long-name" in out
+
+
+def test_menu_without_textual_exits_with_guidance(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "textual", None)
+    with pytest.raises(SystemExit) as exc:
+        install._require_menu_deps()
+    assert exc.value.code == 100
+    assert "--all" in capsys.readouterr().out
+
+
 def test_parse_args_all_returns_all_ids(monkeypatch):
     monkeypatch.setattr(sys, "argv", ["install.py", "--all"])
     result = install._parse_args(_named_items())
@@ -303,66 +2131,66 @@ def test_parse_args_all_returns_all_ids(monkeypatch):
 
 
 # ---------------------------------------------------------------------------
-# _collect_descendants / _collect_ancestors
+# _menu_index
 # ---------------------------------------------------------------------------
 
 def _simple_tree():
     """
-    Build children_of, parent_of, group_names for:
+    children_of for:
       [G]
         a
         [H]
           b
     """
-    children_of = {
+    return {
         None:  [("G", True)],
         "G":   [("a", False), ("H", True)],
         "H":   [("b", False)],
     }
-    parent_of = {"G": None, "a": "G", "H": "G", "b": "H"}
-    group_names = {"G", "H"}
-    return children_of, parent_of, group_names
 
 
-def test_collect_descendants_leaf_returns_empty():
-    children_of, parent_of, group_names = _simple_tree()
-    assert install._collect_descendants("b", children_of) == []
+def test_menu_index_rows_in_display_order():
+    menu = install._menu_index(_simple_tree())
+    assert menu.rows == [("__group_G__", "G", 0), ("a", "a", 1), ("__group_H__", "H", 1), ("b", "b", 2)]
+
+
+def test_menu_index_leaf_subtree_is_empty():
+    menu = install._menu_index(_simple_tree())
+    assert menu.subtree["b"] == ()
+    assert menu.subtree["a"] == ()
 
 
-def test_collect_descendants_item_with_no_children():
-    children_of, parent_of, group_names = _simple_tree()
-    assert install._collect_descendants("a", children_of) == []
+def test_menu_index_subtree_includes_direct_children():
+    menu = install._menu_index(_simple_tree())
+    assert menu.subtree["H"] == ("b",)
 
 
-def test_collect_descendants_group_includes_direct_children():
-    children_of, parent_of, group_names = _simple_tree()
-    result = install._collect_descendants("H", children_of)
-    assert "b" in result
+def test_menu_index_subtree_recurses_into_subgroups():
+    menu = install._menu_index(_simple_tree())
+    assert menu.subtree["G"] == ("a", "__group_H__", "b")
 
 
-def test_collect_descendants_recurses_into_subgroups():
-    children_of, parent_of, group_names = _simple_tree()
-    result = install._collect_descendants("G", children_of)
-    assert "a" in result
-    assert "__group_H__" in result
-    assert "b" in result
+def test_menu_index_root_has_no_ancestors():
+    menu = install._menu_index(_simple_tree())
+    assert menu.ancestors["G"] == ()
 
 
-def test_collect_ancestors_root_returns_empty():
-    children_of, parent_of, group_names = _simple_tree()
-    assert install._collect_ancestors("G", parent_of, group_names) == []
+def test_menu_index_ancestors_direct_child_of_group():
+    menu = install._menu_index(_simple_tree())
+    assert menu.ancestors["a"] == ("__group_G__",)
 
 
-def test_collect_ancestors_direct_child_of_group():
-    children_of, parent_of, group_names = _simple_tree()
-    result = install._collect_ancestors("a", parent_of, group_names)
-    assert result == ["__group_G__"]
+def test_menu_index_ancestors_deeply_nested():
+    menu = install._menu_index(_simple_tree())
+    assert menu.ancestors["b"] == ("__group_H__", "__group_G__")
 
 
-def test_collect_ancestors_deeply_nested():
-    children_of, parent_of, group_names = _simple_tree()
-    result = install._collect_ancestors("b", parent_of, group_names)
-    assert result == ["__group_H__", "__group_G__"]
+def test_menu_index_covers_registry():
+    graph = install.DepGraph(install._items(), install._groups())
+    menu = install._menu_index(graph.children)
+    assert len(menu.rows) == len(graph.items) + len(graph.groups)
+    assert menu.subtree["rust"] == ("rust-analyzer", "cargo-binstall")
+    assert menu.ancestors["htop"] == ("__group_Resource__", "__group_System__")
 
 
 # ---------------------------------------------------------------------------